@@ -0,0 +1,130 @@
+"""
+Benchmark for the staged ingestion pipeline against the sequential flow
+process_document used before (tag, then chunk, then embed every batch,
+then store).
+
+Voyage, Mistral and Postgres are replaced by local stand-ins that sleep
+for a fixed latency per request plus a cost per chunk, so the numbers
+show how much of the waiting the pipeline overlaps. Both modes embed the
+same batches with the same hash-derived vectors.
+
+Usage (from server/):
+    python benchmarks/ingestion_pipeline.py --words 300000 --embed-workers 2 --store-workers 2
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+# Every API call is replaced by a stand-in; the clients only need a key to be constructed
+os.environ.setdefault("MISTRAL_API_KEY", "unused")
+
+from services.chunking import iter_chunks  # noqa: E402
+from services.embedding import FakeEmbeddingBackend  # noqa: E402
+from services.ingestion_pipeline import IngestionPipeline  # noqa: E402
+
+
+class StandIns:
+    """Latency models for the embedding API, the LLM tagging call and batch inserts."""
+
+    def __init__(self, args):
+        self.args = args
+        self.backend = FakeEmbeddingBackend(dimension=args.dim)
+        self.next_id = 0
+
+    def embed(self, batch):
+        time.sleep(self.args.embed_latency + self.args.embed_per_chunk * len(batch))
+        vectors = self.backend.embed([chunk["chunkText"] for chunk in batch], "stand-in", "document")
+        for chunk, vector in zip(batch, vectors):
+            chunk["embeddingData"] = vector
+        return batch
+
+    def store(self, batch):
+        time.sleep(self.args.store_latency + self.args.store_per_chunk * len(batch))
+        rows = []
+        for chunk in batch:
+            self.next_id += 1
+            rows.append({"chunkId": str(self.next_id), "chunkIndex": chunk["chunkIndex"], "documentId": chunk["documentId"]})
+        return {"results": rows}
+
+    def tag(self):
+        time.sleep(self.args.tag_latency)
+        return {"main_topic": "benchmark"}
+
+
+def make_text(words, seed):
+    rng = random.Random(seed)
+    vocabulary = [f"word{i}" for i in range(5000)]
+    return " ".join(rng.choice(vocabulary) for _ in range(words))
+
+
+def chunk_dicts(text):
+    for chunk in iter_chunks([text], 1000, 100):
+        yield {"chunkIndex": chunk["chunk_number"], "chunkText": chunk["content"], "documentId": "benchmark"}
+
+
+def run_sequential(text, stand_ins, batch_size):
+    started = time.perf_counter()
+    stand_ins.tag()
+    chunks = list(chunk_dicts(text))
+    for start in range(0, len(chunks), batch_size):
+        stand_ins.embed(chunks[start:start + batch_size])
+    # One transaction for the whole document
+    stored = stand_ins.store(chunks)["results"]
+    return len(stored), time.perf_counter() - started
+
+
+def run_pipeline(text, stand_ins, args):
+    pipeline = IngestionPipeline(
+        stand_ins.embed,
+        stand_ins.store,
+        batch_size=args.batch_size,
+        embed_workers=args.embed_workers,
+        store_workers=args.store_workers,
+        queue_size=args.queue_size,
+    )
+    started = time.perf_counter()
+    result = pipeline.run(chunk_dicts(text), tag_fn=stand_ins.tag)
+    return len(result["results"]), time.perf_counter() - started, result["metrics"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--words", type=int, default=300_000)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--embed-workers", type=int, default=2)
+    parser.add_argument("--store-workers", type=int, default=2)
+    parser.add_argument("--queue-size", type=int, default=4)
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--embed-latency", type=float, default=0.25, help="seconds per embedding request")
+    parser.add_argument("--embed-per-chunk", type=float, default=0.002, help="seconds per embedded chunk")
+    parser.add_argument("--store-latency", type=float, default=0.02, help="seconds per insert transaction")
+    parser.add_argument("--store-per-chunk", type=float, default=0.001, help="seconds per inserted chunk")
+    parser.add_argument("--tag-latency", type=float, default=3.0, help="seconds for the tagging LLM call")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    text = make_text(args.words, args.seed)
+    print(f"words={args.words} batch_size={args.batch_size} embed_workers={args.embed_workers} "
+          f"store_workers={args.store_workers} queue_size={args.queue_size}")
+
+    chunks, sequential_time = run_sequential(text, StandIns(args), args.batch_size)
+    pipeline_chunks, pipeline_time, metrics = run_pipeline(text, StandIns(args), args)
+    assert chunks == pipeline_chunks, (chunks, pipeline_chunks)
+
+    print(f"{'mode':<11} {'chunks':>7} {'seconds':>8} {'chunks/sec':>11}")
+    print(f"{'sequential':<11} {chunks:>7} {sequential_time:>8.2f} {chunks / sequential_time:>11.1f}")
+    print(f"{'pipeline':<11} {pipeline_chunks:>7} {pipeline_time:>8.2f} {pipeline_chunks / pipeline_time:>11.1f}")
+    print(f"speedup: {sequential_time / pipeline_time:.2f}x")
+    print()
+    print(f"{'stage':<7} {'workers':>7} {'items':>6} {'busy s':>7} {'wait s':>7} {'items/sec':>10}")
+    for name, stage in metrics["stages"].items():
+        rate = stage["items_per_second"]
+        print(f"{name:<7} {stage['workers']:>7} {stage['items']:>6} {stage['busy_seconds']:>7.2f} "
+              f"{stage['wait_seconds']:>7.2f} {rate if rate is not None else '-':>10}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+Benchmark for the exact in-process search backend with and without
+quantization.
+
+For each mode (float32, int8, binary) it reports the bytes scanned by the
+first pass, recall@k against exact float32 search, and p50/p99 query
+latency. Vectors are synthetic and clustered, like real embeddings.
+
+Usage (from server/):
+    python benchmarks/quantization.py --rows 100000 --dim 1024 --queries 200 --k 10
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from services.vector_index import ExactIndex, distances, normalize_rows  # noqa: E402
+
+
+def make_vectors(rows, queries, dim, clusters, seed):
+    """Clustered data plus queries drawn around the same cluster centers."""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dim))
+    data = centers[rng.integers(0, clusters, rows)] + 0.6 * rng.normal(size=(rows, dim))
+    query_vectors = centers[rng.integers(0, clusters, queries)] + 0.6 * rng.normal(size=(queries, dim))
+    return data.astype(np.float32), query_vectors.astype(np.float32)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--dim", type=int, default=1024)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--clusters", type=int, default=200)
+    parser.add_argument("--metric", choices=["cosine", "dot", "l2"], default="cosine")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    data, queries = make_vectors(args.rows, args.queries, args.dim, args.clusters, args.seed)
+    ids = [str(i) for i in range(args.rows)]
+
+    prepared = normalize_rows(data) if args.metric == "cosine" else data
+    prepared_queries = normalize_rows(queries) if args.metric == "cosine" else queries
+    truth = [set(np.argsort(row)[:args.k].tolist()) for row in distances(prepared, prepared_queries, args.metric)]
+
+    print(f"rows={args.rows} dim={args.dim} queries={args.queries} k={args.k} metric={args.metric}")
+    print(f"{'mode':<8} {'first-pass MB':>14} {'saved':>7} {'recall@k':>9} {'p50 ms':>8} {'p99 ms':>8}")
+    baseline_bytes = None
+    with tempfile.TemporaryDirectory() as directory:
+        for quantization in (None, "int8", "binary"):
+            index = ExactIndex(args.dim, metric=args.metric, quantization=quantization)
+            index.add(ids, data)
+            index.save(os.path.join(directory, f"{quantization or 'float32'}.npy"))
+
+            index.search(queries[:1], args.k)  # warm the page cache
+            latencies, hits = [], 0
+            for qi, query in enumerate(queries):
+                start = time.perf_counter()
+                result = index.search(query[None, :], args.k)[0]
+                latencies.append((time.perf_counter() - start) * 1000)
+                hits += len(truth[qi] & {int(chunk_id) for chunk_id, _ in result})
+
+            scanned = index.memory_bytes()
+            baseline_bytes = baseline_bytes or scanned
+            print(f"{quantization or 'float32':<8} {scanned / 1e6:>14.1f} {1 - scanned / baseline_bytes:>7.1%} "
+                  f"{hits / (args.k * len(queries)):>9.3f} {np.percentile(latencies, 50):>8.2f} {np.percentile(latencies, 99):>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -27,6 +27,7 @@ CREATE TABLE "Documents" (
     "docType"     VARCHAR(50) NOT NULL,
     "docName"     VARCHAR(255),
     "sourceUrl"   TEXT,
+    "contentHash" CHAR(64),
     "createdAt"   TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
     "updatedAt"   TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
 );
@@ -37,16 +38,98 @@ CREATE TABLE "DocumentChunks" (
     "documentId"    CHAR(32) NOT NULL,
     "chunkIndex"    INT NOT NULL,
     "chunkText"     TEXT NOT NULL,
-    "embeddingData" vector(768),
+    "embeddingData" vector(1024),
     "metaData"      JSONB,
+    "chunkHash"     CHAR(64),
     "createdAt"     TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
-    "updatedAt"     TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+    "updatedAt"     TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    -- Full-text side of hybrid search; must match TEXT_SEARCH_CONFIG
+    "chunkTextSearch" tsvector
+                    GENERATED ALWAYS AS (to_tsvector('english', "chunkText")) STORED
 );
 
+-- Search orders by cosine distance (<=>), so the index must use vector_cosine_ops
 CREATE INDEX "DocumentChunks_embedding_hnsw_idx"
   ON "DocumentChunks"
-  USING hnsw ("embeddingData" vector_l2_ops);
+  USING hnsw ("embeddingData" vector_cosine_ops)
+  WITH (m = 16, ef_construction = 64);
+
+-- Chunks are upserted by position (INSERT ... ON CONFLICT)
+CREATE UNIQUE INDEX "DocumentChunks_documentId_chunkIndex_key"
+  ON "DocumentChunks" ("documentId", "chunkIndex");
+
+CREATE INDEX "Documents_corpusId_idx"
+  ON "Documents" ("corpusId");
+
+CREATE INDEX "Corpora_corpusKey_idx"
+  ON "Corpora" ("corpusKey");
 
 CREATE INDEX "DocumentChunks_metaData_gin_idx"
   ON "DocumentChunks"
   USING GIN("metaData");
+
+CREATE INDEX "DocumentChunks_chunkTextSearch_gin_idx"
+  ON "DocumentChunks"
+  USING GIN ("chunkTextSearch");
+
+-- Chunks of a document version being ingested, moved into "DocumentChunks"
+-- in one transaction once ingestion succeeds
+CREATE TABLE "StagedDocumentChunks" (
+    "stagingId"     CHAR(32) NOT NULL,
+    "documentId"    CHAR(32) NOT NULL,
+    "chunkIndex"    INT NOT NULL,
+    "chunkText"     TEXT NOT NULL,
+    "embeddingData" vector(1024),
+    "metaData"      JSONB,
+    "chunkHash"     CHAR(64),
+    "createdAt"     TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY ("stagingId", "chunkIndex")
+);
+
+CREATE INDEX "StagedDocumentChunks_createdAt_idx"
+  ON "StagedDocumentChunks" ("createdAt");
+
+CREATE TABLE "EmbeddingCache" (
+    "cacheKey"   CHAR(64) PRIMARY KEY,
+    "model"      VARCHAR(100) NOT NULL,
+    "inputType"  VARCHAR(20),
+    "embedding"  REAL[] NOT NULL,
+    "createdAt"  TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    "lastUsedAt" TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX "EmbeddingCache_lastUsedAt_idx"
+  ON "EmbeddingCache" ("lastUsedAt");
+
+CREATE TABLE "IngestionJobs" (
+    "jobId"           CHAR(32) PRIMARY KEY
+                      DEFAULT (REPLACE(gen_random_uuid()::text, '-', '')),
+    "userId"          CHAR(32) NOT NULL,
+    "corpusKey"       VARCHAR(100) NOT NULL,
+    "fileType"        VARCHAR(50) NOT NULL,
+    "fileName"        VARCHAR(255),
+    "sourceUrl"       TEXT,
+    "payload"         BYTEA,
+    "status"          VARCHAR(20) NOT NULL DEFAULT 'queued',
+    "attempts"        INT NOT NULL DEFAULT 0,
+    "maxAttempts"     INT NOT NULL DEFAULT 1,
+    "chunksTotal"     INT,
+    "chunksEmbedded"  INT NOT NULL DEFAULT 0,
+    "chunksInserted"  INT NOT NULL DEFAULT 0,
+    "cancelRequested" BOOLEAN NOT NULL DEFAULT FALSE,
+    "error"           TEXT,
+    "result"          JSONB,
+    "lockedBy"        VARCHAR(255),
+    "createdAt"       TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    "updatedAt"       TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    "startedAt"       TIMESTAMP WITH TIME ZONE,
+    "finishedAt"      TIMESTAMP WITH TIME ZONE
+);
+
+-- Workers claim the oldest queued job with FOR UPDATE SKIP LOCKED
+CREATE INDEX "IngestionJobs_queued_idx"
+  ON "IngestionJobs" ("createdAt")
+  WHERE "status" = 'queued';
+
+CREATE INDEX "IngestionJobs_status_updatedAt_idx"
+  ON "IngestionJobs" ("status", "updatedAt");
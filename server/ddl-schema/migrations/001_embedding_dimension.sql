@@ -0,0 +1,5 @@
+-- voyage-3-large (the default EMBEDDING_MODEL) produces 1024-dimensional vectors.
+-- Existing rows must already hold 1024-dimensional vectors (or be re-embedded);
+-- otherwise this statement fails and nothing is changed.
+ALTER TABLE "DocumentChunks"
+  ALTER COLUMN "embeddingData" TYPE vector(1024);
@@ -0,0 +1,36 @@
+-- Vector search orders by cosine distance (<=>), which the vector_l2_ops
+-- index cannot serve. Replace it with a cosine HNSW index and add the
+-- indexes used to resolve Corpora -> Documents -> DocumentChunks.
+DROP INDEX IF EXISTS "DocumentChunks_embedding_hnsw_idx";
+
+CREATE INDEX "DocumentChunks_embedding_hnsw_idx"
+  ON "DocumentChunks"
+  USING hnsw ("embeddingData" vector_cosine_ops)
+  WITH (m = 16, ef_construction = 64);
+
+-- IVFFlat alternative (faster to build, needs data present; tune lists ~ rows/1000):
+-- CREATE INDEX "DocumentChunks_embedding_ivfflat_idx"
+--   ON "DocumentChunks"
+--   USING ivfflat ("embeddingData" vector_cosine_ops)
+--   WITH (lists = 100);
+
+CREATE INDEX IF NOT EXISTS "DocumentChunks_documentId_idx"
+  ON "DocumentChunks" ("documentId");
+
+CREATE INDEX IF NOT EXISTS "Documents_corpusId_idx"
+  ON "Documents" ("corpusId");
+
+CREATE INDEX IF NOT EXISTS "Corpora_corpusKey_idx"
+  ON "Corpora" ("corpusKey");
+
+-- Optional per-corpus index for a large corpus. The predicate can only use
+-- DocumentChunks columns, so it lists the corpus' documents; recreate it
+-- when documents are added. Replace <corpusId> before running.
+-- DO $$
+-- BEGIN
+--   EXECUTE format(
+--     'CREATE INDEX IF NOT EXISTS %I ON "DocumentChunks" USING hnsw ("embeddingData" vector_cosine_ops) WHERE "documentId" IN (%s)',
+--     'DocumentChunks_embedding_<corpusId>_idx',
+--     (SELECT string_agg(quote_literal("documentId"), ', ') FROM "Documents" WHERE "corpusId" = '<corpusId>')
+--   );
+-- END $$;
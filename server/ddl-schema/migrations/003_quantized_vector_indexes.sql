@@ -0,0 +1,19 @@
+-- Quantized first-pass indexes for SEARCH_QUANTIZATION=halfvec / binary
+-- (pgvector >= 0.7). The table keeps full-precision vectors for re-scoring;
+-- only the ANN index shrinks (2x for halfvec, 32x for binary).
+-- The expressions must match DocumentChunkModel.QUANTIZED_ORDER_BY, and the
+-- dimension must match the "embeddingData" column.
+
+CREATE INDEX IF NOT EXISTS "DocumentChunks_embedding_halfvec_hnsw_idx"
+  ON "DocumentChunks"
+  USING hnsw (("embeddingData"::halfvec(1024)) halfvec_cosine_ops)
+  WITH (m = 16, ef_construction = 64);
+
+CREATE INDEX IF NOT EXISTS "DocumentChunks_embedding_binary_hnsw_idx"
+  ON "DocumentChunks"
+  USING hnsw ((binary_quantize("embeddingData")::bit(1024)) bit_hamming_ops)
+  WITH (m = 16, ef_construction = 64);
+
+-- Once a quantized mode is in use, the full-precision index can be dropped
+-- to reclaim its memory:
+-- DROP INDEX IF EXISTS "DocumentChunks_embedding_hnsw_idx";
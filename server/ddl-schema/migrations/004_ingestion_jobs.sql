@@ -0,0 +1,36 @@
+-- Durable queue for background /process/document ingestion.
+-- Uploaded files are kept in "payload" until the job succeeds so a failed
+-- or cancelled job can be retried.
+
+CREATE TABLE IF NOT EXISTS "IngestionJobs" (
+    "jobId"           CHAR(32) PRIMARY KEY
+                      DEFAULT (REPLACE(gen_random_uuid()::text, '-', '')),
+    "userId"          CHAR(32) NOT NULL,
+    "corpusKey"       VARCHAR(100) NOT NULL,
+    "fileType"        VARCHAR(50) NOT NULL,
+    "fileName"        VARCHAR(255),
+    "sourceUrl"       TEXT,
+    "payload"         BYTEA,
+    "status"          VARCHAR(20) NOT NULL DEFAULT 'queued',
+    "attempts"        INT NOT NULL DEFAULT 0,
+    "maxAttempts"     INT NOT NULL DEFAULT 1,
+    "chunksTotal"     INT,
+    "chunksEmbedded"  INT NOT NULL DEFAULT 0,
+    "chunksInserted"  INT NOT NULL DEFAULT 0,
+    "cancelRequested" BOOLEAN NOT NULL DEFAULT FALSE,
+    "error"           TEXT,
+    "result"          JSONB,
+    "lockedBy"        VARCHAR(255),
+    "createdAt"       TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    "updatedAt"       TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    "startedAt"       TIMESTAMP WITH TIME ZONE,
+    "finishedAt"      TIMESTAMP WITH TIME ZONE
+);
+
+-- Workers claim the oldest queued job with FOR UPDATE SKIP LOCKED
+CREATE INDEX IF NOT EXISTS "IngestionJobs_queued_idx"
+  ON "IngestionJobs" ("createdAt")
+  WHERE "status" = 'queued';
+
+CREATE INDEX IF NOT EXISTS "IngestionJobs_status_updatedAt_idx"
+  ON "IngestionJobs" ("status", "updatedAt");
@@ -0,0 +1,14 @@
+-- Full-text side of hybrid search (SEARCH_HYBRID / "hybrid" on /search).
+-- The generated column is kept up to date by Postgres on every insert and
+-- update of "chunkText"; the text search configuration must match
+-- TEXT_SEARCH_CONFIG in models/document_chunk.py.
+-- Adding a stored generated column rewrites the table, so run this during
+-- a quiet period on large corpora.
+
+ALTER TABLE "DocumentChunks"
+  ADD COLUMN IF NOT EXISTS "chunkTextSearch" tsvector
+  GENERATED ALWAYS AS (to_tsvector('english', "chunkText")) STORED;
+
+CREATE INDEX IF NOT EXISTS "DocumentChunks_chunkTextSearch_gin_idx"
+  ON "DocumentChunks"
+  USING GIN ("chunkTextSearch");
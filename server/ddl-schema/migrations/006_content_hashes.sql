@@ -0,0 +1,11 @@
+-- Content hashes for incremental re-ingestion (services/process_document.py).
+-- "contentHash" is the sha256 of the uploaded file (of the extracted text
+-- for URLs) and is set once every chunk of that version has been stored;
+-- "chunkHash" is the sha256 of "chunkText". Existing rows keep NULL hashes,
+-- so their next upload is ingested in full once and incrementally after that.
+
+ALTER TABLE "Documents"
+  ADD COLUMN IF NOT EXISTS "contentHash" CHAR(64);
+
+ALTER TABLE "DocumentChunks"
+  ADD COLUMN IF NOT EXISTS "chunkHash" CHAR(64);
@@ -0,0 +1,24 @@
+-- One chunk per ("documentId", "chunkIndex"), so ingestion can write chunks
+-- with INSERT ... ON CONFLICT ("documentId", "chunkIndex") DO UPDATE.
+-- Duplicates left by earlier re-uploads are removed first, keeping the most
+-- recently updated row at each position.
+-- On large tables, build the index with CREATE UNIQUE INDEX CONCURRENTLY
+-- outside a transaction instead.
+
+DELETE FROM "DocumentChunks" d
+USING (
+  SELECT "chunkId",
+         ROW_NUMBER() OVER (
+           PARTITION BY "documentId", "chunkIndex"
+           ORDER BY "updatedAt" DESC NULLS LAST, "createdAt" DESC NULLS LAST, "chunkId"
+         ) AS position_rank
+  FROM "DocumentChunks"
+) ranked
+WHERE d."chunkId" = ranked."chunkId"
+  AND ranked.position_rank > 1;
+
+CREATE UNIQUE INDEX IF NOT EXISTS "DocumentChunks_documentId_chunkIndex_key"
+  ON "DocumentChunks" ("documentId", "chunkIndex");
+
+-- The unique index also serves lookups by "documentId"
+DROP INDEX IF EXISTS "DocumentChunks_documentId_idx";
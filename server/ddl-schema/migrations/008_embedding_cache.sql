@@ -0,0 +1,16 @@
+-- Persistent tier of the embedding cache (services/embedding_cache.py,
+-- models/embedding_cache.py). Keyed by the sha256 of model, input type and
+-- normalized text; "lastUsedAt" drives the eviction of stale entries.
+-- A no-op on databases created from a ddl.sql that already has the table.
+
+CREATE TABLE IF NOT EXISTS "EmbeddingCache" (
+    "cacheKey"   CHAR(64) PRIMARY KEY,
+    "model"      VARCHAR(100) NOT NULL,
+    "inputType"  VARCHAR(20),
+    "embedding"  REAL[] NOT NULL,
+    "createdAt"  TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    "lastUsedAt" TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS "EmbeddingCache_lastUsedAt_idx"
+  ON "EmbeddingCache" ("lastUsedAt");
@@ -0,0 +1,22 @@
+-- Chunks of a document version that is still being ingested. Ingestion
+-- writes embedded chunks here under a per-run "stagingId"; once every stage
+-- has succeeded they are moved into "DocumentChunks", together with the
+-- document's new text and content hash, in one transaction. A failed run
+-- only deletes its own staging rows, so the stored version stays intact.
+-- Rows older than a day can only be left by a crashed process and are safe
+-- to delete.
+
+CREATE TABLE IF NOT EXISTS "StagedDocumentChunks" (
+    "stagingId"     CHAR(32) NOT NULL,
+    "documentId"    CHAR(32) NOT NULL,
+    "chunkIndex"    INT NOT NULL,
+    "chunkText"     TEXT NOT NULL,
+    "embeddingData" vector(1024),
+    "metaData"      JSONB,
+    "chunkHash"     CHAR(64),
+    "createdAt"     TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY ("stagingId", "chunkIndex")
+);
+
+CREATE INDEX IF NOT EXISTS "StagedDocumentChunks_createdAt_idx"
+  ON "StagedDocumentChunks" ("createdAt");
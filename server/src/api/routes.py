@@ -1,14 +1,18 @@
-from fastapi import APIRouter, Form, UploadFile, HTTPException, Header, Depends, Query
+from fastapi import APIRouter, File, Form, UploadFile, HTTPException, Header, Depends, Query, Response
+from fastapi.responses import StreamingResponse
+from fastapi.encoders import jsonable_encoder
 from pydantic import BaseModel
-from services.text_extractor import extract_text
+from services.text_extractor import extract_text_async
 from services.chunking import chunking
-from services.embedding import get_embedding
-from services.reranker import re_rank
-from typing import List, Optional
+from services.embedding import get_embedding_async, get_embedding_cache
+from services.reranker import re_rank_async
+from typing import List, Optional, Literal
 import json
 import time
+import asyncio
 from datetime import datetime
 from core.config import settings
+from core.db import settings as db_settings
 
 from controllers.users import (
     get_users_data, get_user_data, create_user_data, update_user_data, delete_user_data
@@ -19,14 +23,23 @@ from controllers.corpora import (
 )
 
 from controllers.documents import (
-    get_documents_data, get_document_data, create_document_data, update_document_data, delete_document_data
+    get_documents_data, get_document_data, create_document_data, update_document_data, delete_document_data, export_documents_data
 )
 
 from controllers.document_chunk import (
-    get_documents_chunks, get_document_chunk, update_document_chunk, create_document_chunk, delete_document_chunk, search_document_chunk
+    get_documents_chunks, get_document_chunk, update_document_chunk, create_document_chunk, delete_document_chunk,
+    search_document_chunk_async, search_document_chunk_stream, get_answer_cache, export_documents_chunks
+)
+
+from controllers.ingestion_jobs import (
+    enqueue_ingestion_job, get_ingestion_jobs_data, get_ingestion_job_data, cancel_ingestion_job, retry_ingestion_job
 )
 
 from services.process_document import process_document
+from services.archives import ArchiveError, SourceBundle, archive_type, expand_archive
+from services.ingestion_queue import BULK_JOB_TYPE, get_ingestion_pool
+from services.ingestion_pipeline import get_pipeline_stats
+from services.extraction_pool import get_extraction_pool
 
 from controllers.auth import register_user_controller, login_user_controller
 
@@ -40,11 +53,18 @@ class ChunkingRequest(BaseModel):
     chunk_size: Optional[int] = None
     chunk_overlap: Optional[int] = None
     text: str
-    chunk_type: Optional[str] = "manual"
+    # "manual" (words), "auto" (LLM), or a local strategy sized in tokens:
+    # "token", "sentence", "paragraph", "markdown", "recursive"
+    chunk_type: Optional[Literal["manual", "auto", "token", "sentence", "paragraph", "markdown", "recursive"]] = "manual"
+    # Separators for "recursive", most preferred first
+    separators: Optional[List[str]] = None
+    # Tokenizer and input limit for the local strategies (default EMBEDDING_MODEL)
+    embedding_model: Optional[str] = None
 
 class EmbeddingRequest(BaseModel):
     model: str
     texts: List[str]
+    input_type: Literal["document", "query"] = "query"
 
 class CreateUserRequest(BaseModel):
     username: str
@@ -101,6 +121,13 @@ class SearchRequest(BaseModel):
     model: Optional[str] = None
     corpusKey: str
     threshold: float = 0.8
+    ef_search: Optional[int] = None
+    probes: Optional[int] = None
+    use_cache: bool = True
+    reranker: Optional[Literal["voyage", "lexical", "onnx"]] = None
+    hybrid: Optional[bool] = None
+    vector_weight: Optional[float] = None
+    text_weight: Optional[float] = None
 
 class ProcessDocumentRequest(BaseModel):
     corpusKey: str
@@ -111,6 +138,7 @@ class RerankRequest(BaseModel):
     documents: List[str]
     model: str = "rerank-2"
     top_k: Optional[int] = 3
+    backend: Optional[Literal["voyage", "lexical", "onnx"]] = None
 
 class AuthRequest(BaseModel):
     email: str
@@ -125,6 +153,28 @@ def api_validation(X_API_KEY: str = Header(...)):
         raise HTTPException(status_code=401, detail="Invalid API key")
     return True
 
+def parse_where(where: Optional[str]):
+    if not where:
+        return None
+    try:
+        where_conditions = json.loads(where)
+    except json.JSONDecodeError:
+        raise HTTPException(status_code=400, detail="Invalid JSON in where parameter")
+    if not isinstance(where_conditions, dict):
+        raise HTTPException(status_code=400, detail="Where conditions must be a JSON object")
+    return where_conditions
+
+def parse_fields(fields: Optional[str]):
+    """Comma-separated column names, or None for the default projection."""
+    if not fields:
+        return None
+    return [name.strip() for name in fields.split(",") if name.strip()] or None
+
+def ndjson_stream(rows):
+    """Encodes rows as newline-delimited JSON, one row per line."""
+    for row in rows:
+        yield json.dumps(jsonable_encoder(row)) + "\n"
+
 @router.post("/extractor")
 async def upload_file(file: UploadFile, api_key: str = Depends(api_validation)):
     try:
@@ -136,7 +186,7 @@ async def upload_file(file: UploadFile, api_key: str = Depends(api_validation)):
         if not file_type:
             raise HTTPException(status_code=400, detail="Could not determine file type")
 
-        extracted_text = extract_text(file_type, content)
+        extracted_text = await extract_text_async(file_type, content)
 
         end_time = time.time()
         duration = round(end_time - start_time, 4)
@@ -159,7 +209,7 @@ async def chunking_route(data: ChunkingRequest, api_key: str = Depends(api_valid
         start_time = time.time()
 
         chunking_data = data.dict(exclude_none=True)
-        result = chunking(chunking_data)
+        result = await asyncio.to_thread(chunking, chunking_data)
 
         parsed_result = json.loads(result) if isinstance(result, str) else result
 
@@ -184,7 +234,7 @@ async def embeddings_route(data: EmbeddingRequest, api_key: str = Depends(api_va
     try:
         start_time = time.time()
         
-        embeddings = get_embedding(data.model, data.texts)
+        embeddings = await get_embedding_async(data.model, data.texts, input_type=data.input_type)
 
         end_time = time.time()
         duration = round(end_time - start_time, 4)
@@ -211,7 +261,7 @@ async def embeddings_route(data: EmbeddingRequest, api_key: str = Depends(api_va
         503: {"description": "Database connection error"}
     }
 )
-async def get_users(
+def get_users(
     where: str = Query(None, description="JSON string with filter conditions"),
     api_key: str = Depends(api_validation)
 ):
@@ -239,7 +289,7 @@ async def get_users(
         503: {"description": "Database connection error"}
     }
 )
-async def get_user(
+def get_user(
     userId: str, 
     api_key: str = Depends(api_validation)
 ):
@@ -260,7 +310,7 @@ async def get_user(
         503: {"description": "Database connection error"}
     }
 )
-async def create_user(
+def create_user(
     request: CreateUserRequest, 
     api_key: str = Depends(api_validation)
 ):
@@ -285,7 +335,7 @@ async def create_user(
         503: {"description": "Database connection error"}
     }
 )
-async def update_user(
+def update_user(
     request: UpdateUserRequest, 
     userId: str, 
     api_key: str = Depends(api_validation)
@@ -310,7 +360,7 @@ async def update_user(
         503: {"description": "Database connection error"}
     }
 )
-async def delete_user(
+def delete_user(
     userId: str, 
     api_key: str = Depends(api_validation)
 ):
@@ -331,7 +381,7 @@ async def delete_user(
         503: {"description": "Database connection error"}
     }
 )
-async def get_corpuses(
+def get_corpuses(
     where: str = Query(None, description="JSON string with filter conditions"),
     api_key: str = Depends(api_validation)
 ):
@@ -354,7 +404,7 @@ async def get_corpuses(
         503: {"description": "Database connection error"}
     }
 )
-async def get_corpus(
+def get_corpus(
     corpusId: str, 
     api_key: str = Depends(api_validation)
 ):
@@ -375,7 +425,7 @@ async def get_corpus(
         503: {"description": "Database connection error"}
     }
 )
-async def create_corpus(
+def create_corpus(
     request: CreateCorporaRequest, 
     api_key: str = Depends(api_validation)
 ):
@@ -398,7 +448,7 @@ async def create_corpus(
         503: {"description": "Database connection error"}
     }
 )
-async def update_corpus(
+def update_corpus(
     request: UpdateCorporaRequest, 
     corpusId: str, 
     api_key: str = Depends(api_validation)
@@ -422,7 +472,7 @@ async def update_corpus(
         503: {"description": "Database connection error"}
     }
 )
-async def delete_corpus(
+def delete_corpus(
     corpusId: str, 
     api_key: str = Depends(api_validation)
 ):
@@ -444,25 +494,45 @@ async def delete_corpus(
         503: {"description": "Database connection error"}
     }
 )
-async def get_documents(
+def get_documents(
     where: str = Query(None, description="JSON string with filter conditions"),
+    fields: str = Query(None, description="Comma-separated columns to return (default: all but rawText)"),
+    after: str = Query(None, description="Cursor from the previous page's next"),
+    limit: int = Query(settings.LIST_PAGE_SIZE, ge=1, le=settings.LIST_MAX_PAGE_SIZE),
     api_key: str = Depends(api_validation)
 ):
     """
-    Get a list of documents with optional filtering.
+    Get a page of documents with optional filtering, ordered by documentId.
     
     - **where**: Optional JSON string with filter conditions (e.g., {"userId":"123","docType":"pdf"})
+    - **fields**: Optional comma-separated columns (e.g., documentId,docName,rawText); rawText is left out unless listed
+    - **after**: Returns documents after this documentId; pass the previous response's **next**
+    - **limit**: Page size (default LIST_PAGE_SIZE, at most LIST_MAX_PAGE_SIZE)
+
+    **next** is null on the last page. Use /documents/export to read everything at once.
     """
-    where_conditions = None
-    if where:
-        try:
-            where_conditions = json.loads(where)
-            if not isinstance(where_conditions, dict):
-                raise HTTPException(status_code=400, detail="Where conditions must be a JSON object")
-        except json.JSONDecodeError:
-            raise HTTPException(status_code=400, detail="Invalid JSON in where parameter")
-    
-    return get_documents_data(where_conditions)
+    return get_documents_data(parse_where(where), parse_fields(fields), after, limit)
+
+@router.get("/documents/export",
+    responses={
+        200: {"description": "Matching documents as newline-delimited JSON"},
+        400: {"description": "Invalid request parameters"}
+    }
+)
+def export_documents(
+    where: str = Query(None, description="JSON string with filter conditions"),
+    fields: str = Query(None, description="Comma-separated columns to return (default: all but rawText)"),
+    api_key: str = Depends(api_validation)
+):
+    """
+    Stream every matching document as newline-delimited JSON, read from the
+    database in batches through a server-side cursor.
+
+    - **where**: Optional JSON string with filter conditions, as for /documents
+    - **fields**: Optional comma-separated columns, as for /documents
+    """
+    rows = export_documents_data(parse_where(where), parse_fields(fields))
+    return StreamingResponse(ndjson_stream(rows), media_type="application/x-ndjson")
 
 @router.get("/document/{document_id}",
     responses={
@@ -472,7 +542,7 @@ async def get_documents(
         503: {"description": "Database connection error"}
     }
 )
-async def get_document(
+def get_document(
     document_id: str, 
     api_key: str = Depends(api_validation)
 ):
@@ -492,7 +562,7 @@ async def get_document(
         503: {"description": "Database connection error"}
     }
 )
-async def create_document(
+def create_document(
     request: CreateDocumentRequest, 
     api_key: str = Depends(api_validation)
 ):
@@ -519,7 +589,7 @@ async def create_document(
         503: {"description": "Database connection error"}
     }
 )
-async def update_document(
+def update_document(
     request: UpdateDocumentRequest, 
     docId: str, 
     api_key: str = Depends(api_validation)
@@ -547,7 +617,7 @@ async def update_document(
         503: {"description": "Database connection error"}
     }
 )
-async def delete_document(
+def delete_document(
     document_id: str, 
     api_key: str = Depends(api_validation)
 ):
@@ -567,25 +637,45 @@ async def delete_document(
         503: {"description": "Database connection error"}
     }
 )
-async def get_documents_chunks_data(
+def get_documents_chunks_data(
     where: str = Query(None, description="JSON string with filter conditions"),
+    fields: str = Query(None, description="Comma-separated columns to return (default: all but embeddingData)"),
+    after: str = Query(None, description="Cursor from the previous page's next"),
+    limit: int = Query(settings.LIST_PAGE_SIZE, ge=1, le=settings.LIST_MAX_PAGE_SIZE),
     api_key: str = Depends(api_validation)
 ):
     """
-    Get a list of document chunks with optional filtering.
+    Get a page of document chunks with optional filtering, ordered by chunkId.
     
     - **where**: Optional JSON string with filter conditions (e.g., {"documentId": "doc123"})
+    - **fields**: Optional comma-separated columns (e.g., chunkId,chunkIndex,embeddingData); embeddingData is left out unless listed
+    - **after**: Returns chunks after this chunkId; pass the previous response's **next**
+    - **limit**: Page size (default LIST_PAGE_SIZE, at most LIST_MAX_PAGE_SIZE)
+
+    **next** is null on the last page. Use /chunks/export to read everything at once.
     """
-    where_conditions = None
-    if where:
-        try:
-            where_conditions = json.loads(where)
-            if not isinstance(where_conditions, dict):
-                raise HTTPException(status_code=400, detail="Where conditions must be a JSON object")
-        except json.JSONDecodeError:
-            raise HTTPException(status_code=400, detail="Invalid JSON in where parameter")
-    
-    return get_documents_chunks(where_conditions)
+    return get_documents_chunks(parse_where(where), parse_fields(fields), after, limit)
+
+@router.get("/chunks/export",
+    responses={
+        200: {"description": "Matching chunks as newline-delimited JSON"},
+        400: {"description": "Invalid request parameters"}
+    }
+)
+def export_documents_chunks_data(
+    where: str = Query(None, description="JSON string with filter conditions"),
+    fields: str = Query(None, description="Comma-separated columns to return (default: all but embeddingData)"),
+    api_key: str = Depends(api_validation)
+):
+    """
+    Stream every matching chunk as newline-delimited JSON, read from the
+    database in batches through a server-side cursor.
+
+    - **where**: Optional JSON string with filter conditions, as for /chunks
+    - **fields**: Optional comma-separated columns, as for /chunks
+    """
+    rows = export_documents_chunks(parse_where(where), parse_fields(fields))
+    return StreamingResponse(ndjson_stream(rows), media_type="application/x-ndjson")
 
 @router.get("/chunk/{chunk_id}",
     responses={
@@ -595,7 +685,7 @@ async def get_documents_chunks_data(
         503: {"description": "Database connection error"}
     }
 )
-async def get_document_chunk_data(
+def get_document_chunk_data(
     chunk_id: str, 
     api_key: str = Depends(api_validation)
 ):
@@ -615,7 +705,7 @@ async def get_document_chunk_data(
         503: {"description": "Database connection error"}
     }
 )
-async def update_document_chunk_data(
+def update_document_chunk_data(
     chunk_id: str, 
     request: UpdateChunkRequest, 
     api_key: str = Depends(api_validation)
@@ -640,7 +730,7 @@ async def update_document_chunk_data(
         503: {"description": "Database connection error"}
     }
 )
-async def create_document_chunk_data(
+def create_document_chunk_data(
     request: CreateChunkRequest, 
     api_key: str = Depends(api_validation)
 ):
@@ -664,7 +754,7 @@ async def create_document_chunk_data(
         503: {"description": "Database connection error"}
     }
 )
-async def delete_document_chunk_data(
+def delete_document_chunk_data(
     chunk_id: str, 
     api_key: str = Depends(api_validation)
 ):
@@ -691,63 +781,361 @@ async def search_document_chunk_data(
     
     - **question**: The search query
     - **top_k**: Maximum number of results to return (default: 5)
-    - **model**: The embedding model to use (optional)
+    - **model**: The embedding model to use (optional, defaults to the configured EMBEDDING_MODEL)
+    - **ef_search**: HNSW candidate list size for this query (optional, higher = better recall, slower)
+    - **probes**: IVFFlat lists to scan for this query (optional)
+    - **use_cache**: Serve a cached answer for the same or a semantically similar question (default: true)
+    - **reranker**: "voyage" (API), "lexical" (local BM25) or "onnx" (local cross-encoder); defaults to RERANK_BACKEND
+    - **hybrid**: Also run a full-text query and merge it with the vector results by reciprocal rank fusion (defaults to SEARCH_HYBRID)
+    - **vector_weight** / **text_weight**: Fusion weights of the two result lists (default: HYBRID_VECTOR_WEIGHT / HYBRID_TEXT_WEIGHT)
+
+    The response's **cache** field reports whether the answer came from the cache
+    (`hit`) and from which level (`exact` or `semantic`).
     """
-    return search_document_chunk(request.question, request.top_k, request.model, request.corpusKey, request.threshold)
+    return await search_document_chunk_async(request.question, request.top_k, request.model, request.corpusKey, request.threshold,
+                                             request.ef_search, request.probes, request.use_cache, request.reranker,
+                                             request.hybrid, request.vector_weight, request.text_weight)
 
-@router.post("/process/document")
+@router.post("/search/stream",
+    responses={
+        200: {"description": "Server-sent event stream of chunks, answer tokens and timings"},
+        400: {"description": "Invalid search parameters"}
+    }
+)
+async def search_document_chunk_stream_data(
+    request: SearchRequest,
+    api_key: str = Depends(api_validation)
+):
+    """
+    Streaming variant of /search as server-sent events (text/event-stream).
+
+    Takes the same body as /search and emits, in order:
+    - **chunks**: the reranked chunks, as soon as retrieval is done
+    - **token**: answer text as the LLM produces it (one or more events)
+    - **done**: the full answer, cache info and per-stage timings in seconds
+      (embed, search, rerank, generate, first_token, total)
+
+    An **error** event replaces **done** if a stage fails after the stream started.
+    """
+    if not request.question:
+        raise HTTPException(status_code=400, detail="Search question is required")
+    return StreamingResponse(
+        search_document_chunk_stream(request.question, request.top_k, request.model, request.corpusKey, request.threshold,
+                                     request.ef_search, request.probes, request.use_cache, request.reranker,
+                                     request.hybrid, request.vector_weight, request.text_weight),
+        media_type="text/event-stream",
+        # Keep proxies from buffering the stream
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@router.post("/process/document",
+    responses={
+        200: {"description": "Document processed (wait=true)"},
+        202: {"description": "Ingestion job queued"},
+        400: {"description": "Neither a file nor a URL was provided"},
+        500: {"description": "Internal server error"},
+        503: {"description": "Database connection error"}
+    }
+)
 async def process_document_data(
+    response: Response,
     file: Optional[UploadFile] = None,
     url: Optional[str] = Form(None),
     corpus_key: str = Form(...),
     userId: str = Form(...),
+    wait: bool = Form(False),
+    api_key: str = Depends(api_validation)
+):
+    """
+    Ingest a document (extract, tag, chunk, embed and store).
+
+    By default the document is queued and the created job is returned right
+    away; poll /jobs/{jobId} for status and progress. Uploading a document
+    again is incremental: an identical file is a no-op ("unchanged") and a
+    changed one only re-embeds its changed chunks ("updated").
+
+    - **file** / **url**: The document to ingest
+    - **corpus_key**: The corpus to add the document to
+    - **userId**: The owner of the corpus
+    - **wait**: Process the document within the request and return its chunks (default: false)
+    """
+    if not file and not url:
+        raise HTTPException(status_code=400, detail="Either a file or a URL must be provided.")
+
+    if file:
+        file_bytes = await file.read()
+        file_type = file.filename.split(".")[-1]
+        file_name = file.filename.split("/")[-1]  # Use full filename for file_name
+        source = file_bytes
+    else:
+        file_type = "url"
+        file_name = url.split("/")[-1]  # Extract file name from the URL
+        source = url
+
+    if wait:
+        try:
+            extracted_text = await asyncio.to_thread(process_document, userId, file_type, source, corpus_key, file_name)
+            return {
+                "results": extracted_text["results"],
+                "documentId": extracted_text["documentId"],
+                "status": extracted_text["status"],
+                "changes": extracted_text["changes"],
+            }
+        except Exception as e:
+            print(f"🔥 Upload failed: {e}")
+            raise HTTPException(status_code=500, detail=str(e))
+
+    job = await asyncio.to_thread(enqueue_ingestion_job, {
+        "userId": userId,
+        "corpusKey": corpus_key,
+        "fileType": file_type,
+        "fileName": file_name,
+        "payload": file_bytes if file else None,
+        "sourceUrl": url if not file else None,
+    })
+    response.status_code = 202
+    return job
+
+@router.post("/process/documents",
+    responses={
+        202: {"description": "Bulk ingestion job queued"},
+        400: {"description": "No files or URLs, a request over its file or size limit, or an unreadable archive"},
+        500: {"description": "Internal server error"},
+        503: {"description": "Database connection error"}
+    }
+)
+async def process_documents_data(
+    response: Response,
+    files: Optional[List[UploadFile]] = File(None),
+    urls: Optional[str] = Form(None),
+    corpus_key: str = Form(...),
+    userId: str = Form(...),
     api_key: str = Depends(api_validation)
 ):
+    """
+    Queue many documents for ingestion into one corpus as a single job.
+
+    The job resolves the corpus once, extracts files concurrently and lets
+    their chunks share embedding batches. Files already ingested are updated
+    incrementally, as with /process/document. Poll /jobs/{jobId}: once the
+    job is done its result holds one manifest entry per file (fileName,
+    documentId, status, changes, error), status being created, updated,
+    unchanged, failed or skipped, plus a summary. A file that fails does not
+    stop the others.
+
+    One budget covers the whole request: at most BULK_INGEST_MAX_FILES files
+    (archive members and URLs included) and BULK_INGEST_MAX_MB of documents
+    once archives are expanded.
+
+    - **files**: Documents to ingest; zip and tar archives (.zip, .tar, .tar.gz, ...) are expanded
+    - **urls**: JSON array of URLs, or one URL per line
+    - **corpus_key**: The corpus to add the documents to
+    - **userId**: The owner of the corpus
+    """
+    bundle = SourceBundle(settings.BULK_INGEST_MAX_FILES, settings.BULK_INGEST_MAX_MB * 1024 * 1024)
     try:
-        print(file)
-        if not file and not url:
-            raise HTTPException(status_code=400, detail="Either a file or a URL must be provided.")
-
-        if file:
-            file_bytes = await file.read()
-            file_type = file.filename.split(".")[-1]
-            file_name = file.filename.split("/")[-1]  # Use full filename for file_name
-            extracted_text = process_document(userId, file_type, file_bytes, corpus_key, file_name)
-            print("Received API call to /process/document")
-            print("File:", file)
-            print("UserId:", userId)
-            print("Corpus Key:", corpus_key)
-
-        elif url:
-            file_type = "url"
-            file_name = url.split("/")[-1]  # Extract file name from the URL
-            extracted_text = process_document(userId, file_type, url, corpus_key, file_name)
+        for file in files or []:
+            if archive_type(file.filename):
+                # Only the expanded members count towards the budget
+                if file.size is not None and file.size > bundle.bytes_left:
+                    raise ArchiveError(f"A request can hold at most {bundle.max_bytes} bytes of documents.")
+                archive_bytes = await file.read()
+                for member_name, member_bytes in expand_archive(archive_bytes, file.filename, bundle):
+                    bundle.add_file(member_name.split(".")[-1], member_name, member_bytes)
+                del archive_bytes
+            else:
+                if file.size is not None:
+                    bundle.reserve(file.size)
+                file_bytes = await file.read()
+                if file.size is None:
+                    bundle.reserve(len(file_bytes))
+                bundle.add_file(file.filename.split(".")[-1], file.filename.split("/")[-1], file_bytes)
+
+        if urls:
+            try:
+                url_list = json.loads(urls)
+            except json.JSONDecodeError:
+                url_list = urls.splitlines()
+            if not isinstance(url_list, list):
+                raise HTTPException(status_code=400, detail="urls must be a JSON array or one URL per line")
+            for url in url_list:
+                url = str(url).strip()
+                if url:
+                    bundle.add_url(url)
+    except ArchiveError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    if not bundle.entries:
+        raise HTTPException(status_code=400, detail="At least one file or URL must be provided.")
+
+    job = await asyncio.to_thread(enqueue_ingestion_job, {
+        "userId": userId,
+        "corpusKey": corpus_key,
+        "fileType": BULK_JOB_TYPE,
+        "fileName": f"{len(bundle.entries)} files",
+        "payload": bundle.payload(),
+        "sourceUrl": None,
+    })
+    response.status_code = 202
+    return job
+
+@router.get("/jobs",
+    responses={
+        200: {"description": "List of ingestion jobs retrieved successfully"},
+        400: {"description": "Invalid request parameters"},
+        500: {"description": "Internal server error"},
+        503: {"description": "Database connection error"}
+    }
+)
+def get_ingestion_jobs(
+    where: str = Query(None, description="JSON string with filter conditions"),
+    api_key: str = Depends(api_validation)
+):
+    """
+    Get the 100 most recent ingestion jobs with optional filtering.
 
-        return {
-            "results": extracted_text["results"],
-        }
+    - **where**: Optional JSON string with filter conditions (e.g., {"status": "failed"})
+    """
+    where_conditions = None
+    if where:
+        try:
+            where_conditions = json.loads(where)
+            if not isinstance(where_conditions, dict):
+                raise HTTPException(status_code=400, detail="Where conditions must be a JSON object")
+        except json.JSONDecodeError:
+            raise HTTPException(status_code=400, detail="Invalid JSON in where parameter")
 
-    except Exception as e:
-        print(f"🔥 Upload failed: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+    return get_ingestion_jobs_data(where_conditions)
+
+@router.get("/job/{jobId}",
+    responses={
+        200: {"description": "Ingestion job retrieved successfully"},
+        404: {"description": "Ingestion job not found"},
+        500: {"description": "Internal server error"},
+        503: {"description": "Database connection error"}
+    }
+)
+def get_ingestion_job(
+    jobId: str,
+    api_key: str = Depends(api_validation)
+):
+    """
+    Get the status and progress of an ingestion job.
+
+    - **jobId**: The unique identifier of the job
+
+    status is one of queued, running, succeeded, failed or cancelled; progress
+    is reported in chunksTotal, chunksEmbedded and chunksInserted.
+    """
+    return get_ingestion_job_data(jobId)
+
+@router.post("/job/{jobId}/cancel",
+    responses={
+        200: {"description": "Cancellation requested"},
+        409: {"description": "Job not found or already finished"},
+        500: {"description": "Internal server error"},
+        503: {"description": "Database connection error"}
+    }
+)
+def cancel_ingestion_job_data(
+    jobId: str,
+    api_key: str = Depends(api_validation)
+):
+    """
+    Cancel an ingestion job. A queued job is cancelled immediately; a running
+    job stops at its next progress update.
+
+    - **jobId**: The unique identifier of the job
+    """
+    return cancel_ingestion_job(jobId)
+
+@router.post("/job/{jobId}/retry",
+    responses={
+        200: {"description": "Job queued again"},
+        409: {"description": "Job not found or not in a retryable state"},
+        500: {"description": "Internal server error"},
+        503: {"description": "Database connection error"}
+    }
+)
+def retry_ingestion_job_data(
+    jobId: str,
+    api_key: str = Depends(api_validation)
+):
+    """
+    Queue a failed or cancelled ingestion job again.
+
+    - **jobId**: The unique identifier of the job
+    """
+    return retry_ingestion_job(jobId)
+
+@router.get("/jobs/stats")
+async def ingestion_worker_stats(api_key: str = Depends(api_validation)):
+    """
+    Ingestion worker pool counters for this process (succeeded, failed, cancelled, active jobs)
+    and pipeline throughput per stage (chunks/sec).
+    """
+    return {"results": {**get_ingestion_pool().stats(), "pipeline": get_pipeline_stats()}}
 
 @router.post("/rerank")
 async def rerank_documents(request: RerankRequest, api_key: str = Depends(api_validation)):
+    """
+    Rerank documents for a query. **backend** picks "voyage" (API, uses **model**),
+    "lexical" (local BM25) or "onnx" (local cross-encoder); defaults to RERANK_BACKEND.
+    """
     try:
-        response = re_rank(request.query, request.documents, request.model, request.top_k)
+        response = await re_rank_async(request.query, request.documents, request.model, request.top_k, request.backend)
         return {"results": response}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.get("/extractor/stats")
+async def extraction_pool_stats(api_key: str = Depends(api_validation)):
+    """
+    Extraction process pool counters (queue depth, busy workers, timeouts, recycled workers, per-format timings).
+    """
+    pool = get_extraction_pool()
+    if pool is None:
+        return {"results": {"enabled": False}}
+    return {"results": {"enabled": True, **pool.stats()}}
+
+@router.get("/db/stats")
+async def database_pool_stats(api_key: str = Depends(api_validation)):
+    """
+    Connection pool statistics (checkouts, waits, timeouts, in-use count, checkout times).
+    """
+    return {"results": db_settings.get_pool_stats()}
+
+@router.get("/embedding/cache/stats")
+async def embedding_cache_stats(api_key: str = Depends(api_validation)):
+    """
+    Embedding cache counters (memory/store hits, misses, evictions, hit rate).
+    """
+    cache = get_embedding_cache()
+    if cache is None:
+        return {"results": {"enabled": False}}
+    return {"results": {"enabled": True, **cache.stats()}}
+
+@router.get("/search/cache/stats")
+async def answer_cache_stats(api_key: str = Depends(api_validation)):
+    """
+    /search answer cache counters (exact/semantic hits, misses, invalidations, evictions, hit rate).
+    """
+    cache = get_answer_cache()
+    if cache is None:
+        return {"results": {"enabled": False}}
+    return {"results": {"enabled": True, **cache.stats()}}
+
 @router.post("/auth/register", status_code=201)
-async def register_user(request: RegisterRequest, api_key: str = Depends(api_validation)):
+def register_user(request: RegisterRequest, api_key: str = Depends(api_validation)):
     """
     Register a new user.
     """
     return register_user_controller(request.dict())
 
 @router.post("/auth/login", status_code=200)
-async def login_user(request: AuthRequest, api_key: str = Depends(api_validation)):
+def login_user(request: AuthRequest, api_key: str = Depends(api_validation)):
     """
     Login a user.
     """
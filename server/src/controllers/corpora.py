@@ -1,4 +1,5 @@
 from models.corpora import CorporaModel
+from controllers.document_chunk import invalidate_answer_cache
 from fastapi import HTTPException
 import logging
 
@@ -47,6 +48,7 @@ def create_corpus_data(corpus_data_input):
 
 def update_corpus_data(corpus_data_input, corpusId):
     response = corpus_data.update_corpus(corpus_data_input, corpusId)
+    invalidate_answer_cache()
     
     if "error" in response:
         status_code = response.get("status_code", 500)
@@ -60,6 +62,7 @@ def update_corpus_data(corpus_data_input, corpusId):
 
 def delete_corpus_data(corpusId):
     response = corpus_data.delete_corpus(corpusId)
+    invalidate_answer_cache()
     
     if "error" in response:
         status_code = response.get("status_code", 500)
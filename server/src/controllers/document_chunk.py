@@ -1,16 +1,63 @@
 from models.document_chunk import DocumentChunkModel
-from services.embedding import get_embedding
-from services.llm_services import llm_service
-from services.reranker import re_rank
+from services.embedding import get_embedding, get_embedding_async, embed_in_batches
+from services.llm_services import llm_service_async, llm_service_stream
+from services.reranker import re_rank_async
+from services.vector_index import create_search_backend
+from services.answer_cache import AnswerCache
 from fastapi import HTTPException
+from core.config import settings
+from typing import Optional
+import asyncio
+import json
 import logging
+import time
 
 logger = logging.getLogger(__name__)
 
-documents_data = DocumentChunkModel()
+# Quantization is backend specific ("halfvec"/"binary" in Postgres, "int8"/"binary"
+# for "exact"); an unsupported combination fails here rather than on every search
+if settings.SEARCH_QUANTIZATION and settings.SEARCH_BACKEND not in ("postgres", "exact"):
+    raise ValueError(f"SEARCH_QUANTIZATION is not supported by the {settings.SEARCH_BACKEND!r} search backend; use 'postgres' or 'exact'.")
 
-def get_documents_chunks(where_conditions=None):
-    response = documents_data.get_document_chunks(where_conditions)
+documents_data = DocumentChunkModel(
+    quantization=settings.SEARCH_QUANTIZATION if settings.SEARCH_BACKEND == "postgres" else None,
+    rescore_factor=settings.SEARCH_RESCORE_FACTOR,
+    rrf_k=settings.HYBRID_RRF_K,
+    hybrid_candidate_factor=settings.HYBRID_CANDIDATE_FACTOR,
+)
+backend_options = {}
+if settings.SEARCH_BACKEND == "exact":
+    backend_options = {"quantization": settings.SEARCH_QUANTIZATION, "rescore_factor": settings.SEARCH_RESCORE_FACTOR}
+documents_data.search_backend = create_search_backend(
+    settings.SEARCH_BACKEND,
+    documents_data,
+    metric=settings.SEARCH_METRIC,
+    index_dir=settings.VECTOR_INDEX_DIR,
+    refresh_interval=settings.VECTOR_INDEX_REFRESH_SECONDS,
+    **backend_options,
+)
+
+answer_cache: Optional[AnswerCache] = None
+if settings.ANSWER_CACHE_ENABLED:
+    answer_cache = AnswerCache(
+        documents_data.get_corpus_signature,
+        max_entries=settings.ANSWER_CACHE_MAX_ENTRIES,
+        semantic_threshold=settings.ANSWER_CACHE_SEMANTIC_THRESHOLD,
+        ttl=settings.ANSWER_CACHE_TTL_SECONDS or None,
+        signature_ttl=settings.ANSWER_CACHE_SIGNATURE_TTL_SECONDS,
+    )
+
+def get_answer_cache() -> Optional[AnswerCache]:
+    """Returns the /search answer cache, or None when ANSWER_CACHE_ENABLED is false."""
+    return answer_cache
+
+def invalidate_answer_cache(corpus_key=None):
+    """Makes the next /search re-check the corpus signature after documents or chunks were written."""
+    if answer_cache is not None:
+        answer_cache.invalidate(corpus_key)
+
+def get_documents_chunks(where_conditions=None, fields=None, after=None, limit=100):
+    response = documents_data.get_document_chunks(where_conditions, fields, after, limit)
     
     if "error" in response:
         status_code = response.get("status_code", 500)
@@ -22,6 +69,16 @@ def get_documents_chunks(where_conditions=None):
     
     return response
 
+def export_documents_chunks(where_conditions=None, fields=None):
+    """
+    Returns a generator over every matching chunk, read through a
+    server-side cursor. Unknown fields raise a 400 before anything is read.
+    """
+    try:
+        return documents_data.iter_document_chunks(where_conditions, fields, itersize=settings.EXPORT_CURSOR_ITERSIZE)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 def get_document_chunk(chunk_id):
     response = documents_data.get_document_chunk(chunk_id)
     
@@ -52,12 +109,13 @@ def create_document_chunk(chunk_input_data):
             
         # Generate embedding for the chunkText
         try:
-            chunk_input_data["embeddingData"] = get_embedding("voyage-3-large", [chunk_input_data["chunkText"]])[0]
+            chunk_input_data["embeddingData"] = get_embedding(settings.EMBEDDING_MODEL, [chunk_input_data["chunkText"]], input_type="document")[0]
         except Exception as e:
             logger.error(f"Failed to generate embedding: {e}")
             raise HTTPException(status_code=500, detail=f"Failed to generate embedding: {str(e)}")
         
         response = documents_data.create_document_chunk(chunk_input_data)
+        invalidate_answer_cache()
         
         if "error" in response:
             status_code = response.get("status_code", 500)
@@ -74,6 +132,128 @@ def create_document_chunk(chunk_input_data):
         logger.error(f"Error in create_document_chunk: {e}")
         raise HTTPException(status_code=500, detail=f"Failed to create document chunk: {str(e)}")
 
+def _validate_chunks(chunks_input_data):
+    if not chunks_input_data:
+        raise HTTPException(status_code=400, detail="Chunk data is required")
+
+    for chunk in chunks_input_data:
+        if "chunkText" not in chunk or not chunk["chunkText"]:
+            raise HTTPException(status_code=400, detail="Chunk text is required")
+        if "documentId" not in chunk or not chunk["documentId"]:
+            raise HTTPException(status_code=400, detail="Document ID is required")
+
+def embed_document_chunks(chunks_input_data, on_progress=None):
+    """
+    Sets "embeddingData" on every chunk in as few embedding requests as
+    possible. on_progress, if given, is called with the number embedded so far.
+    """
+    _validate_chunks(chunks_input_data)
+    try:
+        embeddings = embed_in_batches(settings.EMBEDDING_MODEL, [chunk["chunkText"] for chunk in chunks_input_data], input_type="document", on_progress=on_progress)
+        for chunk, embedding in zip(chunks_input_data, embeddings):
+            chunk["embeddingData"] = embedding
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Failed to generate embedding: {e}")
+        raise HTTPException(status_code=500, detail=f"Failed to generate embedding: {str(e)}")
+    return chunks_input_data
+
+def store_document_chunks(chunks_input_data):
+    """
+    Upserts embedded chunks by (documentId, chunkIndex) in one transaction and
+    returns them ordered by chunkIndex.
+    """
+    _validate_chunks(chunks_input_data)
+    response = documents_data.upsert_document_chunks(chunks_input_data)
+    invalidate_answer_cache()
+
+    if "error" in response:
+        status_code = response.get("status_code", 500)
+        raise HTTPException(status_code=status_code, detail=response["error"])
+
+    return response
+
+def delete_document_chunks(chunk_ids):
+    """Deletes chunks by ID, e.g. to undo a partially ingested document. Returns the number deleted."""
+    deleted = documents_data.delete_document_chunks(chunk_ids)
+    invalidate_answer_cache()
+    return deleted
+
+def stage_document_chunks(chunks_input_data):
+    """
+    Writes embedded chunks of a document version being ingested under their
+    "stagingId"; they become searchable with apply_staged_document_chunks().
+    """
+    _validate_chunks(chunks_input_data)
+    response = documents_data.stage_document_chunks(chunks_input_data)
+
+    if "error" in response:
+        status_code = response.get("status_code", 500)
+        raise HTTPException(status_code=status_code, detail=response["error"])
+
+    return response
+
+def apply_staged_document_chunks(staging_id, document_input_data, chunk_count, content_hash):
+    """
+    Stores the document row and its staged chunks in one transaction and
+    deletes its chunks past chunkIndex chunk_count. Returns the written
+    chunks and the number deleted.
+    """
+    response = documents_data.apply_staged_chunks(staging_id, document_input_data, chunk_count, content_hash)
+    invalidate_answer_cache()
+
+    if "error" in response:
+        status_code = response.get("status_code", 500)
+        raise HTTPException(status_code=status_code, detail=response["error"])
+
+    if response.get("results") is None:
+        raise HTTPException(status_code=409, detail=f"Document {document_input_data.get('documentId')} already exists in another corpus")
+
+    return response
+
+def discard_staged_document_chunks(staging_ids):
+    """Deletes the staged chunks of failed ingestion runs. Returns the number deleted."""
+    return documents_data.discard_staged_chunks(staging_ids)
+
+def get_document_chunk_hashes(document_id):
+    """Returns chunkId, chunkIndex and chunkHash of the stored chunks of a document."""
+    response = documents_data.get_chunk_hashes(document_id)
+
+    if "error" in response:
+        status_code = response.get("status_code", 500)
+        raise HTTPException(status_code=status_code, detail=response["error"])
+
+    return response["results"]
+
+def create_document_chunks(chunks_input_data, progress=None):
+    """
+    Embeds and upserts all chunks of a document in one transaction; a chunk
+    at an existing (documentId, chunkIndex) replaces the stored one.
+    Returns the written chunks ordered by chunkIndex.
+
+    progress, if given, is called with chunksEmbedded/chunksInserted counts.
+    """
+    try:
+        # Generate embeddings for every chunkText in as few requests as possible
+        on_progress = (lambda done: progress(chunksEmbedded=done)) if progress else None
+        embed_document_chunks(chunks_input_data, on_progress=on_progress)
+
+        if progress:
+            progress(chunksEmbedded=len(chunks_input_data))
+
+        response = store_document_chunks(chunks_input_data)
+
+        if progress:
+            progress(chunksInserted=len(response.get("results") or []))
+
+        return response
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error in create_document_chunks: {e}")
+        raise HTTPException(status_code=500, detail=f"Failed to create document chunks: {str(e)}")
+
 def update_document_chunk(chunk_id, chunk_input_data):
     if not chunk_id:
         raise HTTPException(status_code=400, detail="Chunk ID is required")
@@ -82,6 +262,7 @@ def update_document_chunk(chunk_id, chunk_input_data):
         raise HTTPException(status_code=400, detail="No data provided for update")
     
     response = documents_data.update_document_chunk(chunk_id, chunk_input_data)
+    invalidate_answer_cache()
     
     if "error" in response:
         status_code = response.get("status_code", 500)
@@ -98,60 +279,25 @@ def delete_document_chunk(chunk_id):
         raise HTTPException(status_code=400, detail="Chunk ID is required")
         
     success = documents_data.delete_document_chunk(chunk_id)
+    invalidate_answer_cache()
     
     if not success:
         raise HTTPException(status_code=404, detail=f"Document chunk with ID {chunk_id} not found")
     
     return {"results": [{"message": "Document chunk deleted successfully"}]}
 
-def search_document_chunk(question, top_k, model, corpus_key, threshold):
-    if not question:
-        raise HTTPException(status_code=400, detail="Search question is required")
-        
-    if not model:
-        raise HTTPException(status_code=400, detail="Embedding model is required")
-    
-    try:
-        # Generate embedding for the question
-        question_embedding = get_embedding(model, [question])
-        if not question_embedding or len(question_embedding) == 0:
-            raise HTTPException(status_code=500, detail="Failed to generate embedding for the question")
-            
-        question_embedding = question_embedding[0]
-        
-        # Search for relevant chunks
-        chunks = documents_data.search_document_chunk(question_embedding, top_k, corpus_key, threshold)
-        
-        if not chunks or len(chunks) == 0:
-            return {"results": ["No relevant information found for your question."]}
-        
-        # Extract text from chunks for reranking
-        re_ranker_data = []
-        for chunk in chunks:
-            re_ranker_data.append(chunk["chunkText"])
-        
-        # Rerank the results
-        try:
-            re_rank_result = re_rank(question, re_ranker_data, top_k=top_k)
-        except Exception as e:
-            logger.error(f"Reranking failed: {e}")
-            # Fall back to original chunks if reranking fails
-            context = "\n\n\n".join([chunk["chunkText"] for chunk in chunks[:2]])
-        else:
-            # Build context from reranked results
-            context = ""
-            for result in re_rank_result:
-                context += result[1] + "\n\n\n"
-        
-        # Save context for debugging (optional)
-        try:
-            with open("test.txt", "w", encoding="utf-8") as file:
-                file.write(context)
-        except Exception as e:
-            logger.warning(f"Failed to write context to file: {e}")
-        
-        # Generate response using LLM
-        prompt = f"""
+def _build_context(chunks, re_rank_result):
+    if re_rank_result is None:
+        # Fall back to original chunks if reranking fails
+        return "\n\n\n".join([chunk["chunkText"] for chunk in chunks[:2]])
+    # Build context from reranked results
+    context = ""
+    for result in re_rank_result:
+        context += result[1] + "\n\n\n"
+    return context
+
+def _build_answer_prompt(question, context):
+    return f"""
         question: {question}
         You are a helpful assistant, your task is to summarize the given context of information.
 
@@ -159,16 +305,184 @@ def search_document_chunk(question, top_k, model, corpus_key, threshold):
 
         If the data is not sufficient to provide an answer, just strictly reply with "Not enough context to provide information."
         """
-        
+
+def _search_options(question, hybrid, vector_weight, text_weight):
+    # Hybrid search adds a full-text query on the question, fused with the vector results
+    if not (settings.SEARCH_HYBRID if hybrid is None else hybrid):
+        return {}
+    return {
+        "text_query": question,
+        "vector_weight": settings.HYBRID_VECTOR_WEIGHT if vector_weight is None else vector_weight,
+        "text_weight": settings.HYBRID_TEXT_WEIGHT if text_weight is None else text_weight,
+    }
+
+def _cache_params(top_k, model, threshold, ef_search, probes, reranker, search_options):
+    # Everything besides the question that changes the answer
+    return {"top_k": top_k, "model": model, "threshold": threshold, "ef_search": ef_search, "probes": probes,
+            "reranker": reranker or settings.RERANK_BACKEND,
+            "hybrid": [search_options.get("vector_weight"), search_options.get("text_weight")] if search_options else None}
+
+def _with_cache_info(response, hit, level=None, **details):
+    response["cache"] = {"hit": hit, "level": level, **details}
+    return response
+
+def _semantic_hit(cache, corpus_key, question_embedding, params, signature):
+    match = cache.get_semantic(corpus_key, question_embedding, params, signature)
+    if match is None:
+        return None
+    response, similarity, cached_question = match
+    return _with_cache_info(response, True, "semantic", similarity=round(similarity, 4), question=cached_question)
+
+async def _retrieve(question, top_k, model, corpus_key, threshold, ef_search, probes, use_cache, reranker, search_options, timings=None):
+    """
+    Cache lookup, question embedding, chunk retrieval and rerank shared by
+    the /search flows. Returns either {"response": ...}, a finished answer
+    (cache hit, or nothing relevant found) with its "cache" info, or
+    {"chunks", "reranked", "store"} where store(response) caches the answer
+    generated from them. timings, if given, receives embed/search/rerank
+    durations in seconds.
+    """
+    def timed(stage, since):
+        now = time.perf_counter()
+        if timings is not None:
+            timings[stage] = round(now - since, 4)
+        return now
+
+    # Answers are cached per corpus until its chunks change
+    cache = answer_cache if use_cache else None
+    params = _cache_params(top_k, model, threshold, ef_search, probes, reranker, search_options)
+    # Reading the corpus signature may query the database
+    signature = await asyncio.to_thread(cache.signature, corpus_key) if cache is not None else None
+    if signature is not None:
+        cached = cache.get_exact(corpus_key, question, params, signature)
+        if cached is not None:
+            return {"response": _with_cache_info(cached, True, "exact")}
+
+    stage = time.perf_counter()
+    question_embedding = await get_embedding_async(model, [question], input_type="query")
+    if not question_embedding or len(question_embedding) == 0:
+        raise HTTPException(status_code=500, detail="Failed to generate embedding for the question")
+    question_embedding = question_embedding[0]
+    stage = timed("embed", stage)
+
+    if signature is not None:
+        cached = _semantic_hit(cache, corpus_key, question_embedding, params, signature)
+        if cached is not None:
+            return {"response": cached}
+
+    def store(response):
+        if signature is not None:
+            cache.put(corpus_key, question, params, question_embedding, response, signature)
+
+    chunks = await documents_data.search_document_chunk_async(question_embedding, top_k, corpus_key, threshold, ef_search, probes, **search_options)
+    if isinstance(chunks, dict) and "error" in chunks:
+        raise HTTPException(status_code=chunks.get("status_code", 500), detail=chunks["error"])
+    stage = timed("search", stage)
+
+    if not chunks:
+        response = {"results": ["No relevant information found for your question."]}
+        store(response)
+        return {"response": _with_cache_info(response, False)}
+
+    try:
+        re_rank_result = await re_rank_async(question, [chunk["chunkText"] for chunk in chunks], top_k=top_k, backend=reranker)
+    except Exception as e:
+        logger.error(f"Reranking failed: {e}")
+        re_rank_result = None
+    timed("rerank", stage)
+
+    # Answers built from the unranked fallback context are not cached
+    return {"chunks": chunks, "reranked": re_rank_result, "store": store if re_rank_result is not None else (lambda response: None)}
+
+async def search_document_chunk_async(question, top_k, model, corpus_key, threshold, ef_search=None, probes=None, use_cache=True, reranker=None,
+                                      hybrid=None, vector_weight=None, text_weight=None):
+    """
+    Answers a question from the corpus: the embedding, vector search, rerank
+    and LLM calls are awaited, so one slow search does not hold up other
+    requests on the worker.
+    """
+    if not question:
+        raise HTTPException(status_code=400, detail="Search question is required")
+
+    # Questions must be embedded with the same model as the stored chunks
+    model = model or settings.EMBEDDING_MODEL
+
+    try:
+        search_options = _search_options(question, hybrid, vector_weight, text_weight)
+        retrieved = await _retrieve(question, top_k, model, corpus_key, threshold, ef_search, probes, use_cache, reranker, search_options)
+        if "response" in retrieved:
+            return retrieved["response"]
+
+        prompt = _build_answer_prompt(question, _build_context(retrieved["chunks"], retrieved["reranked"]))
+
         try:
-            result = llm_service(prompt, "", "this is a data about some information")
-            return {"results": [result], "chunks": re_rank_result}
+            result = await llm_service_async(prompt, "", "this is a data about some information")
         except Exception as e:
             logger.error(f"LLM service failed: {e}")
             raise HTTPException(status_code=500, detail=f"Failed to generate response: {str(e)}")
-            
+
+        response = {"results": [result], "chunks": retrieved["reranked"]}
+        retrieved["store"](response)
+        return _with_cache_info(response, False)
+
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Error in search_document_chunk: {e}")
+        logger.error(f"Error in search_document_chunk_async: {e}")
         raise HTTPException(status_code=500, detail=f"Search failed: {str(e)}")
+
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+async def search_document_chunk_stream(question, top_k, model, corpus_key, threshold, ef_search=None, probes=None, use_cache=True, reranker=None,
+                                       hybrid=None, vector_weight=None, text_weight=None):
+    """
+    Streaming version of search_document_chunk_async() as server-sent events:
+
+    - chunks: the reranked chunks, sent as soon as retrieval is done
+    - token: pieces of the answer as the LLM produces them
+    - done: the full answer, cache info and per-stage timings in seconds
+      (embed, search, rerank, generate, first_token, total)
+    - error: sent instead of done when a stage fails mid-stream
+
+    The question must be validated before the stream starts.
+    """
+    model = model or settings.EMBEDDING_MODEL
+    timings = {}
+    started = time.perf_counter()
+
+    def finish(answer, cache_info):
+        timings["total"] = round(time.perf_counter() - started, 4)
+        return _sse("done", {"results": [answer], "cache": cache_info, "timings": timings})
+
+    try:
+        search_options = _search_options(question, hybrid, vector_weight, text_weight)
+        retrieved = await _retrieve(question, top_k, model, corpus_key, threshold, ef_search, probes, use_cache, reranker, search_options, timings)
+        if "response" in retrieved:
+            response = retrieved["response"]
+            yield _sse("chunks", {"chunks": response.get("chunks") or [], "cache": response["cache"]})
+            yield _sse("token", {"text": response["results"][0]})
+            yield finish(response["results"][0], response["cache"])
+            return
+
+        stage = time.perf_counter()
+        cache_info = {"hit": False, "level": None}
+        yield _sse("chunks", {"chunks": retrieved["reranked"], "cache": cache_info})
+
+        prompt = _build_answer_prompt(question, _build_context(retrieved["chunks"], retrieved["reranked"]))
+        pieces = []
+        async for piece in llm_service_stream(prompt, "", "this is a data about some information"):
+            if not pieces:
+                timings["first_token"] = round(time.perf_counter() - started, 4)
+            pieces.append(piece)
+            yield _sse("token", {"text": piece})
+        timings["generate"] = round(time.perf_counter() - stage, 4)
+
+        answer = "".join(pieces)
+        retrieved["store"]({"results": [answer], "chunks": retrieved["reranked"]})
+        yield finish(answer, cache_info)
+    except Exception as e:
+        logger.error(f"Error in search_document_chunk_stream: {e}")
+        timings["total"] = round(time.perf_counter() - started, 4)
+        detail = e.detail if isinstance(e, HTTPException) else str(e)
+        yield _sse("error", {"detail": f"Search failed: {detail}", "timings": timings})
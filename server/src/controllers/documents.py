@@ -1,4 +1,6 @@
 from models.documents import DocumentsModel
+from controllers.document_chunk import invalidate_answer_cache
+from core.config import settings
 from fastapi import HTTPException
 import logging
 
@@ -6,8 +8,8 @@ logger = logging.getLogger(__name__)
 
 documents_data = DocumentsModel()
 
-def get_documents_data(where_conditions=None):
-    response = documents_data.get_documents(where_conditions)
+def get_documents_data(where_conditions=None, fields=None, after=None, limit=100):
+    response = documents_data.get_documents(where_conditions, fields, after, limit)
     
     if "error" in response:
         status_code = response.get("status_code", 500)
@@ -19,6 +21,17 @@ def get_documents_data(where_conditions=None):
     
     return response
 
+def export_documents_data(where_conditions=None, fields=None):
+    """
+    Returns a generator over every matching document, read through a
+    server-side cursor. Invalid fields or conditions raise a 400 before
+    anything is read.
+    """
+    try:
+        return documents_data.iter_documents(where_conditions, fields, itersize=settings.EXPORT_CURSOR_ITERSIZE)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 def get_document_data(document_id):
     document = documents_data.get_document(document_id)
     
@@ -37,6 +50,7 @@ def get_document_data(document_id):
 
 def update_document_data(document_data_input, docId):
     updated_document = documents_data.update_document(docId, document_data_input)
+    invalidate_answer_cache()
     
     if "error" in updated_document:
         status_code = updated_document.get("status_code", 500)
@@ -53,6 +67,7 @@ def update_document_data(document_data_input, docId):
 
 def delete_document_data(document_id):
     response = documents_data.delete_document(document_id)
+    invalidate_answer_cache()
     
     if "error" in response:
         status_code = response.get("status_code", 500)
@@ -81,4 +96,15 @@ def create_document_data(document_input_data):
     if "results" in response and not isinstance(response["results"], list):
         response["results"] = [response["results"]] if response["results"] is not None else []
     
-    return response
\ No newline at end of file
+    return response
+
+def get_document_states_data(document_ids):
+    """Returns {documentId: {"documentId", "corpusId", "contentHash"}} for the documents that exist."""
+    response = documents_data.get_document_states(document_ids)
+
+    if "error" in response:
+        status_code = response.get("status_code", 500)
+        raise HTTPException(status_code=status_code, detail=response["error"])
+
+    return response["results"]
+
@@ -0,0 +1,60 @@
+from models.ingestion_jobs import IngestionJobModel
+from services.ingestion_queue import get_ingestion_pool
+from core.config import settings
+from fastapi import HTTPException
+import logging
+
+logger = logging.getLogger(__name__)
+
+jobs_data = IngestionJobModel()
+
+def enqueue_ingestion_job(job_input_data):
+    if not job_input_data.get("payload") and not job_input_data.get("sourceUrl"):
+        raise HTTPException(status_code=400, detail="Either a file or a URL must be provided.")
+
+    job_input_data.setdefault("maxAttempts", settings.INGESTION_MAX_ATTEMPTS)
+    response = jobs_data.create_job(job_input_data)
+
+    if "error" in response:
+        status_code = response.get("status_code", 500)
+        raise HTTPException(status_code=status_code, detail=response["error"])
+
+    get_ingestion_pool().notify()
+    return response
+
+def get_ingestion_jobs_data(where_conditions=None):
+    response = jobs_data.get_jobs(where_conditions)
+
+    if "error" in response:
+        status_code = response.get("status_code", 500)
+        raise HTTPException(status_code=status_code, detail=response["error"])
+
+    return response
+
+def get_ingestion_job_data(job_id):
+    response = jobs_data.get_job(job_id)
+
+    if "error" in response:
+        status_code = response.get("status_code", 500)
+        raise HTTPException(status_code=status_code, detail=response["error"])
+
+    return response
+
+def cancel_ingestion_job(job_id):
+    response = jobs_data.cancel_job(job_id)
+
+    if "error" in response:
+        status_code = response.get("status_code", 500)
+        raise HTTPException(status_code=status_code, detail=response["error"])
+
+    return response
+
+def retry_ingestion_job(job_id):
+    response = jobs_data.retry_job(job_id)
+
+    if "error" in response:
+        status_code = response.get("status_code", 500)
+        raise HTTPException(status_code=status_code, detail=response["error"])
+
+    get_ingestion_pool().notify()
+    return response
@@ -12,6 +12,92 @@ class Settings:
     # VOYAGE_API_KEY: str = os.getenv("VOYAGE_API_KEY","")
     VOYAGE_API_KEY: str =  os.getenv("VOYAGE_API_KEY")
     GEMINI_API_KEY: str = os.getenv("GEMINI_API_KEY")
+    EMBEDDING_MODEL: str = os.getenv("EMBEDDING_MODEL", "voyage-3-large")
+
+    # Similarity search: "postgres" (pgvector) or an in-process backend ("ivf" or "exact")
+    SEARCH_BACKEND: str = os.getenv("SEARCH_BACKEND", "postgres")
+    SEARCH_METRIC: str = os.getenv("SEARCH_METRIC", "cosine")
+    VECTOR_INDEX_DIR: str = os.getenv("VECTOR_INDEX_DIR", "./vector_indexes")
+    VECTOR_INDEX_REFRESH_SECONDS: float = float(os.getenv("VECTOR_INDEX_REFRESH_SECONDS", 30))
+    # Quantized first pass with full-precision re-scoring: "halfvec"/"binary" for
+    # postgres, "int8"/"binary" for the exact backend; empty to disable
+    SEARCH_QUANTIZATION: str = os.getenv("SEARCH_QUANTIZATION", "") or None
+    SEARCH_RESCORE_FACTOR: int = int(os.getenv("SEARCH_RESCORE_FACTOR", 4))
+    # Hybrid search: full-text ("chunkTextSearch") and vector results merged by weighted
+    # reciprocal rank fusion; each side fetches top_k * HYBRID_CANDIDATE_FACTOR candidates
+    SEARCH_HYBRID: bool = os.getenv("SEARCH_HYBRID", "false").lower() == "true"
+    HYBRID_VECTOR_WEIGHT: float = float(os.getenv("HYBRID_VECTOR_WEIGHT", 1.0))
+    HYBRID_TEXT_WEIGHT: float = float(os.getenv("HYBRID_TEXT_WEIGHT", 1.0))
+    HYBRID_RRF_K: int = int(os.getenv("HYBRID_RRF_K", 60))
+    HYBRID_CANDIDATE_FACTOR: int = int(os.getenv("HYBRID_CANDIDATE_FACTOR", 4))
+
+    # Embedding cache: in-process LRU plus an optional Postgres-backed tier
+    EMBEDDING_CACHE_ENABLED: bool = os.getenv("EMBEDDING_CACHE_ENABLED", "true").lower() == "true"
+    EMBEDDING_CACHE_MEMORY_SIZE: int = int(os.getenv("EMBEDDING_CACHE_MEMORY_SIZE", 10000))
+    EMBEDDING_CACHE_PERSIST: bool = os.getenv("EMBEDDING_CACHE_PERSIST", "true").lower() == "true"
+    EMBEDDING_CACHE_MAX_ROWS: int = int(os.getenv("EMBEDDING_CACHE_MAX_ROWS", 1000000))
+
+    # Reranker used when a request does not pick one: "voyage" (API), "lexical" (local BM25)
+    # or "onnx" (local cross-encoder; RERANK_ONNX_MODEL_DIR holds model.onnx and tokenizer.json)
+    RERANK_BACKEND: str = os.getenv("RERANK_BACKEND", "voyage")
+    RERANK_ONNX_MODEL_DIR: str = os.getenv("RERANK_ONNX_MODEL_DIR", "")
+    RERANK_BATCH_SIZE: int = int(os.getenv("RERANK_BATCH_SIZE", 32))
+
+    # /search answer cache per corpus: exact question match, then question-embedding
+    # similarity >= ANSWER_CACHE_SEMANTIC_THRESHOLD (empty to disable the semantic level).
+    # Corpus changes made by other processes are noticed within ANSWER_CACHE_SIGNATURE_TTL_SECONDS
+    ANSWER_CACHE_ENABLED: bool = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() == "true"
+    ANSWER_CACHE_MAX_ENTRIES: int = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", 1000))
+    ANSWER_CACHE_SEMANTIC_THRESHOLD: float = float(os.getenv("ANSWER_CACHE_SEMANTIC_THRESHOLD", 0.95) or 0) or None
+    ANSWER_CACHE_TTL_SECONDS: float = float(os.getenv("ANSWER_CACHE_TTL_SECONDS", 3600))
+    ANSWER_CACHE_SIGNATURE_TTL_SECONDS: float = float(os.getenv("ANSWER_CACHE_SIGNATURE_TTL_SECONDS", 5))
+
+    # Token counts for local chunking: "estimate" (no downloads) or "voyage"
+    # (the embedding model's Hugging Face tokenizer, needs the tokenizers package)
+    CHUNK_TOKENIZER: str = os.getenv("CHUNK_TOKENIZER", "estimate")
+
+    # chunk_type="auto": overlapping windows (in tokens) chunked by the LLM concurrently
+    AUTO_CHUNK_WINDOW_TOKENS: int = int(os.getenv("AUTO_CHUNK_WINDOW_TOKENS", 3000))
+    AUTO_CHUNK_WINDOW_OVERLAP: int = int(os.getenv("AUTO_CHUNK_WINDOW_OVERLAP", 300))
+    AUTO_CHUNK_CONCURRENCY: int = int(os.getenv("AUTO_CHUNK_CONCURRENCY", 4))
+    AUTO_CHUNK_MAX_RETRIES: int = int(os.getenv("AUTO_CHUNK_MAX_RETRIES", 2))
+
+    # Text extraction runs in a pool of worker processes (0 = in the request thread)
+    EXTRACTION_WORKERS: int = int(os.getenv("EXTRACTION_WORKERS", 2))
+    EXTRACTION_TIMEOUT_SECONDS: float = float(os.getenv("EXTRACTION_TIMEOUT_SECONDS", 300))
+    EXTRACTION_MEMORY_LIMIT_MB: int = int(os.getenv("EXTRACTION_MEMORY_LIMIT_MB", 4096))
+    EXTRACTION_MAX_JOBS_PER_WORKER: int = int(os.getenv("EXTRACTION_MAX_JOBS_PER_WORKER", 50))
+    # Page-parallel PDF conversion: pages per worker job, ranges in flight (0 = one per worker)
+    # and the page count from which extract_text_in_pool() switches to it (0 = never)
+    PDF_PAGES_PER_RANGE: int = int(os.getenv("PDF_PAGES_PER_RANGE", 8))
+    PDF_MAX_IN_FLIGHT: int = int(os.getenv("PDF_MAX_IN_FLIGHT", 0))
+    PDF_PARALLEL_MIN_PAGES: int = int(os.getenv("PDF_PARALLEL_MIN_PAGES", 16))
+
+    # Background ingestion: worker threads per process polling the IngestionJobs table
+    INGESTION_WORKERS: int = int(os.getenv("INGESTION_WORKERS", 2))
+    INGESTION_POLL_SECONDS: float = float(os.getenv("INGESTION_POLL_SECONDS", 2))
+    INGESTION_MAX_ATTEMPTS: int = int(os.getenv("INGESTION_MAX_ATTEMPTS", 1))
+    # Ingestion pipeline stages: chunks per embedding batch, concurrent embed/store
+    # workers and batches allowed to wait between stages (backpressure)
+    INGESTION_BATCH_SIZE: int = int(os.getenv("INGESTION_BATCH_SIZE", 64))
+    INGESTION_EMBED_WORKERS: int = int(os.getenv("INGESTION_EMBED_WORKERS", 2))
+    INGESTION_STORE_WORKERS: int = int(os.getenv("INGESTION_STORE_WORKERS", 2))
+    INGESTION_QUEUE_SIZE: int = int(os.getenv("INGESTION_QUEUE_SIZE", 4))
+    # Running jobs without a progress update for this long are requeued on startup
+    INGESTION_STALE_SECONDS: int = int(os.getenv("INGESTION_STALE_SECONDS", 1800))
+
+    # GET /documents and /chunks: default and largest page size, and rows fetched per
+    # round trip by the server-side cursors behind /documents/export and /chunks/export
+    LIST_PAGE_SIZE: int = int(os.getenv("LIST_PAGE_SIZE", 100))
+    LIST_MAX_PAGE_SIZE: int = int(os.getenv("LIST_MAX_PAGE_SIZE", 1000))
+    EXPORT_CURSOR_ITERSIZE: int = int(os.getenv("EXPORT_CURSOR_ITERSIZE", 2000))
+
+    # Bulk ingestion (/process/documents): files per request and their combined size once
+    # archives are expanded, and files extracted / tagged concurrently within one job
+    BULK_INGEST_MAX_FILES: int = int(os.getenv("BULK_INGEST_MAX_FILES", 1000))
+    BULK_INGEST_MAX_MB: int = int(os.getenv("BULK_INGEST_MAX_MB", 512))
+    BULK_INGEST_EXTRACT_CONCURRENCY: int = int(os.getenv("BULK_INGEST_EXTRACT_CONCURRENCY", 4))
+    BULK_INGEST_TAG_CONCURRENCY: int = int(os.getenv("BULK_INGEST_TAG_CONCURRENCY", 4))
 
 
 settings = Settings()
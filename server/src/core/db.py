@@ -1,10 +1,27 @@
 import os
+import time
+import asyncio
+import threading
+import uuid
+import logging
+from contextlib import contextmanager, asynccontextmanager
 import psycopg2
+from psycopg2 import extensions
+from psycopg2.pool import ThreadedConnectionPool
 from psycopg2.extras import DictCursor
 from dotenv import load_dotenv
 
+# Optional async driver (psycopg 3) for async routes; without it async
+# callers fall back to the psycopg2 pool in a worker thread
+try:
+    from psycopg_pool import AsyncConnectionPool
+except ImportError:
+    AsyncConnectionPool = None
+
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 class Settings:
     # DB_NAME: str = os.getenv("DB_NAME")
     # DB_HOST: str = os.getenv("DB_HOST")
@@ -16,29 +33,268 @@ class Settings:
 # DB_NAME=RAG-ify
 # DB_USER=postgres
 # DB_PASS=radhe
-    
-    
+
+
     DB_NAME: str = "RAG-ify"
     DB_HOST: str = "localhost"
     DB_PASS: str = "radhe"
     DB_PORT: str = 5432
     DB_USER: str = "postgres"
-    
+
+    # Connection pool settings
+    DB_POOL_MIN: int = int(os.getenv("DB_POOL_MIN", 1))
+    DB_POOL_MAX: int = int(os.getenv("DB_POOL_MAX", 10))
+    DB_POOL_TIMEOUT: float = float(os.getenv("DB_POOL_TIMEOUT", 30))
+    # Idle connections older than this (seconds) are pinged before being handed out
+    DB_POOL_PING_AFTER: float = float(os.getenv("DB_POOL_PING_AFTER", 30))
+    # Async pool used by async routes (per worker process, per event loop)
+    DB_ASYNC_POOL_MIN: int = int(os.getenv("DB_ASYNC_POOL_MIN", 1))
+    DB_ASYNC_POOL_MAX: int = int(os.getenv("DB_ASYNC_POOL_MAX", 20))
+
+    def __init__(self):
+        self._pool = None
+        self._pool_pid = None
+        self._pool_lock = threading.Lock()
+        self._slots = None
+        self._last_used = {}
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            "checkouts": 0,
+            "waits": 0,
+            "timeouts": 0,
+            "discarded": 0,
+            "in_use": 0,
+            "total_checkout_time": 0.0,
+            "max_checkout_time": 0.0,
+        }
+        self._async_pool = None
+        self._async_pool_loop = None
+        self._async_pool_lock = None
+
+    def _get_pool(self):
+        """Create the process-wide pool lazily (once per worker process)."""
+        pid = os.getpid()
+        if self._pool is not None and self._pool_pid == pid:
+            return self._pool
+        with self._pool_lock:
+            if self._pool is None or self._pool_pid != pid:
+                self._pool = ThreadedConnectionPool(
+                    self.DB_POOL_MIN,
+                    self.DB_POOL_MAX,
+                    host=self.DB_HOST,
+                    database=self.DB_NAME,
+                    user=self.DB_USER,
+                    password=self.DB_PASS,
+                    port=self.DB_PORT,
+                    cursor_factory=DictCursor
+                )
+                self._pool_pid = pid
+                self._slots = threading.BoundedSemaphore(self.DB_POOL_MAX)
+                self._last_used = {}
+        return self._pool
+
+    def _is_healthy(self, conn):
+        """Cheap liveness check; only round-trips for connections idle a while."""
+        if conn.closed or conn.info.transaction_status == extensions.TRANSACTION_STATUS_UNKNOWN:
+            return False
+        last_used = self._last_used.get(id(conn))
+        if last_used is None or time.monotonic() - last_used > self.DB_POOL_PING_AFTER:
+            try:
+                cur = conn.cursor()
+                cur.execute("SELECT 1;")
+                cur.close()
+                conn.rollback()
+            except psycopg2.Error:
+                return False
+        return True
 
     def get_db_connection(self):
+        """
+        Checks a connection out of the pool.
+
+        Blocks up to DB_POOL_TIMEOUT seconds when every connection is in use.
+        Returns None when no healthy connection could be obtained. Every
+        connection must be handed back with release_db_connection().
+        """
         try:
-            conn = psycopg2.connect(
-                host=self.DB_HOST,
-                database=self.DB_NAME,
-                user=self.DB_USER,
-                password=self.DB_PASS,
-                port=self.DB_PORT,
-                cursor_factory=DictCursor
-            )
-            return conn
+            pool = self._get_pool()
         except Exception as e:
             print("Failed to connect:", e)
             return None
 
+        start = time.monotonic()
+        if not self._slots.acquire(blocking=False):
+            with self._stats_lock:
+                self._stats["waits"] += 1
+            if not self._slots.acquire(timeout=self.DB_POOL_TIMEOUT):
+                with self._stats_lock:
+                    self._stats["timeouts"] += 1
+                logger.error("Timed out waiting for a database connection from the pool")
+                return None
+
+        try:
+            conn = pool.getconn()
+            if not self._is_healthy(conn):
+                with self._stats_lock:
+                    self._stats["discarded"] += 1
+                self._last_used.pop(id(conn), None)
+                pool.putconn(conn, close=True)
+                conn = pool.getconn()
+        except Exception as e:
+            self._slots.release()
+            print("Failed to connect:", e)
+            return None
+
+        elapsed = time.monotonic() - start
+        with self._stats_lock:
+            self._stats["checkouts"] += 1
+            self._stats["in_use"] += 1
+            self._stats["total_checkout_time"] += elapsed
+            self._stats["max_checkout_time"] = max(self._stats["max_checkout_time"], elapsed)
+        return conn
+
+    def release_db_connection(self, conn):
+        """Returns a connection obtained from get_db_connection() to the pool."""
+        if conn is None:
+            return
+        try:
+            self._last_used[id(conn)] = time.monotonic()
+            # putconn rolls back any open transaction and drops broken connections
+            self._pool.putconn(conn, close=bool(conn.closed))
+        except Exception as e:
+            logger.error(f"Failed to return connection to pool: {e}")
+        finally:
+            with self._stats_lock:
+                self._stats["in_use"] -= 1
+            self._slots.release()
+
+    @contextmanager
+    def connection(self):
+        """
+        Context manager around get_db_connection()/release_db_connection().
+
+        Commits on success and rolls back if the block raises. Raises
+        psycopg2.OperationalError when no connection is available.
+        """
+        conn = self.get_db_connection()
+        if conn is None:
+            raise psycopg2.OperationalError("Database connection failed")
+        try:
+            yield conn
+            conn.commit()
+        except Exception:
+            if not conn.closed:
+                conn.rollback()
+            raise
+        finally:
+            self.release_db_connection(conn)
+
+    def iter_rows(self, query, params=None, itersize=2000, cursor_name=None):
+        """
+        Generator over the rows of query as dicts, read through a server-side
+        (named) cursor that fetches itersize rows at a time. The connection
+        is checked out on the first row and released once the generator is
+        exhausted or closed.
+        """
+        conn = self.get_db_connection()
+        try:
+            if conn is None:
+                raise psycopg2.OperationalError("Database connection failed")
+
+            cur = conn.cursor(name=cursor_name or f"iter_rows_{uuid.uuid4().hex}")
+            cur.itersize = itersize
+            cur.execute(query, params)
+            columns = None
+            for row in cur:
+                if columns is None:
+                    columns = [desc[0] for desc in cur.description]
+                yield dict(zip(columns, row))
+            cur.close()
+            conn.commit()
+        finally:
+            self.release_db_connection(conn)
+
+    @property
+    def async_available(self):
+        return AsyncConnectionPool is not None
+
+    def _conninfo(self):
+        return psycopg2.extensions.make_dsn(
+            host=self.DB_HOST,
+            dbname=self.DB_NAME,
+            user=self.DB_USER,
+            password=self.DB_PASS,
+            port=self.DB_PORT,
+        )
+
+    async def get_async_pool(self):
+        """
+        Opens the async pool lazily on the running event loop. Returns None
+        when psycopg 3 is not installed.
+        """
+        if AsyncConnectionPool is None:
+            return None
+        loop = asyncio.get_running_loop()
+        if self._async_pool is not None and self._async_pool_loop is loop:
+            return self._async_pool
+        if self._async_pool_lock is None or self._async_pool_loop is not loop:
+            self._async_pool_lock = asyncio.Lock()
+            self._async_pool_loop = loop
+            self._async_pool = None
+        async with self._async_pool_lock:
+            if self._async_pool is None:
+                pool = AsyncConnectionPool(
+                    self._conninfo(),
+                    min_size=self.DB_ASYNC_POOL_MIN,
+                    max_size=self.DB_ASYNC_POOL_MAX,
+                    timeout=self.DB_POOL_TIMEOUT,
+                    check=AsyncConnectionPool.check_connection,
+                    open=False,
+                )
+                await pool.open()
+                self._async_pool = pool
+        return self._async_pool
+
+    @asynccontextmanager
+    async def async_connection(self):
+        """
+        Async counterpart of connection(): yields a psycopg 3 connection,
+        committing on success and rolling back if the block raises.
+        """
+        pool = await self.get_async_pool()
+        if pool is None:
+            raise RuntimeError("psycopg 3 is not installed; async connections are unavailable")
+        async with pool.connection() as conn:
+            yield conn
+
+    async def close_async_pool(self):
+        if self._async_pool is not None:
+            await self._async_pool.close()
+        self._async_pool = None
+        self._async_pool_loop = None
+        self._async_pool_lock = None
+
+    def get_pool_stats(self):
+        """Snapshot of pool counters (checkout times are in seconds)."""
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats["avg_checkout_time"] = (
+            stats["total_checkout_time"] / stats["checkouts"] if stats["checkouts"] else 0.0
+        )
+        stats["min_size"] = self.DB_POOL_MIN
+        stats["max_size"] = self.DB_POOL_MAX
+        stats["idle"] = len(self._pool._pool) if self._pool is not None else 0
+        if self._async_pool is not None:
+            stats["async"] = self._async_pool.get_stats()
+        return stats
+
+    def close_pool(self):
+        """Closes every pooled connection, e.g. on application shutdown."""
+        with self._pool_lock:
+            if self._pool is not None and self._pool_pid == os.getpid():
+                self._pool.closeall()
+            self._pool = None
+            self._pool_pid = None
+
 
 settings = Settings()
@@ -105,7 +105,7 @@ class AuthModel:
             return {"error": "Failed to register user", "status_code": 500}
         finally:
             if conn:
-                conn.close()
+                settings.release_db_connection(conn)
     
     def login_user(self, email, password):
         """Authenticate a user with email and password."""
@@ -153,7 +153,7 @@ class AuthModel:
             return {"error": "Failed to login", "status_code": 500}
         finally:
             if conn:
-                conn.close()
+                settings.release_db_connection(conn)
     
     def change_password(self, user_id, current_password, new_password):
         """Change a user's password."""
@@ -210,7 +210,7 @@ class AuthModel:
             return {"error": f"Failed to change password: {str(e)}", "status_code": 500}
         finally:
             if conn:
-                conn.close()
+                settings.release_db_connection(conn)
     
     def reset_password_request(self, email):
         """Request a password reset (placeholder for email-based reset)."""
@@ -256,4 +256,4 @@ class AuthModel:
             return {"error": f"Failed to process password reset: {str(e)}", "status_code": 500}
         finally:
             if conn:
-                conn.close()
\ No newline at end of file
+                settings.release_db_connection(conn)
\ No newline at end of file
@@ -58,7 +58,7 @@ class CorporaModel:
             return {"error": f"Failed to retrieve corpora: {str(e)}", "status_code": 500}
         finally:
             if conn:
-                conn.close()
+                settings.release_db_connection(conn)
 
     def get_corpus(self, corpusId):
         conn = settings.get_db_connection()  
@@ -98,7 +98,7 @@ class CorporaModel:
             return {"error": f"Failed to retrieve corpus: {str(e)}", "status_code": 500}
         finally:
             if conn:
-                conn.close()
+                settings.release_db_connection(conn)
 
     def create_corpus(self, corpus_data_input):
         conn = settings.get_db_connection()
@@ -169,7 +169,7 @@ class CorporaModel:
 
         finally:
             if conn:
-                conn.close()
+                settings.release_db_connection(conn)
 
 
     def update_corpus(self, corpus_data_input, corpusId):
@@ -236,7 +236,7 @@ class CorporaModel:
 
         finally:
             if conn:
-                conn.close()
+                settings.release_db_connection(conn)
 
     def delete_corpus(self, corpusId):
         conn = settings.get_db_connection()  
@@ -290,4 +290,4 @@ class CorporaModel:
             return {"error": f"Failed to delete corpus: {str(e)}", "status_code": 500}
         finally:
             if conn:
-                conn.close()
+                settings.release_db_connection(conn)
@@ -1,31 +1,138 @@
 from core.db import settings
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import hashlib
+import uuid
 import logging
+import psycopg2
+from psycopg2.extras import execute_values
 
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO)
 
+# Columns returned for a chunk; the generated "chunkTextSearch" tsvector stays internal
+CHUNK_COLUMN_NAMES = ["chunkId", "documentId", "chunkIndex", "chunkText", "embeddingData", "metaData", "chunkHash", "createdAt", "updatedAt"]
+CHUNK_COLUMNS = ", ".join(f'"{name}"' for name in CHUNK_COLUMN_NAMES)
+C_CHUNK_COLUMNS = ", ".join(f'c."{name}"' for name in CHUNK_COLUMN_NAMES)
+# Listed and exported unless fields= asks for more; embedding vectors dominate row size
+DEFAULT_CHUNK_FIELDS = [name for name in CHUNK_COLUMN_NAMES if name != "embeddingData"]
+
+# Text search configuration of "chunkTextSearch" (ddl-schema/migrations/005)
+TEXT_SEARCH_CONFIG = "english"
+
+def content_hash(data):
+    """sha256 hex digest of file bytes or text, as stored in "contentHash" and "chunkHash"."""
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    return hashlib.sha256(data).hexdigest()
+
+def last_per_key(chunks, key):
+    """
+    Keeps the last of the chunks sharing a key (e.g. documentId and
+    chunkIndex), in first-seen order. A multi-row INSERT ... ON CONFLICT DO
+    UPDATE fails outright when two of its rows hit the same key.
+    """
+    return list({key(chunk): chunk for chunk in chunks}.values())
+
+def reciprocal_rank_fusion(result_lists, weights, k=60, key="chunkId"):
+    """
+    Merges ranked lists of rows by weighted reciprocal rank fusion: a row
+    scores sum(weight / (k + rank)) over the lists it appears in (rank from 1).
+    Returns the rows best first with an "rrfScore"; columns found in only one
+    list (e.g. "distance", "textRank") are kept.
+    """
+    scores = {}
+    rows = {}
+    for results, weight in zip(result_lists, weights):
+        for rank, row in enumerate(results, start=1):
+            row_id = row[key]
+            scores[row_id] = scores.get(row_id, 0.0) + weight / (k + rank)
+            merged = rows.setdefault(row_id, dict(row))
+            for column, value in row.items():
+                if merged.get(column) is None:
+                    merged[column] = value
+    fused = []
+    for row_id in sorted(scores, key=scores.get, reverse=True):
+        row = rows[row_id]
+        row["rrfScore"] = scores[row_id]
+        fused.append(row)
+    return fused
+
 class DocumentChunkModel:
-    def get_document_chunks(self, where_conditions=None):
+    # First-pass ORDER BY expressions for quantized Postgres search. They must
+    # match the expression indexes in ddl-schema/migrations/003.
+    QUANTIZED_ORDER_BY = {
+        "halfvec": 'c."embeddingData"::halfvec({dim}) <=> %(embedding)s::vector::halfvec({dim})',
+        "binary": 'binary_quantize(c."embeddingData")::bit({dim}) <~> binary_quantize(%(embedding)s::vector)',
+    }
+
+    def __init__(self, search_backend=None, quantization=None, rescore_factor=4, rrf_k=60, hybrid_candidate_factor=4):
+        # Optional in-process search backend (see services.vector_index).
+        # When None, similarity search runs in Postgres.
+        self.search_backend = search_backend
+        # Optional quantized first pass for Postgres search ("halfvec" or "binary")
+        if quantization and quantization not in self.QUANTIZED_ORDER_BY:
+            raise ValueError(f"Invalid quantization {quantization!r} for Postgres search. Must be one of {tuple(self.QUANTIZED_ORDER_BY)}.")
+        self.quantization = quantization
+        self.rescore_factor = rescore_factor
+        # Hybrid search: RRF constant and candidates fetched per side (x top_k)
+        self.rrf_k = rrf_k
+        self.hybrid_candidate_factor = hybrid_candidate_factor
+
+    def _build_list_query(self, where_conditions=None, fields=None, after=None, limit=None):
+        """
+        SELECT over "DocumentChunks" with equality filters, the given fields
+        (default DEFAULT_CHUNK_FIELDS) and keyset pagination on "chunkId".
+        """
+        fields = list(fields or DEFAULT_CHUNK_FIELDS)
+        invalid = [name for name in fields if name not in CHUNK_COLUMN_NAMES]
+        if invalid:
+            raise ValueError(f"Unknown fields: {', '.join(invalid)}")
+        # The cursor column is always returned so the next page can be requested
+        if "chunkId" not in fields:
+            fields.insert(0, "chunkId")
+
+        columns = ", ".join(f'"{name}"' for name in fields)
+        query = f'SELECT {columns} FROM "DocumentChunks"'
+        where_clauses = []
+        params = []
+
+        # Add WHERE clause if conditions are provided
+        if where_conditions and isinstance(where_conditions, dict) and where_conditions:
+            for key, value in where_conditions.items():
+                # Ensure the column name is valid to prevent SQL injection
+                if key in ["chunkId", "documentId", "chunkIndex", "chunkText", "metaData"]:
+                    where_clauses.append(f'"{key}" = %s')
+                    params.append(value)
+        if after:
+            where_clauses.append('"chunkId" > %s')
+            params.append(after)
+        if where_clauses:
+            query += " WHERE " + " AND ".join(where_clauses)
+
+        query += ' ORDER BY "chunkId"'
+        if limit is not None:
+            query += " LIMIT %s"
+            params.append(limit)
+        return query + ";", params
+
+    def get_document_chunks(self, where_conditions=None, fields=None, after=None, limit=100):
+        """
+        Returns one page of chunks ordered by chunkId, and in "next" the
+        cursor to pass as after= for the following page (None on the last).
+        """
+        try:
+            query, params = self._build_list_query(where_conditions, fields, after, limit + 1)
+        except ValueError as e:
+            return {"error": str(e), "status_code": 400}
+
         conn = settings.get_db_connection()  
         try:
+            if conn is None:
+                logger.error("Database connection failed")
+                return {"error": "Database connection failed", "status_code": 503}
+
             cur = conn.cursor()
-            
-            query = 'SELECT * FROM "DocumentChunks"'
-            params = []
-            
-            # Add WHERE clause if conditions are provided
-            if where_conditions and isinstance(where_conditions, dict) and where_conditions:
-                where_clauses = []
-                for key, value in where_conditions.items():
-                    # Ensure the column name is valid to prevent SQL injection
-                    if key in ["chunkId", "documentId", "chunkIndex", "chunkText", "metaData"]:
-                        where_clauses.append(f'"{key}" = %s')
-                        params.append(value)
-                
-                if where_clauses:
-                    query += " WHERE " + " AND ".join(where_clauses)
-            
-            query += ";"
             logger.info(f"Executing query: {query} with params: {params}")
             
             cur.execute(query, params)
@@ -36,22 +143,34 @@ class DocumentChunkModel:
             formatted_results = []
             if rows:
                 columns = [desc[0] for desc in cur.description]  # Extract column names
-                for row in rows:
+                for row in rows[:limit]:
                     formatted_results.append(dict(zip(columns, row)))  # Convert each row to dictionary
             
-            return {"results": formatted_results}
+            next_cursor = formatted_results[-1]["chunkId"] if len(rows) > limit else None
+            return {"results": formatted_results, "next": next_cursor}
         except Exception as e:
             logger.error(f"An error occurred in get_document_chunks: {e}")
             return {"results": [], "error": str(e)}
         finally:
             if conn:
-                conn.close()
+                settings.release_db_connection(conn)
+
+    def iter_document_chunks(self, where_conditions=None, fields=None, itersize=2000):
+        """
+        Returns a generator over every matching chunk as a dict, ordered by
+        chunkId, read through a server-side cursor that fetches itersize rows
+        at a time, so an export of any size holds one batch in memory. Unknown
+        fields raise ValueError right away; the connection is checked out on
+        the first row and kept until the generator is exhausted or closed.
+        """
+        query, params = self._build_list_query(where_conditions, fields)
+        return settings.iter_rows(query, params, itersize, f"export_chunks_{uuid.uuid4().hex}")
 
     def get_document_chunk(self, chunk_id):
         conn = settings.get_db_connection()  
         try:
             cur = conn.cursor()
-            query = 'SELECT * FROM "DocumentChunks" WHERE "chunkId" = %s;'
+            query = f'SELECT {CHUNK_COLUMNS} FROM "DocumentChunks" WHERE "chunkId" = %s;'
             cur.execute(query, (chunk_id,))
             row = cur.fetchone()
             if row:
@@ -64,26 +183,32 @@ class DocumentChunkModel:
             return {"results": {"error": str(e)}} 
         finally:
             if conn:
-                conn.close()
+                settings.release_db_connection(conn)
 
     def create_document_chunk(self, chunk_input_data):
         """
         Creates a new document chunk and returns the created chunk.
         """
+        if chunk_input_data.get("chunkText") and "chunkHash" not in chunk_input_data:
+            chunk_input_data = {**chunk_input_data, "chunkHash": content_hash(chunk_input_data["chunkText"])}
         conn = settings.get_db_connection()
         try:
             cur = conn.cursor()
+            previous = self._corpus_signatures(cur, document_ids=[chunk_input_data.get("documentId")])
             columns = ', '.join([f'"{key}"' for key in chunk_input_data.keys()])
             placeholders = ', '.join(['%s'] * len(chunk_input_data))
-            query = f'INSERT INTO "DocumentChunks" ({columns}) VALUES ({placeholders}) RETURNING *;'
+            query = f'INSERT INTO "DocumentChunks" ({columns}) VALUES ({placeholders}) RETURNING {CHUNK_COLUMNS};'
             cur.execute(query, tuple(chunk_input_data.values()))
             row = cur.fetchone()
-            conn.commit()
             if row:
                 columns = [desc[0] for desc in cur.description]  # Extract column names
                 result = dict(zip(columns, row))  # Convert row to dictionary
+                signatures = self._corpus_signatures(cur, document_ids=[result["documentId"]])
+                conn.commit()
                 logger.info(f"create_document_chunk result: {result}")
+                self._sync_search_index([result], previous, signatures)
                 return {"results": result}  
+            conn.commit()
             return {"results": None}  
         except Exception as e:
             logger.error(f"An error occurred in create_document_chunk: {e}")
@@ -91,9 +216,78 @@ class DocumentChunkModel:
             return {"results": {"error": str(e)}}  
         finally:
             if conn:
-                conn.close()
+                settings.release_db_connection(conn)
 
-    
+    def upsert_document_chunks(self, chunks_input_data, page_size=500):
+        """
+        Writes chunks in a single transaction using batched multi-row
+        INSERT ... ON CONFLICT ("documentId", "chunkIndex") DO UPDATE, so a
+        chunk at an existing position replaces the stored one in place and
+        keeps its chunkId. Returns the written chunks ordered by chunkIndex,
+        each with "inserted" (False when an existing row was updated). Of
+        several chunks at one position, the last one is written.
+        """
+        chunks_input_data = last_per_key(chunks_input_data or [], lambda chunk: (chunk["documentId"], chunk["chunkIndex"]))
+        if not chunks_input_data:
+            return {"results": []}
+
+        conn = settings.get_db_connection()
+        try:
+            if conn is None:
+                logger.error("Database connection failed")
+                return {"error": "Database connection failed", "status_code": 503}
+
+            cur = conn.cursor()
+            document_ids = list({chunk["documentId"] for chunk in chunks_input_data})
+            previous = self._corpus_signatures(cur, document_ids=document_ids)
+            rows = [
+                (
+                    chunk["documentId"],
+                    chunk["chunkIndex"],
+                    chunk["chunkText"],
+                    chunk.get("embeddingData"),
+                    chunk.get("metaData"),
+                    chunk.get("chunkHash") or content_hash(chunk["chunkText"]),
+                )
+                for chunk in chunks_input_data
+            ]
+            query = f'''
+                INSERT INTO "DocumentChunks" ("documentId", "chunkIndex", "chunkText", "embeddingData", "metaData", "chunkHash")
+                VALUES %s
+                ON CONFLICT ("documentId", "chunkIndex") DO UPDATE SET
+                    "chunkText" = EXCLUDED."chunkText",
+                    "embeddingData" = EXCLUDED."embeddingData",
+                    "metaData" = EXCLUDED."metaData",
+                    "chunkHash" = EXCLUDED."chunkHash",
+                    "updatedAt" = CURRENT_TIMESTAMP
+                RETURNING {CHUNK_COLUMNS}, (xmax = 0) AS "inserted";
+            '''
+            created = execute_values(
+                cur, query, rows,
+                template="(%s, %s, %s, %s::vector, %s, %s)",
+                page_size=page_size,
+                fetch=True
+            )
+            columns = [desc[0] for desc in cur.description]
+            signatures = self._corpus_signatures(cur, document_ids=document_ids)
+            conn.commit()
+
+            result = [dict(zip(columns, row)) for row in created]
+            result.sort(key=lambda chunk: chunk["chunkIndex"])
+            logger.info(f"upsert_document_chunks wrote {len(result)} chunks")
+            self._sync_search_index(result, previous, signatures)
+            return {"results": result}
+        except psycopg2.OperationalError as e:
+            logger.error(f"Database operational error in upsert_document_chunks: {e}")
+            conn.rollback()
+            return {"error": "Database connection error", "status_code": 503}
+        except Exception as e:
+            logger.error(f"An error occurred in upsert_document_chunks: {e}")
+            conn.rollback()
+            return {"error": f"Failed to write document chunks: {str(e)}", "status_code": 500}
+        finally:
+            if conn:
+                settings.release_db_connection(conn)
 
     def update_document_chunk(self, chunk_id, chunk_input_data):
         """
@@ -106,19 +300,29 @@ class DocumentChunkModel:
             if not chunk_id:
                 return {"error": "Missing chunk_id for update."}
 
+            if chunk_input_data.get("chunkText") and "chunkHash" not in chunk_input_data:
+                chunk_input_data = {**chunk_input_data, "chunkHash": content_hash(chunk_input_data["chunkText"])}
+            sync_index = "embeddingData" in chunk_input_data
+            previous = self._corpus_signatures(cur, chunk_ids=[chunk_id]) if sync_index else {}
             set_clause = ', '.join([f'"{key}" = %s' for key in chunk_input_data.keys()])
-            query = f'UPDATE "DocumentChunks" SET {set_clause} WHERE "chunkId" = %s RETURNING *;'
+            if "updatedAt" not in chunk_input_data:
+                set_clause += ', "updatedAt" = CURRENT_TIMESTAMP'
+            query = f'UPDATE "DocumentChunks" SET {set_clause} WHERE "chunkId" = %s RETURNING {CHUNK_COLUMNS};'
             params = tuple(chunk_input_data.values()) + (chunk_id,)  
             cur.execute(query, params)
-            conn.commit()  
             row = cur.fetchone()
 
             if row:
                 result_columns = [desc[0] for desc in cur.description]
                 result = dict(zip(result_columns, row))
+                signatures = self._corpus_signatures(cur, document_ids=[result["documentId"]]) if sync_index else {}
+                conn.commit()
                 logger.info(f"update_document_chunk result: {result}")
+                if sync_index:
+                    self._sync_search_index([result], previous, signatures)
                 return {"results": result} 
 
+            conn.commit()
             return {"results": None} 
 
         except Exception as e:
@@ -128,7 +332,7 @@ class DocumentChunkModel:
 
         finally:
             if conn:
-                conn.close()
+                settings.release_db_connection(conn)
 
 
     def delete_document_chunk(self, chunk_id):
@@ -138,50 +342,455 @@ class DocumentChunkModel:
         conn = settings.get_db_connection()
         try:
             cur = conn.cursor()
-            query = 'DELETE FROM "DocumentChunks" WHERE "chunkId" = %s;'
+            previous = self._corpus_signatures(cur, chunk_ids=[chunk_id])
+            query = 'DELETE FROM "DocumentChunks" WHERE "chunkId" = %s RETURNING "documentId";'
             cur.execute(query, (chunk_id,))
+            deleted_rows = cur.fetchall()
+            signatures = self._corpus_signatures(cur, document_ids=[row[0] for row in deleted_rows]) if deleted_rows else {}
             conn.commit()
-            return cur.rowcount > 0  # Returns True if a row was deleted
+            deleted = len(deleted_rows) > 0  # True if a row was deleted
+            if deleted and self.search_backend is not None:
+                self._remove_from_search_index([chunk_id], previous, signatures)
+            return deleted
         except Exception as e:
             print(f"An error occurred in delete_document: {e}")
             return False
         finally:
             if conn:
-                conn.close()    
+                settings.release_db_connection(conn)    
+
+    def delete_document_chunks(self, chunk_ids):
+        """
+        Deletes chunks by ID in one statement and returns how many were deleted.
+        """
+        if not chunk_ids:
+            return 0
 
-    def search_document_chunk(self, question_embedding, top_k, corpus_key: str, threshold: float):
-        print(f"we got {corpus_key} with  {threshold} value")
         conn = settings.get_db_connection()
         try:
+            if conn is None:
+                logger.error("Database connection failed")
+                return 0
+
             cur = conn.cursor()
+            previous = self._corpus_signatures(cur, chunk_ids=chunk_ids)
+            cur.execute('DELETE FROM "DocumentChunks" WHERE "chunkId" = ANY(%s) RETURNING "chunkId", "documentId";', (list(chunk_ids),))
+            deleted_rows = cur.fetchall()
+            signatures = self._corpus_signatures(cur, document_ids=list({row[1] for row in deleted_rows})) if deleted_rows else {}
+            conn.commit()
+            if deleted_rows and self.search_backend is not None:
+                self._remove_from_search_index([row[0] for row in deleted_rows], previous, signatures)
+            return len(deleted_rows)
+        except psycopg2.Error as e:
+            logger.error(f"Database error in delete_document_chunks: {e}")
+            conn.rollback()
+            return 0
+        finally:
+            if conn:
+                settings.release_db_connection(conn)
 
-            # Step 1: Get corpus_id
-            cur.execute('SELECT "corpusId" FROM "Corpora" WHERE "corpusKey" = %s;', (corpus_key,))
-            corpus_row = cur.fetchone()
-            if not corpus_row:
-                print("No corpus found for the given key.")
-                return {"results": "no corpus found"}
+    def stage_document_chunks(self, chunks_input_data, page_size=500):
+        """
+        Writes embedded chunks of a document version being ingested to
+        "StagedDocumentChunks" under each chunk's "stagingId". Staged chunks
+        are not searchable until apply_staged_chunks() makes the version
+        current. Returns the staged rows. Of several chunks at one position
+        of a version, the last one is staged.
+        """
+        chunks_input_data = last_per_key(chunks_input_data or [], lambda chunk: (chunk["stagingId"], chunk["chunkIndex"]))
+        if not chunks_input_data:
+            return {"results": []}
+
+        conn = settings.get_db_connection()
+        try:
+            if conn is None:
+                logger.error("Database connection failed")
+                return {"error": "Database connection failed", "status_code": 503}
+
+            cur = conn.cursor()
+            rows = [
+                (
+                    chunk["stagingId"],
+                    chunk["documentId"],
+                    chunk["chunkIndex"],
+                    chunk["chunkText"],
+                    chunk.get("embeddingData"),
+                    chunk.get("metaData"),
+                    chunk.get("chunkHash") or content_hash(chunk["chunkText"]),
+                )
+                for chunk in chunks_input_data
+            ]
+            staged = execute_values(
+                cur,
+                '''
+                INSERT INTO "StagedDocumentChunks" ("stagingId", "documentId", "chunkIndex", "chunkText", "embeddingData", "metaData", "chunkHash")
+                VALUES %s
+                ON CONFLICT ("stagingId", "chunkIndex") DO UPDATE SET
+                    "chunkText" = EXCLUDED."chunkText",
+                    "embeddingData" = EXCLUDED."embeddingData",
+                    "metaData" = EXCLUDED."metaData",
+                    "chunkHash" = EXCLUDED."chunkHash"
+                RETURNING "stagingId", "documentId", "chunkIndex", "chunkHash";
+                ''',
+                rows,
+                template="(%s, %s, %s, %s, %s::vector, %s, %s)",
+                page_size=page_size,
+                fetch=True
+            )
+            conn.commit()
 
-            corpus_id = corpus_row[0]
+            columns = [desc[0] for desc in cur.description]
+            return {"results": [dict(zip(columns, row)) for row in staged]}
+        except psycopg2.OperationalError as e:
+            logger.error(f"Database operational error in stage_document_chunks: {e}")
+            conn.rollback()
+            return {"error": "Database connection error", "status_code": 503}
+        except Exception as e:
+            logger.error(f"An error occurred in stage_document_chunks: {e}")
+            conn.rollback()
+            return {"error": f"Failed to stage document chunks: {str(e)}", "status_code": 500}
+        finally:
+            if conn:
+                settings.release_db_connection(conn)
+
+    def apply_staged_chunks(self, staging_id, document_input_data, chunk_count, content_hash_value):
+        """
+        Makes a staged document version current in one transaction: upserts
+        the "Documents" row (text and content hash) within its corpus, moves
+        the staged chunks into "DocumentChunks" by (documentId, chunkIndex),
+        deletes the chunks past chunk_count and clears the staging rows.
 
-            # Step 2: Get all document_ids under this corpus
-            cur.execute('SELECT "documentId" FROM "Documents" WHERE "corpusId" = %s;', (corpus_id,))
-            document_ids = [row[0] for row in cur.fetchall()]
-            if not document_ids:
-                print("No documents found for the corpus.")
-                return {"results": "no documents found"}
+        Returns the written chunks ordered by chunkIndex and the number of
+        chunks deleted, or None in "results" when the documentId belongs to
+        another corpus (nothing is changed then).
+        """
+        conn = settings.get_db_connection()
+        try:
+            if conn is None:
+                logger.error("Database connection failed")
+                return {"error": "Database connection failed", "status_code": 503}
+
+            cur = conn.cursor()
+            document_id = document_input_data["documentId"]
+            previous = self._corpus_signatures(cur, document_ids=[document_id])
+
+            document = {**document_input_data, "contentHash": content_hash_value}
+            columns = ', '.join([f'"{key}"' for key in document.keys()])
+            placeholders = ', '.join(['%s'] * len(document))
+            updates = ', '.join(
+                [f'"{key}" = EXCLUDED."{key}"' for key in document.keys() if key not in ("documentId", "corpusId", "userId")]
+            )
+            cur.execute(f'''
+                INSERT INTO "Documents" ({columns}) VALUES ({placeholders})
+                ON CONFLICT ("documentId") DO UPDATE SET {updates}, "updatedAt" = CURRENT_TIMESTAMP
+                WHERE "Documents"."corpusId" = EXCLUDED."corpusId"
+                RETURNING "documentId";
+            ''', tuple(document.values()))
+            if cur.fetchone() is None:
+                conn.rollback()
+                return {"results": None}
+
+            # The staging key (stagingId, chunkIndex) leaves one row per position of the document
+            cur.execute(f'''
+                INSERT INTO "DocumentChunks" ("documentId", "chunkIndex", "chunkText", "embeddingData", "metaData", "chunkHash")
+                SELECT "documentId", "chunkIndex", "chunkText", "embeddingData", "metaData", "chunkHash"
+                FROM "StagedDocumentChunks"
+                WHERE "stagingId" = %s AND "documentId" = %s
+                ON CONFLICT ("documentId", "chunkIndex") DO UPDATE SET
+                    "chunkText" = EXCLUDED."chunkText",
+                    "embeddingData" = EXCLUDED."embeddingData",
+                    "metaData" = EXCLUDED."metaData",
+                    "chunkHash" = EXCLUDED."chunkHash",
+                    "updatedAt" = CURRENT_TIMESTAMP
+                RETURNING {CHUNK_COLUMNS}, (xmax = 0) AS "inserted";
+            ''', (staging_id, document_id))
+            columns = [desc[0] for desc in cur.description]
+            written = [dict(zip(columns, row)) for row in cur.fetchall()]
+
+            cur.execute(
+                'DELETE FROM "DocumentChunks" WHERE "documentId" = %s AND "chunkIndex" > %s RETURNING "chunkId";',
+                (document_id, chunk_count)
+            )
+            deleted_ids = [row[0] for row in cur.fetchall()]
+            cur.execute('DELETE FROM "StagedDocumentChunks" WHERE "stagingId" = %s;', (staging_id,))
+            signatures = self._corpus_signatures(cur, document_ids=[document_id])
+            conn.commit()
+
+            written.sort(key=lambda chunk: chunk["chunkIndex"])
+            logger.info(f"apply_staged_chunks wrote {len(written)} and deleted {len(deleted_ids)} chunks of {document_id}")
+            if deleted_ids and self.search_backend is not None:
+                self._remove_from_search_index(deleted_ids, None, None)
+            self._sync_search_index(written, previous, signatures)
+            return {"results": written, "deleted": len(deleted_ids)}
+        except psycopg2.OperationalError as e:
+            logger.error(f"Database operational error in apply_staged_chunks: {e}")
+            conn.rollback()
+            return {"error": "Database connection error", "status_code": 503}
+        except Exception as e:
+            logger.error(f"An error occurred in apply_staged_chunks: {e}")
+            conn.rollback()
+            return {"error": f"Failed to store document version: {str(e)}", "status_code": 500}
+        finally:
+            if conn:
+                settings.release_db_connection(conn)
+
+    def discard_staged_chunks(self, staging_ids):
+        """Deletes the staged chunks of failed ingestion runs. Returns how many were deleted."""
+        if not staging_ids:
+            return 0
+
+        conn = settings.get_db_connection()
+        try:
+            if conn is None:
+                logger.error("Database connection failed")
+                return 0
+
+            cur = conn.cursor()
+            cur.execute('DELETE FROM "StagedDocumentChunks" WHERE "stagingId" = ANY(%s);', (list(staging_ids),))
+            deleted = cur.rowcount
+            conn.commit()
+            return deleted
+        except psycopg2.Error as e:
+            logger.error(f"Database error in discard_staged_chunks: {e}")
+            conn.rollback()
+            return 0
+        finally:
+            if conn:
+                settings.release_db_connection(conn)
+
+    def get_chunk_hashes(self, document_id):
+        """
+        Returns chunkId, chunkIndex and chunkHash of every stored chunk of a
+        document, ordered by chunkIndex, without loading texts or embeddings.
+        """
+        conn = settings.get_db_connection()
+        try:
+            if conn is None:
+                logger.error("Database connection failed")
+                return {"error": "Database connection failed", "status_code": 503}
+
+            cur = conn.cursor()
+            cur.execute(
+                'SELECT "chunkId", "chunkIndex", "chunkHash" FROM "DocumentChunks" WHERE "documentId" = %s ORDER BY "chunkIndex";',
+                (document_id,)
+            )
+            columns = [desc[0] for desc in cur.description]
+            return {"results": [dict(zip(columns, row)) for row in cur.fetchall()]}
+        except psycopg2.Error as e:
+            logger.error(f"Database error in get_chunk_hashes: {e}")
+            return {"error": f"Database error: {str(e)}", "status_code": 500}
+        finally:
+            if conn:
+                settings.release_db_connection(conn)
+
+    def get_embedding_dimension(self):
+        """
+        Returns the declared dimension of the "embeddingData" vector column,
+        or None if it cannot be determined.
+        """
+        conn = settings.get_db_connection()
+        try:
+            if conn is None:
+                logger.error("Database connection failed")
+                return None
 
-            # Step 3: Main vector similarity query with additional filters
+            cur = conn.cursor()
+            query = '''
+                SELECT atttypmod FROM pg_attribute
+                WHERE attrelid = '"DocumentChunks"'::regclass
+                AND attname = 'embeddingData';
+            '''
+            cur.execute(query)
+            row = cur.fetchone()
+            # pgvector stores the dimension as the type modifier (-1 when unspecified)
+            if not row or row[0] is None or row[0] < 1:
+                return None
+            return row[0]
+        except psycopg2.Error as e:
+            logger.error(f"Database error in get_embedding_dimension: {e}")
+            return None
+        finally:
+            if conn:
+                settings.release_db_connection(conn)
+
+    def _build_search_query(self, question_embedding, top_k, corpus_key, threshold, ef_search=None, probes=None):
+        """
+        Returns (settings, query, params) for a vector search. settings are
+        transaction-local set_config() calls to run before the query.
+        """
+        # Transaction-local index tuning
+        tuning = []
+        if ef_search:
+            tuning.append(("SELECT set_config('hnsw.ef_search', %s, true);", (str(int(ef_search)),)))
+        if probes:
+            tuning.append(("SELECT set_config('ivfflat.probes', %s, true);", (str(int(probes)),)))
+
+        if self.quantization:
+            # Pick candidates on the quantized index, then re-score them at full precision
+            order_by = self.QUANTIZED_ORDER_BY[self.quantization].format(dim=int(len(question_embedding)))
+            query = f'''
+                SELECT * FROM (
+                    SELECT candidates.*, candidates."embeddingData" <=> %(embedding)s::vector AS "distance"
+                    FROM (
+                        SELECT {C_CHUNK_COLUMNS}
+                        FROM "DocumentChunks" c
+                        JOIN "Documents" d ON d."documentId" = c."documentId"
+                        JOIN "Corpora" co ON co."corpusId" = d."corpusId"
+                        WHERE co."corpusKey" = %(corpus_key)s
+                        ORDER BY {order_by}
+                        LIMIT %(candidates)s
+                    ) candidates
+                    ORDER BY "distance"
+                    LIMIT %(top_k)s
+                ) nearest
+                WHERE "distance" < %(threshold)s
+                ORDER BY "distance";
+            '''
+        else:
             query = f'''
-                SELECT * FROM "DocumentChunks"
-                WHERE "embeddingData" <=> %s::vector < %s
-                AND "documentId" = ANY(%s)
-                ORDER BY "embeddingData" <=> %s::vector
-                LIMIT %s;
+                SELECT * FROM (
+                    SELECT {C_CHUNK_COLUMNS}, c."embeddingData" <=> %(embedding)s::vector AS "distance"
+                    FROM "DocumentChunks" c
+                    JOIN "Documents" d ON d."documentId" = c."documentId"
+                    JOIN "Corpora" co ON co."corpusId" = d."corpusId"
+                    WHERE co."corpusKey" = %(corpus_key)s
+                    ORDER BY c."embeddingData" <=> %(embedding)s::vector
+                    LIMIT %(top_k)s
+                ) nearest
+                WHERE "distance" < %(threshold)s
+                ORDER BY "distance";
             '''
+        params = {
+            "embedding": question_embedding,
+            "corpus_key": corpus_key,
+            "top_k": top_k,
+            "candidates": top_k * self.rescore_factor,
+            "threshold": threshold,
+        }
+        return tuning, query, params
+
+    def _build_text_search_query(self, text_query, question_embedding, limit, corpus_key):
+        """
+        Returns (query, params) for a full-text search on "chunkTextSearch".
+        Question terms are OR-ed, so a chunk matching any of them (e.g. a part
+        number) is a candidate; ts_rank_cd orders them. The cosine distance is
+        computed for the few rows returned so fused results all carry one.
+        """
+        query = f'''
+            SELECT {C_CHUNK_COLUMNS},
+                   ts_rank_cd(c."chunkTextSearch", q.query) AS "textRank",
+                   c."embeddingData" <=> %(embedding)s::vector AS "distance"
+            FROM "DocumentChunks" c
+            JOIN "Documents" d ON d."documentId" = c."documentId"
+            JOIN "Corpora" co ON co."corpusId" = d."corpusId"
+            CROSS JOIN (
+                SELECT to_tsquery('{TEXT_SEARCH_CONFIG}', replace(plainto_tsquery('{TEXT_SEARCH_CONFIG}', %(text_query)s)::text, ' & ', ' | ')) AS query
+            ) q
+            WHERE co."corpusKey" = %(corpus_key)s
+              AND c."chunkTextSearch" @@ q.query
+            ORDER BY "textRank" DESC
+            LIMIT %(limit)s;
+        '''
+        params = {
+            "text_query": text_query,
+            "embedding": question_embedding,
+            "corpus_key": corpus_key,
+            "limit": limit,
+        }
+        return query, params
 
-            cur.execute(query, (question_embedding, threshold, document_ids, question_embedding, top_k))
+    def search_document_chunk_text(self, text_query, question_embedding, limit, corpus_key):
+        """Returns up to limit chunks of the corpus matching text_query, best "textRank" first."""
+        conn = settings.get_db_connection()
+        try:
+            if conn is None:
+                logger.error("Database connection failed")
+                return {"error": "Database connection failed", "status_code": 503}
+
+            cur = conn.cursor()
+            query, params = self._build_text_search_query(text_query, question_embedding, limit, corpus_key)
+            cur.execute(query, params)
             rows = cur.fetchall()
+            conn.commit()
+            columns = [desc[0] for desc in cur.description]
+            return [dict(zip(columns, row)) for row in rows]
+        except Exception as e:
+            logger.error(f"An error occurred in search_document_chunk_text: {e}")
+            conn.rollback()
+            return {"error": f"Text search failed: {str(e)}", "status_code": 500}
+        finally:
+            if conn:
+                settings.release_db_connection(conn)
+
+    async def search_document_chunk_text_async(self, text_query, question_embedding, limit, corpus_key):
+        """Async version of search_document_chunk_text()."""
+        if not settings.async_available:
+            return await asyncio.to_thread(self.search_document_chunk_text, text_query, question_embedding, limit, corpus_key)
+
+        query, params = self._build_text_search_query(text_query, str(list(question_embedding)), limit, corpus_key)
+        try:
+            async with settings.async_connection() as conn:
+                cur = conn.cursor()
+                await cur.execute(query, params)
+                rows = await cur.fetchall()
+                columns = [desc[0] for desc in cur.description] if cur.description else []
+                return [dict(zip(columns, row)) for row in rows]
+        except Exception as e:
+            logger.error(f"An error occurred in search_document_chunk_text_async: {e}")
+            return {"error": f"Text search failed: {str(e)}", "status_code": 500}
+
+    def _fuse(self, vector_rows, text_rows, top_k, vector_weight, text_weight):
+        if isinstance(vector_rows, dict):
+            return vector_rows
+        if isinstance(text_rows, dict):
+            # Full-text search is an addition; without it the vector results still stand
+            logger.error(f"Hybrid search falling back to vector results: {text_rows['error']}")
+            return vector_rows[:top_k]
+        return reciprocal_rank_fusion([vector_rows, text_rows], [vector_weight, text_weight], k=self.rrf_k)[:top_k]
+
+    def search_document_chunk(self, question_embedding, top_k, corpus_key: str, threshold: float, ef_search=None, probes=None,
+                              text_query=None, vector_weight=1.0, text_weight=1.0):
+        """
+        Returns the top_k chunks of the corpus closest to question_embedding by
+        cosine distance, keeping only those with a distance below threshold.
+
+        The corpus is resolved in the same statement, so the ORDER BY can be
+        served by the vector_cosine_ops ANN index. ef_search (HNSW) and probes
+        (IVFFlat) trade recall for latency and only apply to this query.
+
+        With text_query, the search is hybrid: the vector query and a
+        full-text query on "chunkTextSearch" run in parallel, each fetching
+        top_k * hybrid_candidate_factor candidates, and are merged by
+        reciprocal rank fusion weighted by vector_weight/text_weight.
+        Full-text matches are not subject to threshold.
+        """
+        print(f"we got {corpus_key} with  {threshold} value")
+        if text_query:
+            candidates = top_k * self.hybrid_candidate_factor
+            with ThreadPoolExecutor(max_workers=2) as executor:
+                vector_future = executor.submit(self._vector_search, question_embedding, candidates, corpus_key, threshold, ef_search, probes)
+                text_future = executor.submit(self.search_document_chunk_text, text_query, question_embedding, candidates, corpus_key)
+                vector_rows, text_rows = vector_future.result(), text_future.result()
+            return self._fuse(vector_rows, text_rows, top_k, vector_weight, text_weight)
+        return self._vector_search(question_embedding, top_k, corpus_key, threshold, ef_search, probes)
+
+    def _vector_search(self, question_embedding, top_k, corpus_key, threshold, ef_search=None, probes=None):
+        if self.search_backend is not None:
+            return self._search_in_process(question_embedding, top_k, corpus_key, threshold, probes)
+
+        conn = settings.get_db_connection()
+        try:
+            if conn is None:
+                logger.error("Database connection failed")
+                return {"error": "Database connection failed", "status_code": 503}
+
+            cur = conn.cursor()
+            tuning, query, params = self._build_search_query(question_embedding, top_k, corpus_key, threshold, ef_search, probes)
+            for statement, statement_params in tuning:
+                cur.execute(statement, statement_params)
+            cur.execute(query, params)
+            rows = cur.fetchall()
+            conn.commit()
 
             result = []
             if rows:
@@ -192,7 +801,249 @@ class DocumentChunkModel:
 
         except Exception as e:
             print(f"An error occurred in search_document_chunk: {e}")
-            return {"results": "no data found"}
+            conn.rollback()
+            return {"error": f"Search failed: {str(e)}", "status_code": 500}
+        finally:
+            if conn:
+                settings.release_db_connection(conn)
+
+    async def search_document_chunk_async(self, question_embedding, top_k, corpus_key: str, threshold: float, ef_search=None, probes=None,
+                                          text_query=None, vector_weight=1.0, text_weight=1.0):
+        """
+        Async version of search_document_chunk() for async routes.
+
+        Runs on the psycopg 3 async pool when it is installed; otherwise (and
+        for the CPU-bound in-process backends) the sync search runs in a
+        worker thread so the event loop is never blocked. In hybrid mode the
+        vector and full-text queries are awaited concurrently.
+        """
+        if self.search_backend is not None or not settings.async_available:
+            return await asyncio.to_thread(self.search_document_chunk, question_embedding, top_k, corpus_key, threshold, ef_search, probes,
+                                           text_query, vector_weight, text_weight)
+
+        if text_query:
+            candidates = top_k * self.hybrid_candidate_factor
+            vector_rows, text_rows = await asyncio.gather(
+                self._vector_search_async(question_embedding, candidates, corpus_key, threshold, ef_search, probes),
+                self.search_document_chunk_text_async(text_query, question_embedding, candidates, corpus_key),
+            )
+            return self._fuse(vector_rows, text_rows, top_k, vector_weight, text_weight)
+        return await self._vector_search_async(question_embedding, top_k, corpus_key, threshold, ef_search, probes)
+
+    async def _vector_search_async(self, question_embedding, top_k, corpus_key, threshold, ef_search=None, probes=None):
+        tuning, query, params = self._build_search_query(question_embedding, top_k, corpus_key, threshold, ef_search, probes)
+        params["embedding"] = str(list(question_embedding))
+        try:
+            async with settings.async_connection() as conn:
+                cur = conn.cursor()
+                for statement, statement_params in tuning:
+                    await cur.execute(statement, statement_params)
+                await cur.execute(query, params)
+                rows = await cur.fetchall()
+                columns = [desc[0] for desc in cur.description] if cur.description else []
+                return [dict(zip(columns, row)) for row in rows]
+        except Exception as e:
+            logger.error(f"An error occurred in search_document_chunk_async: {e}")
+            return {"error": f"Search failed: {str(e)}", "status_code": 500}
+
+    def _search_in_process(self, question_embedding, top_k, corpus_key, threshold, probes=None):
+        """
+        Ranks chunks with the in-process search backend, then hydrates the
+        matching chunk IDs from Postgres in a single query. threshold is a
+        cosine distance, as in the Postgres search: with a "dot" or "l2"
+        backend it is checked against the cosine distance of each match.
+        """
+        try:
+            matches = self.search_backend.search(corpus_key, [question_embedding], top_k, probes=probes)[0]
+        except Exception as e:
+            logger.error(f"An error occurred in search backend {self.search_backend.name}: {e}")
+            return {"error": f"Search failed: {str(e)}", "status_code": 500}
+
+        cosine = self.search_backend.metric == "cosine"
+        if cosine:
+            matches = [(chunk_id, distance) for chunk_id, distance in matches if distance < threshold]
+        if not matches:
+            return []
+
+        rows = self.get_document_chunks_by_ids([chunk_id for chunk_id, _ in matches])
+        if isinstance(rows, dict):
+            return rows
+        by_id = {row["chunkId"]: row for row in rows}
+        result = []
+        for chunk_id, distance in matches:
+            row = by_id.get(chunk_id)
+            if row is not None:
+                row["distance"] = distance
+                result.append(row)
+        if not cosine and result:
+            cosine_distances = self.search_backend.cosine_distances(question_embedding, [row["embeddingData"] for row in result])
+            result = [row for row, cosine_distance in zip(result, cosine_distances) if cosine_distance < threshold]
+        return result
+
+    def get_document_chunks_by_ids(self, chunk_ids):
+        conn = settings.get_db_connection()
+        try:
+            if conn is None:
+                logger.error("Database connection failed")
+                return {"error": "Database connection failed", "status_code": 503}
+
+            cur = conn.cursor()
+            cur.execute(f'SELECT {CHUNK_COLUMNS} FROM "DocumentChunks" WHERE "chunkId" = ANY(%s);', (list(chunk_ids),))
+            rows = cur.fetchall()
+            columns = [desc[0] for desc in cur.description]
+            return [dict(zip(columns, row)) for row in rows]
+        except psycopg2.Error as e:
+            logger.error(f"Database error in get_document_chunks_by_ids: {e}")
+            return {"error": f"Database error: {str(e)}", "status_code": 500}
         finally:
             if conn:
-                conn.close()
+                settings.release_db_connection(conn)
+
+    def get_corpus_embeddings(self, corpus_key):
+        """
+        Returns (chunk_ids, embeddings) for every embedded chunk of the corpus,
+        streamed through a server-side cursor.
+        """
+        conn = settings.get_db_connection()
+        try:
+            if conn is None:
+                raise psycopg2.OperationalError("Database connection failed")
+
+            cur = conn.cursor(name="corpus_embeddings")
+            cur.itersize = 5000
+            cur.execute('''
+                SELECT c."chunkId", c."embeddingData"
+                FROM "DocumentChunks" c
+                JOIN "Documents" d ON d."documentId" = c."documentId"
+                JOIN "Corpora" co ON co."corpusId" = d."corpusId"
+                WHERE co."corpusKey" = %s AND c."embeddingData" IS NOT NULL;
+            ''', (corpus_key,))
+            chunk_ids, embeddings = [], []
+            for row in cur:
+                chunk_ids.append(row[0])
+                embeddings.append(row[1])
+            cur.close()
+            conn.commit()
+            return chunk_ids, embeddings
+        finally:
+            if conn:
+                settings.release_db_connection(conn)
+
+    def get_corpus_signature(self, corpus_key):
+        """
+        Cheap fingerprint of a corpus' chunks (count and latest timestamps),
+        used to tell whether an in-process index is still current.
+        """
+        conn = settings.get_db_connection()
+        try:
+            if conn is None:
+                return None
+
+            cur = conn.cursor()
+            cur.execute('''
+                SELECT COUNT(*), MAX(c."createdAt"), MAX(c."updatedAt")
+                FROM "DocumentChunks" c
+                JOIN "Documents" d ON d."documentId" = c."documentId"
+                JOIN "Corpora" co ON co."corpusId" = d."corpusId"
+                WHERE co."corpusKey" = %s;
+            ''', (corpus_key,))
+            return self._format_signature(*cur.fetchone())
+        except psycopg2.Error as e:
+            logger.error(f"Database error in get_corpus_signature: {e}")
+            return None
+        finally:
+            if conn:
+                settings.release_db_connection(conn)
+
+    @staticmethod
+    def _format_signature(count, created_at, updated_at):
+        return f"{count}|{created_at.isoformat() if created_at else ''}|{updated_at.isoformat() if updated_at else ''}"
+
+    def _corpus_signatures(self, cur, document_ids=None, chunk_ids=None):
+        """
+        Signatures (see get_corpus_signature) of the corpora holding the given
+        documents or chunks, read on the writer's cursor. Taken before and
+        after a write, they let the in-process index adopt the new signature
+        only when it was current before the write (no write missed).
+        """
+        if self.search_backend is None:
+            return {}
+        if chunk_ids is not None:
+            corpora = '''
+                SELECT d."corpusId" FROM "Documents" d
+                JOIN "DocumentChunks" c ON c."documentId" = d."documentId"
+                WHERE c."chunkId" = ANY(%s)
+            '''
+            ids = list(chunk_ids)
+        else:
+            corpora = 'SELECT "corpusId" FROM "Documents" WHERE "documentId" = ANY(%s)'
+            ids = list(document_ids or [])
+        cur.execute(f'''
+            SELECT co."corpusKey", COUNT(c."chunkId"), MAX(c."createdAt"), MAX(c."updatedAt")
+            FROM "Corpora" co
+            JOIN "Documents" d ON d."corpusId" = co."corpusId"
+            LEFT JOIN "DocumentChunks" c ON c."documentId" = d."documentId"
+            WHERE co."corpusId" IN ({corpora})
+            GROUP BY co."corpusKey";
+        ''', (ids,))
+        return {row[0]: self._format_signature(*row[1:]) for row in cur.fetchall()}
+
+    def _get_corpus_keys(self, document_ids):
+        """Maps each documentId to the corpus keys it belongs to."""
+        conn = settings.get_db_connection()
+        try:
+            if conn is None:
+                return {}
+
+            cur = conn.cursor()
+            cur.execute('''
+                SELECT d."documentId", co."corpusKey"
+                FROM "Documents" d
+                JOIN "Corpora" co ON co."corpusId" = d."corpusId"
+                WHERE d."documentId" = ANY(%s);
+            ''', (list(document_ids),))
+            corpus_keys = {}
+            for document_id, corpus_key in cur.fetchall():
+                corpus_keys.setdefault(document_id, []).append(corpus_key)
+            return corpus_keys
+        except psycopg2.Error as e:
+            logger.error(f"Database error in _get_corpus_keys: {e}")
+            return {}
+        finally:
+            if conn:
+                settings.release_db_connection(conn)
+
+    def _sync_search_index(self, chunks, previous=None, signatures=None):
+        """
+        Applies created/updated chunks to the in-process search backend.
+        previous and signatures are the corpus signatures from just before
+        and after the write (see _corpus_signatures).
+        """
+        if self.search_backend is None or not chunks:
+            return
+        try:
+            corpus_keys = self._get_corpus_keys({chunk["documentId"] for chunk in chunks})
+            per_corpus = {}
+            for chunk in chunks:
+                if chunk.get("embeddingData") is None:
+                    continue
+                for corpus_key in corpus_keys.get(chunk["documentId"], []):
+                    per_corpus.setdefault(corpus_key, []).append(chunk)
+            for corpus_key, corpus_chunks in per_corpus.items():
+                self.search_backend.upsert(
+                    corpus_key,
+                    [chunk["chunkId"] for chunk in corpus_chunks],
+                    [chunk["embeddingData"] for chunk in corpus_chunks],
+                    signature=(signatures or {}).get(corpus_key),
+                    previous=(previous or {}).get(corpus_key),
+                )
+        except Exception as e:
+            # The backend re-syncs from the database when its signature goes stale
+            logger.error(f"Failed to update search index: {e}")
+
+    def _remove_from_search_index(self, chunk_ids, previous, signatures):
+        """Drops deleted chunks from the in-process search backend."""
+        try:
+            self.search_backend.remove(chunk_ids, signatures, previous)
+        except Exception as e:
+            logger.error(f"Failed to update search index: {e}")
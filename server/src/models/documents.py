@@ -2,12 +2,122 @@ from core.db import settings
 import logging
 import psycopg2
 import json
+import uuid
 
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO)
 
+DOCUMENT_COLUMN_NAMES = ["documentId", "userId", "corpusId", "docType", "docName", "sourceUrl", "tags", "rawText", "contentHash", "createdAt", "updatedAt"]
+# Listed and exported unless fields= asks for more; the extracted text dominates row size
+DEFAULT_DOCUMENT_FIELDS = [name for name in DOCUMENT_COLUMN_NAMES if name != "rawText"]
+
 class DocumentsModel:
-    def get_documents(self, where_conditions=None):
+    def _build_where_clauses(self, where_conditions):
+        """
+        Turns where conditions into SQL clauses and parameters. Keys are
+        column names, or "tags.path" / "rawText.path" for JSON lookups.
+        """
+        if not isinstance(where_conditions, dict):
+            raise ValueError("Where conditions must be a dictionary")
+
+        where_clauses = []
+        params = []
+        for key, value in where_conditions.items():
+            # Check if this is a JSON path query (key contains '.')
+            if '.' in key:
+                parts = key.split('.', 1)
+                column_name = parts[0]
+                json_path = parts[1]
+                
+                # Ensure the column name is valid to prevent SQL injection
+                if column_name in ["tags", "rawText"]:
+                    # Handle different JSON query operations
+                    if key.endswith('[]') and isinstance(value, str):
+                        # Array contains value (for arrays of strings)
+                        # Remove the [] suffix from the key
+                        json_path = json_path[:-2]
+                        where_clauses.append(f'"{column_name}" @> %s::jsonb')
+                        # Create a JSON array with the value
+                        json_value = f'{{"{ json_path }": ["{value}"]}}'
+                        params.append(json_value)
+                    elif isinstance(value, dict) and '_op' in value:
+                        # Special operations
+                        op = value['_op']
+                        val = value['value']
+                        
+                        if op == 'contains':
+                            # Text contains operation
+                            where_clauses.append(f'"{column_name}"->>\'{json_path}\' ILIKE %s')
+                            params.append(f'%{val}%')
+                        elif op == 'startswith':
+                            where_clauses.append(f'"{column_name}"->>\'{json_path}\' ILIKE %s')
+                            params.append(f'{val}%')
+                        elif op == 'endswith':
+                            where_clauses.append(f'"{column_name}"->>\'{json_path}\' ILIKE %s')
+                            params.append(f'%{val}')
+                        elif op == 'gt':
+                            where_clauses.append(f'CAST("{column_name}"->>\'{json_path}\' AS NUMERIC) > %s')
+                            params.append(val)
+                        elif op == 'lt':
+                            where_clauses.append(f'CAST("{column_name}"->>\'{json_path}\' AS NUMERIC) < %s')
+                            params.append(val)
+                        else:
+                            logger.warning(f"Ignoring unsupported JSON operation: {op}")
+                    else:
+                        # For string values in JSON
+                        where_clauses.append(f'"{column_name}"->>\'{json_path}\' = %s')
+                        params.append(value)
+                else:
+                    logger.warning(f"Ignoring invalid JSON column name: {column_name}")
+            else:
+                # Regular column query
+                if key in ["docId", "documentId", "userId", "corpusId", "docType", "docName", "sourceUrl"]:
+                    where_clauses.append(f'"{key}" = %s')
+                    params.append(value)
+                else:
+                    logger.warning(f"Ignoring invalid column name: {key}")
+
+        return where_clauses, params
+
+    def _build_list_query(self, where_conditions=None, fields=None, after=None, limit=None):
+        """
+        SELECT over "Documents" with the given where conditions, fields
+        (default DEFAULT_DOCUMENT_FIELDS) and keyset pagination on "documentId".
+        """
+        fields = list(fields or DEFAULT_DOCUMENT_FIELDS)
+        invalid = [name for name in fields if name not in DOCUMENT_COLUMN_NAMES]
+        if invalid:
+            raise ValueError(f"Unknown fields: {', '.join(invalid)}")
+        # The cursor column is always returned so the next page can be requested
+        if "documentId" not in fields:
+            fields.insert(0, "documentId")
+
+        columns = ", ".join(f'"{name}"' for name in fields)
+        query = f'SELECT {columns} FROM "Documents"'
+        where_clauses, params = self._build_where_clauses(where_conditions) if where_conditions else ([], [])
+        if after:
+            where_clauses.append('"documentId" > %s')
+            params.append(after)
+        if where_clauses:
+            query += " WHERE " + " AND ".join(where_clauses)
+
+        query += ' ORDER BY "documentId"'
+        if limit is not None:
+            query += " LIMIT %s"
+            params.append(limit)
+        return query + ";", params
+
+    def get_documents(self, where_conditions=None, fields=None, after=None, limit=100):
+        """
+        Returns one page of documents ordered by documentId, and in "next" the
+        cursor to pass as after= for the following page (None on the last).
+        """
+        try:
+            query, params = self._build_list_query(where_conditions, fields, after, limit + 1)
+        except Exception as e:
+            logger.error(f"Error processing where conditions: {e}")
+            return {"error": f"Invalid where conditions: {str(e)}", "status_code": 400}
+
         conn = settings.get_db_connection()  
         try:
             if conn is None:
@@ -15,80 +125,6 @@ class DocumentsModel:
                 return {"error": "Database connection failed", "status_code": 503}
                 
             cur = conn.cursor() 
-            
-            query = 'SELECT * FROM "Documents"'
-            params = []
-            
-            # Add WHERE clause if conditions are provided
-            if where_conditions:
-                if not isinstance(where_conditions, dict):
-                    logger.error(f"Invalid where_conditions format: {where_conditions}")
-                    return {"error": "Where conditions must be a dictionary", "status_code": 400}
-                
-                try:
-                    where_clauses = []
-                    for key, value in where_conditions.items():
-                        # Check if this is a JSON path query (key contains '.')
-                        if '.' in key:
-                            parts = key.split('.', 1)
-                            column_name = parts[0]
-                            json_path = parts[1]
-                            
-                            # Ensure the column name is valid to prevent SQL injection
-                            if column_name in ["tags", "rawText"]:
-                                # Handle different JSON query operations
-                                if key.endswith('[]') and isinstance(value, str):
-                                    # Array contains value (for arrays of strings)
-                                    # Remove the [] suffix from the key
-                                    json_path = json_path[:-2]
-                                    where_clauses.append(f'"{column_name}" @> %s::jsonb')
-                                    # Create a JSON array with the value
-                                    json_value = f'{{"{ json_path }": ["{value}"]}}'
-                                    params.append(json_value)
-                                elif isinstance(value, dict) and '_op' in value:
-                                    # Special operations
-                                    op = value['_op']
-                                    val = value['value']
-                                    
-                                    if op == 'contains':
-                                        # Text contains operation
-                                        where_clauses.append(f'"{column_name}"->>\'{json_path}\' ILIKE %s')
-                                        params.append(f'%{val}%')
-                                    elif op == 'startswith':
-                                        where_clauses.append(f'"{column_name}"->>\'{json_path}\' ILIKE %s')
-                                        params.append(f'{val}%')
-                                    elif op == 'endswith':
-                                        where_clauses.append(f'"{column_name}"->>\'{json_path}\' ILIKE %s')
-                                        params.append(f'%{val}')
-                                    elif op == 'gt':
-                                        where_clauses.append(f'CAST("{column_name}"->>\'{json_path}\' AS NUMERIC) > %s')
-                                        params.append(val)
-                                    elif op == 'lt':
-                                        where_clauses.append(f'CAST("{column_name}"->>\'{json_path}\' AS NUMERIC) < %s')
-                                        params.append(val)
-                                    else:
-                                        logger.warning(f"Ignoring unsupported JSON operation: {op}")
-                                else:
-                                    # For string values in JSON
-                                    where_clauses.append(f'"{column_name}"->>\'{json_path}\' = %s')
-                                    params.append(value)
-                            else:
-                                logger.warning(f"Ignoring invalid JSON column name: {column_name}")
-                        else:
-                            # Regular column query
-                            if key in ["docId", "documentId", "userId", "corpusId", "docType", "docName", "sourceUrl"]:
-                                where_clauses.append(f'"{key}" = %s')
-                                params.append(value)
-                            else:
-                                logger.warning(f"Ignoring invalid column name: {key}")
-                    
-                    if where_clauses:
-                        query += " WHERE " + " AND ".join(where_clauses)
-                except Exception as e:
-                    logger.error(f"Error processing where conditions: {e}")
-                    return {"error": f"Invalid where conditions: {str(e)}", "status_code": 400}
-            
-            query += ";"
             logger.info(f"Executing query: {query} with params: {params}")
             
             cur.execute(query, params)
@@ -97,13 +133,14 @@ class DocumentsModel:
             
             # Convert result to list of dictionaries
             formatted_result = []
-            for row in result:
+            for row in result[:limit]:
                 row_dict = {}
                 for i, col in enumerate(cur.description):
                     row_dict[col.name] = row[i]
                 formatted_result.append(row_dict)
                 
-            return {"results": formatted_result}
+            next_cursor = formatted_result[-1]["documentId"] if len(result) > limit else None
+            return {"results": formatted_result, "next": next_cursor}
             
         except psycopg2.OperationalError as e:
             logger.error(f"Database operational error in get_documents: {e}")
@@ -119,7 +156,18 @@ class DocumentsModel:
             return {"error": f"Failed to retrieve documents: {str(e)}", "status_code": 500}
         finally:
             if conn:
-                conn.close()
+                settings.release_db_connection(conn)
+
+    def iter_documents(self, where_conditions=None, fields=None, itersize=2000):
+        """
+        Returns a generator over every matching document as a dict, ordered
+        by documentId, read through a server-side cursor that fetches itersize
+        rows at a time. Invalid fields or conditions raise ValueError right
+        away; the connection is checked out on the first row and kept until
+        the generator is exhausted or closed.
+        """
+        query, params = self._build_list_query(where_conditions, fields)
+        return settings.iter_rows(query, params, itersize, f"export_documents_{uuid.uuid4().hex}")
 
     def get_document(self, document_id):
         conn = settings.get_db_connection()  
@@ -138,7 +186,7 @@ class DocumentsModel:
             return {"error": str(e), "status_code": 500}
         finally:
             if conn:
-                conn.close()
+                settings.release_db_connection(conn)
 
     def update_document(self, docId, document_data_input):
         """
@@ -175,7 +223,7 @@ class DocumentsModel:
 
         finally:
             if conn:
-                conn.close()
+                settings.release_db_connection(conn)
 
 
     def delete_document(self, document_id):
@@ -199,7 +247,7 @@ class DocumentsModel:
             return {"error": str(e), "status_code": 500}
         finally:
             if conn:
-                conn.close()
+                settings.release_db_connection(conn)
 
     def create_document(self, document_input_data):
         """
@@ -228,4 +276,36 @@ class DocumentsModel:
             return {"error": str(e), "status_code": 500}
         finally:
             if conn:
-                conn.close()
\ No newline at end of file
+                settings.release_db_connection(conn)
+
+    def get_document_states(self, document_ids):
+        """
+        Returns {documentId: {"documentId", "corpusId", "contentHash"}} for the
+        given documents that exist, in one query and without their text.
+        """
+        if not document_ids:
+            return {"results": {}}
+
+        conn = settings.get_db_connection()
+        try:
+            if conn is None:
+                logger.error("Database connection failed")
+                return {"error": "Database connection failed", "status_code": 503}
+
+            cur = conn.cursor()
+            cur.execute(
+                'SELECT "documentId", "corpusId", "contentHash" FROM "Documents" WHERE "documentId" = ANY(%s);',
+                (list(document_ids),)
+            )
+            columns = [desc[0] for desc in cur.description]
+            states = {}
+            for row in cur.fetchall():
+                state = dict(zip(columns, row))
+                states[state["documentId"]] = state
+            return {"results": states}
+        except psycopg2.Error as e:
+            logger.error(f"Database error in get_document_states: {e}")
+            return {"error": f"Database error: {str(e)}", "status_code": 500}
+        finally:
+            if conn:
+                settings.release_db_connection(conn)
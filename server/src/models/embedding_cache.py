@@ -0,0 +1,124 @@
+from core.db import settings
+import logging
+import psycopg2
+from psycopg2.extras import execute_values
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO)
+
+class EmbeddingCacheModel:
+    def get_embeddings(self, cache_keys):
+        """
+        Fetches cached embeddings for the given keys and refreshes their
+        lastUsedAt in the same statement. Returns {cacheKey: embedding}.
+        """
+        if not cache_keys:
+            return {}
+
+        conn = settings.get_db_connection()
+        try:
+            if conn is None:
+                logger.error("Database connection failed")
+                return {}
+
+            cur = conn.cursor()
+            query = '''
+                UPDATE "EmbeddingCache"
+                SET "lastUsedAt" = CURRENT_TIMESTAMP
+                WHERE "cacheKey" = ANY(%s)
+                RETURNING "cacheKey", "embedding";
+            '''
+            cur.execute(query, (list(cache_keys),))
+            rows = cur.fetchall()
+            conn.commit()
+            return {row[0]: list(row[1]) for row in rows}
+        except psycopg2.Error as e:
+            logger.error(f"Database error in get_embeddings: {e}")
+            conn.rollback()
+            return {}
+        finally:
+            if conn:
+                settings.release_db_connection(conn)
+
+    def put_embeddings(self, entries, page_size=500):
+        """
+        Stores (cacheKey, model, inputType, embedding) tuples, ignoring keys
+        that are already cached. Returns the number of rows written.
+        """
+        if not entries:
+            return 0
+
+        conn = settings.get_db_connection()
+        try:
+            if conn is None:
+                logger.error("Database connection failed")
+                return 0
+
+            cur = conn.cursor()
+            query = '''
+                INSERT INTO "EmbeddingCache" ("cacheKey", "model", "inputType", "embedding")
+                VALUES %s
+                ON CONFLICT ("cacheKey") DO NOTHING;
+            '''
+            # rowcount only covers the last statement, so pages are sent and counted one by one
+            written = 0
+            for start in range(0, len(entries), page_size):
+                execute_values(cur, query, entries[start:start + page_size], page_size=page_size)
+                written += cur.rowcount
+            conn.commit()
+            return written
+        except psycopg2.Error as e:
+            logger.error(f"Database error in put_embeddings: {e}")
+            conn.rollback()
+            return 0
+        finally:
+            if conn:
+                settings.release_db_connection(conn)
+
+    def evict(self, max_rows):
+        """
+        Deletes the least recently used entries beyond max_rows.
+        Returns the number of deleted rows.
+        """
+        conn = settings.get_db_connection()
+        try:
+            if conn is None:
+                logger.error("Database connection failed")
+                return 0
+
+            cur = conn.cursor()
+            query = '''
+                DELETE FROM "EmbeddingCache"
+                WHERE "cacheKey" IN (
+                    SELECT "cacheKey" FROM "EmbeddingCache"
+                    ORDER BY "lastUsedAt" DESC
+                    OFFSET %s
+                );
+            '''
+            cur.execute(query, (max_rows,))
+            conn.commit()
+            if cur.rowcount:
+                logger.info(f"Evicted {cur.rowcount} embedding cache entries")
+            return cur.rowcount
+        except psycopg2.Error as e:
+            logger.error(f"Database error in evict: {e}")
+            conn.rollback()
+            return 0
+        finally:
+            if conn:
+                settings.release_db_connection(conn)
+
+    def count(self):
+        conn = settings.get_db_connection()
+        try:
+            if conn is None:
+                return None
+            cur = conn.cursor()
+            cur.execute('SELECT COUNT(*) FROM "EmbeddingCache";')
+            return cur.fetchone()[0]
+        except psycopg2.Error as e:
+            logger.error(f"Database error in count: {e}")
+            return None
+        finally:
+            if conn:
+                settings.release_db_connection(conn)
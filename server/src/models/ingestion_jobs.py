@@ -0,0 +1,316 @@
+from core.db import settings
+import logging
+import psycopg2
+from psycopg2.extras import Json
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO)
+
+# Columns returned to API callers; the uploaded file itself is never sent back
+JOB_COLUMNS = '''"jobId", "userId", "corpusKey", "fileType", "fileName", "sourceUrl", "status",
+    "attempts", "maxAttempts", "chunksTotal", "chunksEmbedded", "chunksInserted", "cancelRequested",
+    "error", "result", "lockedBy", "createdAt", "updatedAt", "startedAt", "finishedAt"'''
+
+class IngestionJobModel:
+    def create_job(self, job_input_data):
+        """
+        Queues a document for ingestion. job_input_data holds userId,
+        corpusKey, fileType, fileName and either payload (file bytes) or sourceUrl.
+        """
+        conn = settings.get_db_connection()
+        try:
+            if conn is None:
+                logger.error("Database connection failed")
+                return {"error": "Database connection failed", "status_code": 503}
+
+            cur = conn.cursor()
+            payload = job_input_data.get("payload")
+            query = f'''
+                INSERT INTO "IngestionJobs"
+                    ("userId", "corpusKey", "fileType", "fileName", "sourceUrl", "payload", "maxAttempts")
+                VALUES (%s, %s, %s, %s, %s, %s, %s)
+                RETURNING {JOB_COLUMNS};
+            '''
+            cur.execute(query, (
+                job_input_data["userId"],
+                job_input_data["corpusKey"],
+                job_input_data["fileType"],
+                job_input_data["fileName"],
+                job_input_data.get("sourceUrl"),
+                psycopg2.Binary(payload) if payload is not None else None,
+                job_input_data.get("maxAttempts", 1),
+            ))
+            row = cur.fetchone()
+            conn.commit()
+            columns = [desc[0] for desc in cur.description]
+            return {"results": dict(zip(columns, row))}
+        except psycopg2.OperationalError as e:
+            logger.error(f"Database operational error in create_job: {e}")
+            conn.rollback()
+            return {"error": "Database connection error", "status_code": 503}
+        except Exception as e:
+            logger.error(f"An error occurred in create_job: {e}")
+            conn.rollback()
+            return {"error": f"Failed to create ingestion job: {str(e)}", "status_code": 500}
+        finally:
+            if conn:
+                settings.release_db_connection(conn)
+
+    def get_job(self, job_id):
+        conn = settings.get_db_connection()
+        try:
+            if conn is None:
+                logger.error("Database connection failed")
+                return {"error": "Database connection failed", "status_code": 503}
+
+            cur = conn.cursor()
+            cur.execute(f'SELECT {JOB_COLUMNS} FROM "IngestionJobs" WHERE "jobId" = %s;', (job_id,))
+            row = cur.fetchone()
+            if not row:
+                return {"error": f"Ingestion job with ID {job_id} not found", "status_code": 404}
+            columns = [desc[0] for desc in cur.description]
+            return {"results": dict(zip(columns, row))}
+        except psycopg2.Error as e:
+            logger.error(f"Database error in get_job: {e}")
+            return {"error": f"Database error: {str(e)}", "status_code": 500}
+        finally:
+            if conn:
+                settings.release_db_connection(conn)
+
+    def get_jobs(self, where_conditions=None):
+        conn = settings.get_db_connection()
+        try:
+            if conn is None:
+                logger.error("Database connection failed")
+                return {"error": "Database connection failed", "status_code": 503}
+
+            cur = conn.cursor()
+            query = f'SELECT {JOB_COLUMNS} FROM "IngestionJobs"'
+            params = []
+            if where_conditions:
+                where_clauses = []
+                for key, value in where_conditions.items():
+                    # Ensure the column name is valid to prevent SQL injection
+                    if key in ["jobId", "userId", "corpusKey", "status", "fileName"]:
+                        where_clauses.append(f'"{key}" = %s')
+                        params.append(value)
+                    else:
+                        logger.warning(f"Ignoring invalid column name in where condition: {key}")
+                if where_clauses:
+                    query += " WHERE " + " AND ".join(where_clauses)
+            query += ' ORDER BY "createdAt" DESC LIMIT 100;'
+            cur.execute(query, params)
+            columns = [desc[0] for desc in cur.description]
+            return {"results": [dict(zip(columns, row)) for row in cur.fetchall()]}
+        except psycopg2.Error as e:
+            logger.error(f"Database error in get_jobs: {e}")
+            return {"error": f"Database error: {str(e)}", "status_code": 500}
+        finally:
+            if conn:
+                settings.release_db_connection(conn)
+
+    def claim_next_job(self, worker_id):
+        """
+        Atomically moves the oldest queued job to running and returns it with
+        its payload, or None when the queue is empty. SKIP LOCKED lets any
+        number of workers (and processes) poll the same table.
+        """
+        conn = settings.get_db_connection()
+        try:
+            if conn is None:
+                return None
+
+            cur = conn.cursor()
+            cur.execute(f'''
+                UPDATE "IngestionJobs"
+                SET "status" = 'running', "attempts" = "attempts" + 1, "lockedBy" = %s,
+                    "startedAt" = CURRENT_TIMESTAMP, "updatedAt" = CURRENT_TIMESTAMP, "error" = NULL
+                WHERE "jobId" = (
+                    SELECT "jobId" FROM "IngestionJobs"
+                    WHERE "status" = 'queued'
+                    ORDER BY "createdAt"
+                    FOR UPDATE SKIP LOCKED
+                    LIMIT 1
+                )
+                RETURNING {JOB_COLUMNS}, "payload";
+            ''', (worker_id,))
+            row = cur.fetchone()
+            conn.commit()
+            if not row:
+                return None
+            columns = [desc[0] for desc in cur.description]
+            job = dict(zip(columns, row))
+            if job["payload"] is not None:
+                job["payload"] = bytes(job["payload"])
+            return job
+        except psycopg2.Error as e:
+            logger.error(f"Database error in claim_next_job: {e}")
+            conn.rollback()
+            return None
+        finally:
+            if conn:
+                settings.release_db_connection(conn)
+
+    def update_progress(self, job_id, progress):
+        """
+        Stores progress counters (chunksTotal/chunksEmbedded/chunksInserted)
+        and returns True if cancellation has been requested for the job.
+        """
+        conn = settings.get_db_connection()
+        try:
+            if conn is None:
+                return False
+
+            cur = conn.cursor()
+            set_clauses = ['"updatedAt" = CURRENT_TIMESTAMP']
+            params = []
+            for key, value in progress.items():
+                if key in ["chunksTotal", "chunksEmbedded", "chunksInserted"]:
+                    set_clauses.append(f'"{key}" = %s')
+                    params.append(value)
+            cur.execute(
+                f'UPDATE "IngestionJobs" SET {", ".join(set_clauses)} WHERE "jobId" = %s RETURNING "cancelRequested";',
+                params + [job_id]
+            )
+            row = cur.fetchone()
+            conn.commit()
+            return bool(row and row[0])
+        except psycopg2.Error as e:
+            logger.error(f"Database error in update_progress: {e}")
+            conn.rollback()
+            return False
+        finally:
+            if conn:
+                settings.release_db_connection(conn)
+
+    def finish_job(self, job_id, status, result=None, error=None):
+        """
+        Records the outcome of a run. A failed job with attempts left goes
+        back to the queue; the payload is dropped once a job has succeeded.
+        """
+        conn = settings.get_db_connection()
+        try:
+            if conn is None:
+                return False
+
+            cur = conn.cursor()
+            cur.execute('''
+                UPDATE "IngestionJobs"
+                SET "status" = CASE
+                        WHEN %(status)s = 'failed' AND "attempts" < "maxAttempts" AND NOT "cancelRequested" THEN 'queued'
+                        ELSE %(status)s
+                    END,
+                    "result" = %(result)s,
+                    "error" = %(error)s,
+                    "payload" = CASE WHEN %(status)s = 'succeeded' THEN NULL ELSE "payload" END,
+                    "lockedBy" = NULL,
+                    "updatedAt" = CURRENT_TIMESTAMP,
+                    "finishedAt" = CURRENT_TIMESTAMP
+                WHERE "jobId" = %(job_id)s;
+            ''', {
+                "status": status,
+                "result": Json(result) if result is not None else None,
+                "error": error,
+                "job_id": job_id,
+            })
+            conn.commit()
+            return cur.rowcount > 0
+        except psycopg2.Error as e:
+            logger.error(f"Database error in finish_job: {e}")
+            conn.rollback()
+            return False
+        finally:
+            if conn:
+                settings.release_db_connection(conn)
+
+    def cancel_job(self, job_id):
+        """Cancels a queued job immediately; a running job stops at its next progress update."""
+        conn = settings.get_db_connection()
+        try:
+            if conn is None:
+                logger.error("Database connection failed")
+                return {"error": "Database connection failed", "status_code": 503}
+
+            cur = conn.cursor()
+            cur.execute(f'''
+                UPDATE "IngestionJobs"
+                SET "cancelRequested" = TRUE,
+                    "status" = CASE WHEN "status" = 'queued' THEN 'cancelled' ELSE "status" END,
+                    "finishedAt" = CASE WHEN "status" = 'queued' THEN CURRENT_TIMESTAMP ELSE "finishedAt" END,
+                    "updatedAt" = CURRENT_TIMESTAMP
+                WHERE "jobId" = %s AND "status" IN ('queued', 'running')
+                RETURNING {JOB_COLUMNS};
+            ''', (job_id,))
+            row = cur.fetchone()
+            conn.commit()
+            if not row:
+                return {"error": f"Ingestion job with ID {job_id} not found or already finished", "status_code": 409}
+            columns = [desc[0] for desc in cur.description]
+            return {"results": dict(zip(columns, row))}
+        except psycopg2.Error as e:
+            logger.error(f"Database error in cancel_job: {e}")
+            conn.rollback()
+            return {"error": f"Database error: {str(e)}", "status_code": 500}
+        finally:
+            if conn:
+                settings.release_db_connection(conn)
+
+    def retry_job(self, job_id):
+        """Puts a failed or cancelled job back on the queue with fresh progress counters."""
+        conn = settings.get_db_connection()
+        try:
+            if conn is None:
+                logger.error("Database connection failed")
+                return {"error": "Database connection failed", "status_code": 503}
+
+            cur = conn.cursor()
+            cur.execute(f'''
+                UPDATE "IngestionJobs"
+                SET "status" = 'queued', "cancelRequested" = FALSE, "error" = NULL,
+                    "maxAttempts" = GREATEST("maxAttempts", "attempts" + 1),
+                    "chunksTotal" = NULL, "chunksEmbedded" = 0, "chunksInserted" = 0,
+                    "finishedAt" = NULL, "updatedAt" = CURRENT_TIMESTAMP
+                WHERE "jobId" = %s AND "status" IN ('failed', 'cancelled')
+                  AND ("payload" IS NOT NULL OR "sourceUrl" IS NOT NULL)
+                RETURNING {JOB_COLUMNS};
+            ''', (job_id,))
+            row = cur.fetchone()
+            conn.commit()
+            if not row:
+                return {"error": f"Ingestion job with ID {job_id} not found or not retryable", "status_code": 409}
+            columns = [desc[0] for desc in cur.description]
+            return {"results": dict(zip(columns, row))}
+        except psycopg2.Error as e:
+            logger.error(f"Database error in retry_job: {e}")
+            conn.rollback()
+            return {"error": f"Database error: {str(e)}", "status_code": 500}
+        finally:
+            if conn:
+                settings.release_db_connection(conn)
+
+    def requeue_stale_jobs(self, stale_seconds):
+        """Returns running jobs whose worker stopped reporting (e.g. a crashed process) to the queue."""
+        conn = settings.get_db_connection()
+        try:
+            if conn is None:
+                return 0
+
+            cur = conn.cursor()
+            cur.execute('''
+                UPDATE "IngestionJobs"
+                SET "status" = CASE WHEN "cancelRequested" THEN 'cancelled' ELSE 'queued' END,
+                    "lockedBy" = NULL, "updatedAt" = CURRENT_TIMESTAMP
+                WHERE "status" = 'running'
+                  AND "updatedAt" < CURRENT_TIMESTAMP - make_interval(secs => %s);
+            ''', (stale_seconds,))
+            conn.commit()
+            if cur.rowcount:
+                logger.warning(f"Requeued {cur.rowcount} stale ingestion jobs")
+            return cur.rowcount
+        except psycopg2.Error as e:
+            logger.error(f"Database error in requeue_stale_jobs: {e}")
+            conn.rollback()
+            return 0
+        finally:
+            if conn:
+                settings.release_db_connection(conn)
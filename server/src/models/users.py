@@ -55,7 +55,7 @@ class UserModel:
             return {"error": f"Failed to retrieve users: {str(e)}", "status_code": 500}
         finally:
             if conn:
-                conn.close()
+                settings.release_db_connection(conn)
 
     def get_user(self, userId):
         conn = settings.get_db_connection()  
@@ -93,7 +93,7 @@ class UserModel:
             return {"error": f"Failed to retrieve user: {str(e)}", "status_code": 500}
         finally:
             if conn:
-                conn.close()
+                settings.release_db_connection(conn)
 
     def create_user(self, user_data):
         conn = settings.get_db_connection()  
@@ -157,7 +157,7 @@ class UserModel:
             return {"error": f"Failed to create user: {str(e)}", "status_code": 500}
         finally:
             if conn:
-                conn.close()
+                settings.release_db_connection(conn)
             
     def update_user(self, user_data_input, userId):
         conn = settings.get_db_connection()
@@ -229,7 +229,7 @@ class UserModel:
 
         finally:
             if conn:
-                conn.close()
+                settings.release_db_connection(conn)
 
     def delete_user(self, userId):
         conn = settings.get_db_connection()  
@@ -275,4 +275,4 @@ class UserModel:
             return {"error": f"Failed to delete user: {str(e)}", "status_code": 500}
         finally:
             if conn:
-                conn.close()
+                settings.release_db_connection(conn)
@@ -1,6 +1,11 @@
 from fastapi import FastAPI
 from api.routes import router as api_router
 from scalar_fastapi import get_scalar_api_reference
+from core.db import settings as db_settings
+from services.embedding import verify_embedding_dimension
+from controllers.document_chunk import documents_data as chunk_model
+from services.ingestion_queue import get_ingestion_pool
+from services.extraction_pool import get_extraction_pool
 
 app = FastAPI(title="RAG-ify", openapi_url="/openapi.json", debug=False)
 
@@ -8,6 +13,35 @@ app.include_router(api_router, prefix="/api/v1")
 
 router = app.router
 
+@app.on_event("startup")
+def check_embedding_dimension():
+    # Fail fast when the vector column does not match the embedding model
+    verify_embedding_dimension()
+
+@app.on_event("startup")
+def start_ingestion_workers():
+    # Spawn extraction processes up front so the first upload does not pay for it
+    extraction_pool = get_extraction_pool()
+    if extraction_pool is not None:
+        extraction_pool.start()
+    get_ingestion_pool().start()
+
+@app.on_event("shutdown")
+def close_db_pool():
+    # Let running ingestion jobs finish before the pool goes away
+    get_ingestion_pool().stop(timeout=30)
+    extraction_pool = get_extraction_pool()
+    if extraction_pool is not None:
+        extraction_pool.close()
+    # Persist in-process vector indexes so a restart does not rebuild them
+    if chunk_model.search_backend is not None:
+        chunk_model.search_backend.save_all()
+    db_settings.close_pool()
+
+@app.on_event("shutdown")
+async def close_async_db_pool():
+    await db_settings.close_async_pool()
+
 @router.get("/scalar", include_in_schema=False)
 async def scalar_html():
     return get_scalar_api_reference(
@@ -0,0 +1,222 @@
+import copy
+import hashlib
+import json
+import math
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, List, Optional
+from services.embedding_cache import normalize_text
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+def make_params_key(params: dict) -> str:
+    """Stable key for the search parameters an answer depends on (top_k, model, threshold, ...)."""
+    return json.dumps(params, sort_keys=True, default=str)
+
+
+def make_question_key(question: str, params_key: str) -> str:
+    payload = f"{normalize_text(question).casefold()}\x00{params_key}"
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _normalize_vector(embedding):
+    if np is not None:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = float(np.linalg.norm(vector))
+        return vector / norm if norm else vector
+    norm = math.sqrt(sum(x * x for x in embedding))
+    return [x / norm for x in embedding] if norm else list(embedding)
+
+
+class _Entry:
+    __slots__ = ("corpus_key", "params_key", "question", "vector", "response", "signature", "created_at")
+
+    def __init__(self, corpus_key, params_key, question, vector, response, signature):
+        self.corpus_key = corpus_key
+        self.params_key = params_key
+        self.question = question
+        self.vector = vector
+        self.response = response
+        self.signature = signature
+        self.created_at = time.monotonic()
+
+
+class AnswerCache:
+    """
+    Two-level cache of /search answers, scoped per corpus.
+
+    - exact: the normalized question (case and whitespace folded) plus the
+      search parameters.
+    - semantic: a question whose embedding has cosine similarity of at least
+      semantic_threshold with a cached question asked with the same parameters.
+
+    Every entry remembers the corpus signature (see
+    DocumentChunkModel.get_corpus_signature) it was answered against; once
+    the signature changes, every entry of that corpus is dropped. Signatures
+    are re-read from the database at most every signature_ttl seconds, or
+    right away after invalidate() is called for a local write.
+    """
+
+    def __init__(self, signature_fn: Callable[[str], Optional[str]], max_entries: int = 1000, semantic_threshold: Optional[float] = 0.95, ttl: Optional[float] = None, signature_ttl: float = 5.0):
+        self.signature_fn = signature_fn
+        self.max_entries = max_entries
+        self.semantic_threshold = semantic_threshold
+        self.ttl = ttl
+        self.signature_ttl = signature_ttl
+        self._entries = OrderedDict()
+        self._groups = {}
+        self._signatures = {}
+        self._lock = threading.Lock()
+        self._stats = {
+            "exact_hits": 0,
+            "semantic_hits": 0,
+            "misses": 0,
+            "invalidations": 0,
+            "evictions": 0,
+        }
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self._stats[name] += amount
+
+    def signature(self, corpus_key: str) -> Optional[str]:
+        """
+        Returns the current signature of the corpus, or None when it cannot be
+        read (the cache is then bypassed). Entries answered against an older
+        signature are dropped.
+        """
+        now = time.monotonic()
+        with self._lock:
+            remembered = self._signatures.get(corpus_key)
+        if remembered is not None and now - remembered[1] < self.signature_ttl:
+            return remembered[0]
+
+        signature = self.signature_fn(corpus_key)
+        if signature is None:
+            return None
+        with self._lock:
+            self._signatures[corpus_key] = (signature, now)
+            if remembered is None or remembered[0] != signature:
+                self._drop_stale(corpus_key, signature)
+        return signature
+
+    def _drop_stale(self, corpus_key, signature):
+        dropped = [key for key, entry in self._entries.items() if key[0] == corpus_key and entry.signature != signature]
+        for key in dropped:
+            self._remove(key)
+        if dropped:
+            self._stats["invalidations"] += len(dropped)
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            group = self._groups.get((entry.corpus_key, entry.params_key))
+            if group is not None:
+                group.pop(key[1], None)
+                if not group:
+                    del self._groups[(entry.corpus_key, entry.params_key)]
+        return entry
+
+    def _usable(self, entry, signature):
+        if entry.signature != signature:
+            return False
+        return not self.ttl or time.monotonic() - entry.created_at < self.ttl
+
+    def get_exact(self, corpus_key: str, question: str, params: dict, signature: str):
+        """Returns a cached response for the same normalized question and parameters, or None."""
+        key = (corpus_key, make_question_key(question, make_params_key(params)))
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and not self._usable(entry, signature):
+                self._remove(key)
+                entry = None
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            self._stats["exact_hits"] += 1
+            return copy.deepcopy(entry.response)
+
+    def get_semantic(self, corpus_key: str, embedding: List[float], params: dict, signature: str):
+        """
+        Returns (response, similarity, cached_question) for the most similar
+        cached question asked with the same parameters, or None below
+        semantic_threshold. Counts a miss when nothing matches.
+        """
+        if self.semantic_threshold is None:
+            self._count("misses")
+            return None
+        vector = _normalize_vector(embedding)
+        with self._lock:
+            group = self._groups.get((corpus_key, make_params_key(params)))
+            candidates = [entry for entry in group.values() if self._usable(entry, signature)] if group else []
+            best, similarity = None, -1.0
+            if candidates and np is not None:
+                scores = np.stack([entry.vector for entry in candidates]) @ vector
+                index = int(np.argmax(scores))
+                best, similarity = candidates[index], float(scores[index])
+            else:
+                for entry in candidates:
+                    score = sum(a * b for a, b in zip(entry.vector, vector))
+                    if score > similarity:
+                        best, similarity = entry, score
+            if best is None or similarity < self.semantic_threshold:
+                self._stats["misses"] += 1
+                return None
+            self._entries.move_to_end((corpus_key, make_question_key(best.question, best.params_key)))
+            self._stats["semantic_hits"] += 1
+            return copy.deepcopy(best.response), similarity, best.question
+
+    def put(self, corpus_key: str, question: str, params: dict, embedding: Optional[List[float]], response: dict, signature: str):
+        params_key = make_params_key(params)
+        question_key = make_question_key(question, params_key)
+        vector = _normalize_vector(embedding) if embedding is not None else None
+        entry = _Entry(corpus_key, params_key, question, vector, copy.deepcopy(response), signature)
+        with self._lock:
+            remembered = self._signatures.get(corpus_key)
+            if remembered is not None and remembered[0] != signature:
+                # The corpus changed while this answer was being computed
+                return
+            key = (corpus_key, question_key)
+            self._remove(key)
+            self._entries[key] = entry
+            if vector is not None:
+                self._groups.setdefault((corpus_key, params_key), {})[question_key] = entry
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self._stats["evictions"] += 1
+
+    def invalidate(self, corpus_key: Optional[str] = None):
+        """
+        Forgets the remembered signature of corpus_key (or of every corpus),
+        so the next lookup checks the database again. Call after writing
+        documents or chunks.
+        """
+        with self._lock:
+            if corpus_key is None:
+                self._signatures.clear()
+            else:
+                self._signatures.pop(corpus_key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._groups.clear()
+            self._signatures.clear()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._entries)
+            stats["corpora"] = len({key[0] for key in self._entries})
+        lookups = stats["exact_hits"] + stats["semantic_hits"] + stats["misses"]
+        stats["hit_rate"] = (stats["exact_hits"] + stats["semantic_hits"]) / lookups if lookups else 0.0
+        stats["max_entries"] = self.max_entries
+        stats["semantic_threshold"] = self.semantic_threshold
+        stats["ttl"] = self.ttl
+        stats["signature_ttl"] = self.signature_ttl
+        return stats
@@ -0,0 +1,137 @@
+import io
+import json
+import posixpath
+import tarfile
+import tempfile
+import zipfile
+from typing import Iterator, List, Tuple
+
+ARCHIVE_TYPES = ("zip", "tar", "tgz", "gz", "tar.gz", "tbz2", "bz2", "tar.bz2", "txz", "xz", "tar.xz")
+
+# Uploads are spooled to disk past this size while a bulk payload is built
+SPOOL_MAX_BYTES = 64 * 1024 * 1024
+
+
+class ArchiveError(ValueError):
+    """Raised for unreadable archives or requests over the configured limits."""
+
+
+def archive_type(file_name: str):
+    """Returns the archive extension of file_name (e.g. "zip" or "tar.gz"), or None."""
+    name = file_name.lower()
+    for extension in sorted(ARCHIVE_TYPES, key=len, reverse=True):
+        if name.endswith(f".{extension}"):
+            return extension
+    return None
+
+
+def _skip(member_name: str) -> bool:
+    # Directories, hidden files and macOS resource forks are not documents
+    parts = member_name.split("/")
+    return any(part.startswith(".") or part == "__MACOSX" for part in parts)
+
+
+def _clean_name(member_name: str) -> str:
+    name = posixpath.normpath(member_name.replace("\\", "/")).lstrip("/")
+    if name.startswith(".."):
+        raise ArchiveError(f"Archive member outside the archive: {member_name}")
+    return name
+
+
+class SourceBundle:
+    """
+    The sources of one bulk ingestion request (uploaded files, archive
+    members and URLs), written into a single tar payload for an ingestion
+    job (see unpack_sources()).
+
+    One file and byte budget covers the whole request: reserve() is called
+    before a file is read or an archive member expanded, so the request
+    fails as soon as it goes over max_files or max_bytes in total.
+    """
+
+    def __init__(self, max_files: int, max_bytes: int):
+        self.max_files = max_files
+        self.max_bytes = max_bytes
+        self.files = 0
+        self.bytes = 0
+        self.entries = []
+        self._file = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES)
+        self._tar = tarfile.open(fileobj=self._file, mode="w")
+
+    @property
+    def bytes_left(self) -> int:
+        return self.max_bytes - self.bytes
+
+    def reserve(self, size: int, files: int = 1):
+        if self.files + files > self.max_files:
+            raise ArchiveError(f"At most {self.max_files} files can be ingested per request.")
+        if self.bytes + size > self.max_bytes:
+            raise ArchiveError(f"A request can hold at most {self.max_bytes} bytes of documents.")
+        self.files += files
+        self.bytes += size
+
+    def add_file(self, file_type: str, file_name: str, data: bytes):
+        """Adds a file whose size was already reserved."""
+        info = tarfile.TarInfo(f"files/{len(self.entries)}")
+        info.size = len(data)
+        self._tar.addfile(info, io.BytesIO(data))
+        self.entries.append({"fileType": file_type, "fileName": file_name, "member": info.name})
+
+    def add_url(self, url: str):
+        self.reserve(0)
+        self.entries.append({"fileType": "url", "fileName": url.split("/")[-1], "source": url})
+
+    def payload(self) -> bytes:
+        """Closes the bundle and returns the tar payload."""
+        manifest = json.dumps(self.entries).encode("utf-8")
+        info = tarfile.TarInfo("manifest.json")
+        info.size = len(manifest)
+        self._tar.addfile(info, io.BytesIO(manifest))
+        self._tar.close()
+        self._file.seek(0)
+        try:
+            return self._file.read()
+        finally:
+            self._file.close()
+
+
+def unpack_sources(payload: bytes) -> List[dict]:
+    """Returns the {"fileType", "fileName", "source"} list of a SourceBundle payload, in request order."""
+    with tarfile.open(fileobj=io.BytesIO(payload), mode="r") as archive:
+        entries = json.loads(archive.extractfile("manifest.json").read())
+        sources = []
+        for entry in entries:
+            source = entry.get("source")
+            if "member" in entry:
+                source = archive.extractfile(entry["member"]).read()
+            sources.append({"fileType": entry["fileType"], "fileName": entry["fileName"], "source": source})
+        return sources
+
+
+def expand_archive(data: bytes, file_name: str, bundle: SourceBundle) -> Iterator[Tuple[str, bytes]]:
+    """
+    Yields (member path, bytes) for every regular file in a zip or tar
+    archive, in archive order. Each member is reserved in bundle's budget
+    before it is read, so a small compressed upload cannot exhaust memory.
+    """
+    def members():
+        if zipfile.is_zipfile(io.BytesIO(data)):
+            with zipfile.ZipFile(io.BytesIO(data)) as archive:
+                for info in archive.infolist():
+                    if not info.is_dir():
+                        yield info.filename, info.file_size, lambda info=info: archive.read(info)
+            return
+
+        with tarfile.open(fileobj=io.BytesIO(data), mode="r:*") as archive:
+            for info in archive:
+                if info.isfile():
+                    yield info.name, info.size, lambda info=info: archive.extractfile(info).read()
+
+    try:
+        for name, size, read in members():
+            if _skip(name):
+                continue
+            bundle.reserve(size)
+            yield _clean_name(name), read()
+    except (zipfile.BadZipFile, tarfile.TarError, EOFError, OSError) as e:
+        raise ArchiveError(f"Could not read archive {file_name}: {e}")
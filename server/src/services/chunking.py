@@ -1,20 +1,254 @@
 from services.llm_services import llm_service
+from services.embedding import get_max_input_tokens
+from core.config import settings
 import json
+import logging
+import re
+import threading
+from bisect import bisect_left, bisect_right
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, Iterator, List, Optional
 
-def chunking(data: dict):
-    try:
-        context = data.get("text", "")
-        if not context:
-            raise ValueError("Context text is required.")
+logger = logging.getLogger(__name__)
 
-        chunk_type = data.get("chunk_type", "manual")
+# Optional: the model's own tokenizer for exact token counts (CHUNK_TOKENIZER=voyage)
+try:
+    from tokenizers import Tokenizer
+except ImportError:
+    Tokenizer = None
 
-        if chunk_type == "auto":
-            model = data.get("model")
-            if not model:
-                raise ValueError("Model is required for LLM-based chunking.")
 
-            prompt = f"""Split the following text into chunks of approximately 200–300 words each. Each chunk should be numbered sequentially starting from 1. The output must be returned as a structured JSON array in the following format:
+def iter_words(pieces: Iterable[str]) -> Iterator[str]:
+    """
+    Yields the whitespace-separated words of the concatenated pieces, i.e.
+    the same words as "".join(pieces).split(), without building the joined
+    string. A word split across two pieces is reassembled.
+    """
+    carry = ""
+    for piece in pieces:
+        if not piece:
+            continue
+        text = carry + piece
+        words = text.split()
+        # The last word may continue in the next piece
+        if words and not text[-1].isspace():
+            carry = words.pop()
+        else:
+            carry = ""
+        yield from words
+    if carry:
+        yield carry
+
+
+def iter_chunks(pieces: Iterable[str], chunk_size: int, chunk_overlap: int = 0) -> Iterator[dict]:
+    """
+    Streaming word-window chunker over an iterable of text pieces (pages,
+    rows, paragraphs...).
+
+    Produces exactly the chunks of manual chunking on "".join(pieces): windows
+    of chunk_size words, each starting chunk_size - chunk_overlap words after
+    the previous one. A chunk is yielded as soon as its last word has been
+    read, and only the current window of words is kept in memory.
+    """
+    if chunk_size is None or chunk_size <= 0:
+        raise ValueError("Chunk size must be provided and greater than zero for manual chunking.")
+    chunk_overlap = chunk_overlap or 0
+    step = chunk_size - chunk_overlap if chunk_size - chunk_overlap > 0 else chunk_size
+
+    window = []
+    skip = 0
+    chunk_number = 0
+    for word in iter_words(pieces):
+        if skip:
+            # A negative overlap leaves gaps between windows
+            skip -= 1
+            continue
+        window.append(word)
+        if len(window) == chunk_size:
+            chunk_number += 1
+            yield {"chunk_number": chunk_number, "content": " ".join(window)}
+            skip = max(step - chunk_size, 0)
+            del window[:step]
+
+    # Remaining windows start inside the text but run past its end
+    while window:
+        chunk_number += 1
+        yield {"chunk_number": chunk_number, "content": " ".join(window[:chunk_size])}
+        del window[:step]
+
+# Approximate tokenizer: one token per punctuation mark and per 4 word
+# characters, which slightly over-counts BPE tokens for English text
+ESTIMATE_TOKEN_PATTERN = re.compile(r"\w{1,4}|[^\w\s]")
+
+_tokenizers = {}
+_tokenizers_lock = threading.Lock()
+
+
+def _load_tokenizer(model: Optional[str]):
+    if settings.CHUNK_TOKENIZER != "voyage" or Tokenizer is None or not model:
+        return None
+    with _tokenizers_lock:
+        if model not in _tokenizers:
+            try:
+                _tokenizers[model] = Tokenizer.from_pretrained(f"voyageai/{model}")
+            except Exception as e:
+                logger.warning(f"Falling back to estimated token counts for {model}: {e}")
+                _tokenizers[model] = None
+        return _tokenizers[model]
+
+
+def token_offsets(text: str, model: Optional[str] = None) -> List[int]:
+    """
+    Returns the character offset at which each token of text starts, using
+    the embedding model's tokenizer when available and an estimate otherwise.
+    The token count of text[a:b] is then a bisect over these offsets.
+    """
+    tokenizer = _load_tokenizer(model)
+    if tokenizer is not None:
+        encoding = tokenizer.encode(text, add_special_tokens=False)
+        return sorted(start for start, end in encoding.offsets if end > start)
+    return [match.start() for match in ESTIMATE_TOKEN_PATTERN.finditer(text)]
+
+
+def count_tokens(text: str, model: Optional[str] = None) -> int:
+    return len(token_offsets(text, model))
+
+
+# Boundary patterns: a chunk may end (and the next one start) at match.end()
+PARAGRAPH_PATTERN = r"\n[ \t]*\n\s*"
+LINE_PATTERN = r"\n\s*"
+SENTENCE_PATTERN = r"[.!?]+[\"')\]]*\s+"
+WORD_PATTERN = r"\s+"
+# Markdown headings start a new chunk; the boundary is at the start of the heading line
+HEADING_PATTERN = re.compile(r"^#{1,6}[ \t]+\S", re.MULTILINE)
+
+# Boundary levels per strategy, most preferred first. Word boundaries are
+# always the last resort, then raw token boundaries.
+CHUNK_STRATEGIES = {
+    "token": [],
+    "sentence": [f"{PARAGRAPH_PATTERN}|{SENTENCE_PATTERN}"],
+    "paragraph": [PARAGRAPH_PATTERN, LINE_PATTERN, SENTENCE_PATTERN],
+    "markdown": [PARAGRAPH_PATTERN, LINE_PATTERN, SENTENCE_PATTERN],
+    "recursive": None,  # separators supplied by the caller, see DEFAULT_SEPARATORS
+}
+DEFAULT_SEPARATORS = ["\n\n", "\n", ". ", " "]
+DEFAULT_CHUNK_TOKENS = 512
+
+
+def _boundary_levels(text: str, patterns: List[str]) -> List[List[int]]:
+    levels = []
+    for pattern in patterns + [WORD_PATTERN]:
+        levels.append(sorted({match.end() for match in re.finditer(pattern, text) if 0 < match.end() < len(text)}))
+    return levels
+
+
+def _pick_end(levels, hard, start, min_end, max_end):
+    """
+    Picks where the chunk starting at start ends: the first hard boundary
+    if one is in range, else the furthest boundary of the most preferred
+    level in (start, max_end], preferring boundaries at or past min_end.
+    """
+    i = bisect_right(hard, start)
+    if i < len(hard) and hard[i] <= max_end:
+        return hard[i]
+    for lower in (min_end, start + 1):
+        for boundaries in levels:
+            j = bisect_right(boundaries, max_end) - 1
+            if j >= 0 and boundaries[j] >= lower and boundaries[j] > start:
+                return boundaries[j]
+    return None
+
+
+def iter_local_chunks(text: str, chunk_type: str = "sentence", chunk_size: Optional[int] = None, chunk_overlap: int = 0,
+                      model: Optional[str] = None, separators: Optional[List[str]] = None) -> Iterator[dict]:
+    """
+    Splits text into chunks of at most chunk_size tokens without an LLM.
+
+    - token: fixed token windows, cut between words
+    - sentence: whole sentences, never cut mid-sentence unless one sentence
+      exceeds chunk_size
+    - paragraph: paragraphs, falling back to lines and sentences
+    - markdown: like paragraph, but every heading starts a new chunk
+    - recursive: the coarsest of separators (default paragraphs, lines,
+      sentences, words) that keeps the chunk within chunk_size
+
+    Token counts use the embedding model's tokenizer (model, default
+    settings.EMBEDDING_MODEL) and chunk_size is capped at the model's input
+    limit. chunk_overlap is in tokens; the next chunk starts at a boundary
+    roughly chunk_overlap tokens before the end of the previous one.
+
+    Boundary offsets and token offsets are computed once, so the text is
+    scanned linearly with a bisect per chunk. Each chunk also carries the
+    start/end character offsets of its content in text.
+    """
+    if chunk_type not in CHUNK_STRATEGIES:
+        raise ValueError(f"Invalid chunk_type {chunk_type!r}. Must be one of {list(CHUNK_STRATEGIES)}.")
+    model = model or settings.EMBEDDING_MODEL
+    max_tokens = get_max_input_tokens(model)
+    chunk_size = min(chunk_size or DEFAULT_CHUNK_TOKENS, max_tokens) if max_tokens else (chunk_size or DEFAULT_CHUNK_TOKENS)
+    if chunk_size <= 0:
+        raise ValueError("Chunk size must be greater than zero.")
+    chunk_overlap = max(0, min(chunk_overlap or 0, chunk_size - 1))
+
+    if chunk_type == "recursive":
+        patterns = [re.escape(separator) for separator in (separators or DEFAULT_SEPARATORS) if separator]
+    else:
+        patterns = CHUNK_STRATEGIES[chunk_type]
+    levels = _boundary_levels(text, patterns)
+    hard = sorted(match.start() for match in HEADING_PATTERN.finditer(text) if match.start() > 0) if chunk_type == "markdown" else []
+    starts_at = levels[0] if patterns else levels[-1]
+
+    tokens = token_offsets(text, model)
+    total = len(tokens)
+    min_tokens = chunk_size // 4
+
+    start = 0
+    chunk_number = 0
+    while start < len(text):
+        first = bisect_left(tokens, start)
+        if first >= total:
+            break
+        if first + chunk_size >= total:
+            end = len(text)
+        else:
+            # Cut before the token that would exceed chunk_size
+            max_end = tokens[first + chunk_size]
+            min_end = tokens[first + min_tokens] if min_tokens else start + 1
+            end = _pick_end(levels, hard, start, min_end, max_end) or max_end
+            i = bisect_right(hard, start)
+            if i < len(hard) and hard[i] < end:
+                end = hard[i]
+
+        content = text[start:end].strip()
+        if content:
+            chunk_number += 1
+            content_start = start + (len(text[start:end]) - len(text[start:end].lstrip()))
+            yield {
+                "chunk_number": chunk_number,
+                "content": content,
+                "token_count": bisect_left(tokens, end) - first,
+                "start": content_start,
+                "end": content_start + len(content),
+            }
+        if end >= len(text):
+            break
+
+        next_start = end
+        if chunk_overlap:
+            # Start the next chunk at a boundary about chunk_overlap tokens back
+            target = tokens[max(bisect_left(tokens, end) - chunk_overlap, first + 1)]
+            j = bisect_left(starts_at, target)
+            if j < len(starts_at) and starts_at[j] < end:
+                next_start = starts_at[j]
+            # Never carry text from before a heading into the next section
+            i = bisect_right(hard, start)
+            if i < len(hard) and hard[i] == end:
+                next_start = end
+        start = next_start
+
+
+def get_auto_chunk_prompt(text: str):
+    return f"""Split the following text into chunks of approximately 200–300 words each. Each chunk should be numbered sequentially starting from 1. The output must be returned as a structured JSON array in the following format:
 
             [
               {{
@@ -32,19 +266,134 @@ def chunking(data: dict):
             - Logical flow is preserved.
             - No extra commentary—just the raw JSON output.
 
-            Text: {context}
+            Text: {text}
             """
 
-            response = llm_service(prompt, model, context)
 
-            if not response or not response.strip():
-                raise ValueError("LLM returned an empty response.")
+def parse_chunk_json(response: str) -> List[dict]:
+    """Parses the LLM's JSON chunk list, tolerating a markdown code fence around it."""
+    if not response or not response.strip():
+        raise ValueError("LLM returned an empty response.")
+    cleaned = response.strip()
+    if cleaned.startswith("```"):
+        cleaned = cleaned.strip("`").strip()
+        if cleaned.lower().startswith("json"):
+            cleaned = cleaned[4:].strip()
+    try:
+        chunks = json.loads(cleaned)
+    except json.JSONDecodeError:
+        raise ValueError(f"Invalid JSON from LLM: {response}")
+    if not isinstance(chunks, list) or not all(isinstance(chunk, dict) and isinstance(chunk.get("content"), str) for chunk in chunks):
+        raise ValueError(f"Unexpected chunk JSON from LLM: {response}")
+    return chunks
 
-            try:
-                parsed_response = json.loads(response)
-                return parsed_response
-            except json.JSONDecodeError:
-                raise ValueError(f"Invalid JSON from LLM: {response}")
+
+def _chunk_window(text: str, model: str, max_retries: int) -> List[dict]:
+    """Chunks one window with the LLM, retrying only this window on malformed JSON."""
+    for attempt in range(max_retries + 1):
+        response = llm_service(get_auto_chunk_prompt(text), model)
+        try:
+            return parse_chunk_json(response)
+        except ValueError as e:
+            if attempt == max_retries:
+                raise
+            logger.warning(f"Retrying window after malformed LLM output ({attempt + 1}/{max_retries}): {e}")
+
+
+def _locate(content: str, text: str, cursor: int):
+    """
+    Finds the (start, end) span of an LLM chunk in its window text,
+    searching forward from cursor. LLMs may reflow whitespace, so the first
+    and last words of the chunk are matched whitespace-insensitively.
+    Returns None if the chunk cannot be found.
+    """
+    words = content.split()
+    if not words:
+        return None
+    head = re.compile(r"\s+".join(re.escape(word) for word in words[:8])).search(text, cursor)
+    if head is None:
+        return None
+    tail = re.compile(r"\s+".join(re.escape(word) for word in words[-8:])).search(text, head.start())
+    end = tail.end() if tail else head.start() + len(content)
+    return head.start(), max(end, head.end())
+
+
+def auto_chunking(text: str, model: str, window_tokens: Optional[int] = None, window_overlap: Optional[int] = None,
+                  concurrency: Optional[int] = None, max_retries: Optional[int] = None) -> List[dict]:
+    """
+    LLM chunking for documents of any length (map-reduce).
+
+    The text is cut at sentence/paragraph boundaries into windows of about
+    window_tokens tokens that overlap by window_overlap tokens. Windows are
+    chunked by the LLM concurrently (at most concurrency calls at once);
+    a window whose JSON is malformed is retried on its own.
+
+    Windows are stitched at the middle of their overlap: a window's chunks
+    stop there, chunks of the next window that were already covered are
+    dropped and one straddling the seam is trimmed, so overlap text is
+    neither repeated nor lost. The stitched chunks are renumbered from 1.
+    """
+    window_tokens = window_tokens or settings.AUTO_CHUNK_WINDOW_TOKENS
+    window_overlap = settings.AUTO_CHUNK_WINDOW_OVERLAP if window_overlap is None else window_overlap
+    concurrency = concurrency or settings.AUTO_CHUNK_CONCURRENCY
+    max_retries = settings.AUTO_CHUNK_MAX_RETRIES if max_retries is None else max_retries
+
+    windows = list(iter_local_chunks(text, "paragraph", window_tokens, window_overlap))
+    if not windows:
+        return []
+
+    with ThreadPoolExecutor(max_workers=min(concurrency, len(windows)), thread_name_prefix="auto-chunking") as executor:
+        results = list(executor.map(lambda window: _chunk_window(window["content"], model, max_retries), windows))
+
+    # A window hands over to the next one at the middle of their overlap
+    handover = []
+    for window, following in zip(windows, windows[1:]):
+        handover.append((following["start"] + max(window["end"], following["start"])) // 2)
+    handover.append(len(text) + 1)
+
+    chunks = []
+    covered = 0
+    for window, window_chunks, stop in zip(windows, results, handover):
+        cursor = 0
+        for chunk in window_chunks:
+            content = chunk["content"].strip()
+            if not content:
+                continue
+            span = _locate(content, window["content"], cursor)
+            if span is None:
+                # Unmatched (e.g. paraphrased) output is kept as the LLM returned it
+                chunks.append(content)
+                continue
+            cursor = span[0]
+            start, end = window["start"] + span[0], window["start"] + span[1]
+            if start >= stop:
+                break
+            if end <= covered:
+                # Already emitted from the previous window's side of the overlap
+                continue
+            if start < covered:
+                content = text[covered:end].strip()
+            if content:
+                chunks.append(content)
+            covered = end
+
+    return [{"chunk_number": i + 1, "content": content} for i, content in enumerate(chunks)]
+
+
+def chunking(data: dict):
+    try:
+        context = data.get("text", "")
+        if not context:
+            raise ValueError("Context text is required.")
+
+        chunk_type = data.get("chunk_type", "manual")
+
+        if chunk_type == "auto":
+            model = data.get("model")
+            if not model:
+                raise ValueError("Model is required for LLM-based chunking.")
+
+            return auto_chunking(context, model)
 
         elif chunk_type == "manual":
             chunk_size = data.get("chunk_size")
@@ -53,24 +402,21 @@ def chunking(data: dict):
             if chunk_size is None or chunk_size <= 0:
                 raise ValueError("Chunk size must be provided and greater than zero for manual chunking.")
 
-            # Split context into lines
-            words = context.split()
-            chunks = []
-            start = 0
-
-            while start < len(words):
-                end = start + chunk_size
-                chunk_words = words[start:end]
-                chunk_text = " ".join(chunk_words)
-                chunks.append(chunk_text)
-
-                # Move start forward, allowing for overlap
-                start = end - chunk_overlap if end - chunk_overlap > start else end
+            return list(iter_chunks([context], chunk_size, chunk_overlap))
 
-            return [{"chunk_number": i + 1, "content": chunk} for i, chunk in enumerate(chunks)]
+        elif chunk_type in CHUNK_STRATEGIES:
+            # Local strategies size chunks in tokens of the embedding model
+            return list(iter_local_chunks(
+                context,
+                chunk_type,
+                data.get("chunk_size"),
+                data.get("chunk_overlap", 0),
+                model=data.get("embedding_model"),
+                separators=data.get("separators"),
+            ))
 
         else:
-            raise ValueError("Invalid chunk_type. Must be 'auto' or 'manual'.")
+            raise ValueError(f"Invalid chunk_type. Must be 'auto', 'manual' or one of {list(CHUNK_STRATEGIES)}.")
 
     except Exception as e:
         raise ValueError(f"An error occurred during chunking: {str(e)}")
@@ -1,6 +1,11 @@
-import voyageai
-from typing import List
-# from core.config import settings
+import asyncio
+import hashlib
+import logging
+import math
+import re
+from typing import List, Optional
+from core.config import settings
+from services.embedding_cache import EmbeddingCache
 
 # voyage = voyageai.Client(api_key=settings.VOYAGE_API_KEY)
 from dotenv import load_dotenv
@@ -9,18 +14,330 @@ import os
 load_dotenv()
 api_key = os.getenv("VOYAGE_API_KEY")
 
-voyage = voyageai.Client(api_key=api_key)
+logger = logging.getLogger(__name__)
 
-def get_embedding(model: str, texts: List[str]):
+# Per-request limits published by Voyage AI. Tokens are estimated locally, so
+# batches are also split automatically if the provider still rejects them.
+DEFAULT_MAX_BATCH_SIZE = 1000
+DEFAULT_MAX_BATCH_TOKENS = 120_000
+MODEL_LIMITS = {
+    "voyage-3-large": {"max_batch_size": 1000, "max_batch_tokens": 120_000, "max_input_tokens": 32_000},
+    "voyage-3.5": {"max_batch_size": 1000, "max_batch_tokens": 320_000, "max_input_tokens": 32_000},
+    "voyage-3.5-lite": {"max_batch_size": 1000, "max_batch_tokens": 1_000_000, "max_input_tokens": 32_000},
+    "voyage-3": {"max_batch_size": 1000, "max_batch_tokens": 320_000, "max_input_tokens": 32_000},
+    "voyage-3-lite": {"max_batch_size": 1000, "max_batch_tokens": 1_000_000, "max_input_tokens": 32_000},
+    "voyage-code-3": {"max_batch_size": 1000, "max_batch_tokens": 120_000, "max_input_tokens": 32_000},
+}
+
+
+# Default output dimension of each model. The DocumentChunks."embeddingData"
+# column must be declared with the dimension of settings.EMBEDDING_MODEL.
+MODEL_DIMENSIONS = {
+    "voyage-3-large": 1024,
+    "voyage-3.5": 1024,
+    "voyage-3.5-lite": 1024,
+    "voyage-3": 1024,
+    "voyage-3-lite": 512,
+    "voyage-code-3": 1024,
+    "voyage-finance-2": 1024,
+    "voyage-law-2": 1024,
+    "voyage-multilingual-2": 1024,
+    "voyage-large-2": 1536,
+    "voyage-2": 1024,
+}
+
+# "document" for text that is stored and searched, "query" for search questions
+INPUT_TYPES = ("document", "query")
+
+# Voyage rejects oversized requests with a 400 whose message names the limit
+# ("max allowed tokens per submitted batch", "batch size limit", ...); only
+# those are worth retrying as smaller batches
+BATCH_LIMIT_PATTERN = re.compile(r"tokens per (submitted )?batch|max(imum)? allowed tokens|batch size|too many tokens|too large", re.IGNORECASE)
+
+
+class EmbeddingBatchTooLargeError(Exception):
+    """Raised by a backend when a batch exceeds the provider's request limits."""
+
+
+class EmbeddingBackend:
+    """
+    Interface for embedding providers.
+
+    Subclasses implement embed() and may override count_tokens() with an
+    exact tokenizer.
+    """
+
+    def embed(self, texts: List[str], model: str, input_type: str = "query") -> List[List[float]]:
+        raise NotImplementedError
+
+    async def embed_async(self, texts: List[str], model: str, input_type: str = "query") -> List[List[float]]:
+        # Backends without a native async client run embed() in a worker thread
+        return await asyncio.to_thread(self.embed, texts, model, input_type)
+
+    def count_tokens(self, texts: List[str], model: str) -> int:
+        # Conservative estimate (~3 characters per token)
+        return sum(len(text) // 3 + 1 for text in texts)
+
+
+class VoyageEmbeddingBackend(EmbeddingBackend):
+    """Embeds texts with the Voyage AI API."""
+
+    def __init__(self, api_key: Optional[str] = api_key):
+        import voyageai
+
+        self._error = voyageai.error
+        self.client = voyageai.Client(api_key=api_key)
+        self.async_client = voyageai.AsyncClient(api_key=api_key)
+
+    def _is_batch_limit_error(self, error, texts):
+        """True when a multi-text request was rejected for its size rather than its content."""
+        if len(texts) <= 1:
+            return False
+        if getattr(error, "http_status", None) == 413:
+            return True
+        return bool(BATCH_LIMIT_PATTERN.search(getattr(error, "user_message", None) or str(error)))
+
+    def embed(self, texts, model, input_type="query"):
+        try:
+            result = self.client.embed(texts, model=model, input_type=input_type)
+        except self._error.InvalidRequestError as e:
+            if self._is_batch_limit_error(e, texts):
+                raise EmbeddingBatchTooLargeError(str(e)) from e
+            raise
+        return result.embeddings
+
+    async def embed_async(self, texts, model, input_type="query"):
+        try:
+            result = await self.async_client.embed(texts, model=model, input_type=input_type)
+        except self._error.InvalidRequestError as e:
+            if self._is_batch_limit_error(e, texts):
+                raise EmbeddingBatchTooLargeError(str(e)) from e
+            raise
+        return result.embeddings
+
+
+class FakeEmbeddingBackend(EmbeddingBackend):
+    """
+    Deterministic local backend for tests and benchmarks.
+
+    Vectors are derived from a hash of the text, so the same input always
+    yields the same unit-length vector and no network access is needed.
+    """
+
+    def __init__(self, dimension: int = 1024, max_batch_size: Optional[int] = None):
+        self.dimension = dimension
+        self.max_batch_size = max_batch_size
+        self.calls = 0
+
+    def embed(self, texts, model, input_type="query"):
+        if self.max_batch_size and len(texts) > self.max_batch_size:
+            raise EmbeddingBatchTooLargeError(f"Batch of {len(texts)} exceeds {self.max_batch_size}")
+        self.calls += 1
+        return [self._vector(f"{model}|{input_type}|{text}") for text in texts]
+
+    def _vector(self, text):
+        values = []
+        counter = 0
+        while len(values) < self.dimension:
+            digest = hashlib.sha256(f"{counter}|{text}".encode("utf-8")).digest()
+            values.extend((byte - 127.5) / 127.5 for byte in digest)
+            counter += 1
+        values = values[:self.dimension]
+        norm = math.sqrt(sum(v * v for v in values)) or 1.0
+        return [v / norm for v in values]
+
+
+_backend: Optional[EmbeddingBackend] = None
+
+
+def get_embedding_backend() -> EmbeddingBackend:
+    """Returns the active backend, creating the Voyage client on first use."""
+    global _backend
+    if _backend is None:
+        _backend = VoyageEmbeddingBackend()
+    return _backend
+
+
+def set_embedding_backend(backend: EmbeddingBackend):
+    """Replaces the active backend (e.g. with FakeEmbeddingBackend in tests)."""
+    global _backend
+    _backend = backend
+
+
+_cache: Optional[EmbeddingCache] = None
+_cache_initialized = False
+
+
+def get_embedding_cache() -> Optional[EmbeddingCache]:
+    """Returns the process-wide embedding cache, or None when caching is disabled."""
+    global _cache, _cache_initialized
+    if not _cache_initialized:
+        if settings.EMBEDDING_CACHE_ENABLED:
+            store = None
+            if settings.EMBEDDING_CACHE_PERSIST:
+                from models.embedding_cache import EmbeddingCacheModel
+                store = EmbeddingCacheModel()
+            _cache = EmbeddingCache(
+                max_memory_entries=settings.EMBEDDING_CACHE_MEMORY_SIZE,
+                store=store,
+                max_store_rows=settings.EMBEDDING_CACHE_MAX_ROWS,
+            )
+        _cache_initialized = True
+    return _cache
+
+
+def set_embedding_cache(cache: Optional[EmbeddingCache]):
+    """Replaces the embedding cache; pass None to disable caching."""
+    global _cache, _cache_initialized
+    _cache = cache
+    _cache_initialized = True
+
+
+def _cached_embed(model: str, input_type: str, texts: List[str], embed_fn):
+    cache = get_embedding_cache()
+    if cache is None:
+        return embed_fn(texts)
+    return cache.get_or_embed(model, input_type, texts, embed_fn)
+
+
+async def _cached_embed_async(model: str, input_type: str, texts: List[str], embed_fn):
+    cache = get_embedding_cache()
+    if cache is None:
+        return await embed_fn(texts)
+    return await cache.get_or_embed_async(model, input_type, texts, embed_fn)
+
+
+def _check_input_type(input_type: str):
+    if input_type not in INPUT_TYPES:
+        raise ValueError(f"Invalid input_type {input_type!r}. Must be one of {INPUT_TYPES}.")
+
+
+def get_embedding(model: str, texts: List[str], input_type: str = "query"):
     """
     Embeds a list of texts using Voyage AI.
-    
+    Previously embedded texts are served from the embedding cache.
+
     Parameters:
     - model: The embedding model (default is "voyage-3-large").
     - texts: A list of strings to be embedded.
+    - input_type: "query" for search questions, "document" for stored text.
 
     Returns:
     - List of embeddings.
     """
-    result = voyage.embed(texts, model=model, input_type="query")
-    return result.embeddings
+    _check_input_type(input_type)
+    backend = get_embedding_backend()
+    return _cached_embed(model, input_type, texts, lambda missing: backend.embed(missing, model, input_type=input_type))
+
+
+async def get_embedding_async(model: str, texts: List[str], input_type: str = "query"):
+    """
+    Async version of get_embedding() for async routes; awaits the provider
+    instead of blocking the event loop.
+    """
+    _check_input_type(input_type)
+    backend = get_embedding_backend()
+    return await _cached_embed_async(model, input_type, texts, lambda missing: backend.embed_async(missing, model, input_type=input_type))
+
+
+def make_batches(texts: List[str], model: str, max_batch_size: Optional[int] = None, max_batch_tokens: Optional[int] = None):
+    """
+    Groups texts into consecutive batches that respect the per-request
+    item and token limits of the model. Yields (start_index, batch) tuples.
+    """
+    limits = MODEL_LIMITS.get(model, {})
+    max_batch_size = max_batch_size or limits.get("max_batch_size", DEFAULT_MAX_BATCH_SIZE)
+    max_batch_tokens = max_batch_tokens or limits.get("max_batch_tokens", DEFAULT_MAX_BATCH_TOKENS)
+    backend = get_embedding_backend()
+
+    start = 0
+    batch = []
+    batch_tokens = 0
+    for i, text in enumerate(texts):
+        tokens = backend.count_tokens([text], model)
+        if batch and (len(batch) >= max_batch_size or batch_tokens + tokens > max_batch_tokens):
+            yield start, batch
+            start, batch, batch_tokens = i, [], 0
+        batch.append(text)
+        batch_tokens += tokens
+    if batch:
+        yield start, batch
+
+
+def _embed_batch(texts: List[str], model: str, input_type: str):
+    """Embeds one batch, halving it whenever the provider rejects it as too large."""
+    backend = get_embedding_backend()
+    try:
+        return backend.embed(texts, model, input_type=input_type)
+    except EmbeddingBatchTooLargeError:
+        if len(texts) <= 1:
+            raise
+        middle = len(texts) // 2
+        return _embed_batch(texts[:middle], model, input_type) + _embed_batch(texts[middle:], model, input_type)
+
+
+def _embed_in_batches(model: str, texts: List[str], input_type: str, max_batch_size=None, max_batch_tokens=None, on_progress=None):
+    embeddings = [None] * len(texts)
+    for start, batch in make_batches(texts, model, max_batch_size, max_batch_tokens):
+        batch_embeddings = _embed_batch(batch, model, input_type)
+        if len(batch_embeddings) != len(batch):
+            raise RuntimeError(f"Expected {len(batch)} embeddings, got {len(batch_embeddings)}")
+        embeddings[start:start + len(batch)] = batch_embeddings
+        if on_progress:
+            on_progress(start + len(batch))
+    return embeddings
+
+
+def embed_in_batches(model: str, texts: List[str], input_type: str = "document", max_batch_size: Optional[int] = None, max_batch_tokens: Optional[int] = None, on_progress=None):
+    """
+    Embeds any number of texts with as few provider requests as the model's
+    limits allow. Cached texts are skipped. The returned embeddings are in
+    the same order as texts.
+
+    on_progress, if given, is called with the number of texts embedded so
+    far after each provider request (cache hits are not counted).
+    """
+    _check_input_type(input_type)
+    return _cached_embed(
+        model, input_type, texts,
+        lambda missing: _embed_in_batches(model, missing, input_type, max_batch_size, max_batch_tokens, on_progress)
+    )
+
+
+def get_model_dimension(model: str) -> Optional[int]:
+    return MODEL_DIMENSIONS.get(model)
+
+
+def get_max_input_tokens(model: str) -> Optional[int]:
+    """Longest text (in tokens) the model embeds without truncation, if known."""
+    return MODEL_LIMITS.get(model, {}).get("max_input_tokens")
+
+
+def verify_embedding_dimension(model: Optional[str] = None):
+    """
+    Checks that DocumentChunks."embeddingData" is declared with the output
+    dimension of the configured embedding model.
+
+    Raises RuntimeError on a mismatch. Returns the column dimension, or None
+    when it could not be determined (unknown model, no database, untyped column).
+    """
+    from models.document_chunk import DocumentChunkModel
+
+    model = model or settings.EMBEDDING_MODEL
+    expected = get_model_dimension(model)
+    if expected is None:
+        logger.warning(f"Unknown embedding model {model!r}; skipping dimension check")
+        return None
+
+    actual = DocumentChunkModel().get_embedding_dimension()
+    if actual is None:
+        logger.warning("Could not read the DocumentChunks.embeddingData dimension; skipping check")
+        return None
+
+    if actual != expected:
+        raise RuntimeError(
+            f'DocumentChunks."embeddingData" is vector({actual}) but embedding model '
+            f"{model!r} produces {expected}-dimensional vectors"
+        )
+    logger.info(f"Embedding dimension check passed: {model} -> vector({actual})")
+    return actual
@@ -0,0 +1,153 @@
+import asyncio
+import hashlib
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Awaitable, Callable, List, Optional
+
+
+def normalize_text(text: str) -> str:
+    """Normalizes unicode and collapses whitespace so trivial variants share a cache entry."""
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+def make_cache_key(model: str, input_type: Optional[str], text: str) -> str:
+    payload = f"{model}\x00{input_type or ''}\x00{normalize_text(text)}"
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Content-addressed embedding cache with two tiers.
+
+    - memory: an in-process LRU bounded by max_memory_entries.
+    - store: an optional persistent tier (see models.embedding_cache) with
+      get_embeddings/put_embeddings/evict methods, trimmed to max_store_rows.
+    """
+
+    def __init__(self, max_memory_entries: int = 10_000, store=None, max_store_rows: Optional[int] = None, evict_every: int = 1000):
+        self.max_memory_entries = max_memory_entries
+        self.store = store
+        self.max_store_rows = max_store_rows
+        self.evict_every = evict_every
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._writes_since_evict = 0
+        self._stats = {
+            "memory_hits": 0,
+            "store_hits": 0,
+            "misses": 0,
+            "memory_evictions": 0,
+            "store_evictions": 0,
+        }
+
+    def _memory_get(self, key):
+        with self._lock:
+            embedding = self._memory.get(key)
+            if embedding is not None:
+                self._memory.move_to_end(key)
+            return embedding
+
+    def _memory_put(self, key, embedding):
+        with self._lock:
+            self._memory[key] = embedding
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_memory_entries:
+                self._memory.popitem(last=False)
+                self._stats["memory_evictions"] += 1
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self._stats[name] += amount
+
+    def _lookup(self, model, input_type, texts):
+        """Returns (keys, found, pending): pending maps each distinct uncached key to its text."""
+        keys = [make_cache_key(model, input_type, text) for text in texts]
+        found = {}
+
+        for key in set(keys):
+            embedding = self._memory_get(key)
+            if embedding is not None:
+                found[key] = embedding
+        self._count("memory_hits", sum(1 for key in keys if key in found))
+
+        missing = [key for key in set(keys) if key not in found]
+        if missing and self.store is not None:
+            stored = self.store.get_embeddings(missing)
+            for key, embedding in stored.items():
+                found[key] = embedding
+                self._memory_put(key, embedding)
+            self._count("store_hits", sum(1 for key in keys if key in stored))
+
+        # Embed each distinct missing text once
+        pending = OrderedDict()
+        for key, text in zip(keys, texts):
+            if key not in found and key not in pending:
+                pending[key] = text
+        if pending:
+            self._count("misses", sum(1 for key in keys if key in pending))
+        return keys, found, pending
+
+    def _remember(self, model, input_type, found, pending, embeddings):
+        if len(embeddings) != len(pending):
+            raise RuntimeError(f"Expected {len(pending)} embeddings, got {len(embeddings)}")
+        new_entries = []
+        for key, embedding in zip(pending.keys(), embeddings):
+            found[key] = embedding
+            self._memory_put(key, embedding)
+            new_entries.append((key, model, input_type, embedding))
+        if self.store is not None:
+            written = self.store.put_embeddings(new_entries)
+            self._maybe_evict_store(written)
+
+    def get_or_embed(self, model: str, input_type: Optional[str], texts: List[str], embed_fn: Callable[[List[str]], List[List[float]]]):
+        """
+        Returns embeddings for texts, calling embed_fn only for the distinct
+        texts found in neither tier. Order matches texts.
+        """
+        keys, found, pending = self._lookup(model, input_type, texts)
+        if pending:
+            embeddings = embed_fn(list(pending.values()))
+            self._remember(model, input_type, found, pending, embeddings)
+        return [found[key] for key in keys]
+
+    async def get_or_embed_async(self, model: str, input_type: Optional[str], texts: List[str], embed_fn: Callable[[List[str]], Awaitable[List[List[float]]]]):
+        """
+        Async version of get_or_embed() taking a coroutine embed_fn. The
+        persistent tier is sync, so it is only touched from a worker thread.
+        """
+        if self.store is None:
+            keys, found, pending = self._lookup(model, input_type, texts)
+        else:
+            keys, found, pending = await asyncio.to_thread(self._lookup, model, input_type, texts)
+        if pending:
+            embeddings = await embed_fn(list(pending.values()))
+            if self.store is None:
+                self._remember(model, input_type, found, pending, embeddings)
+            else:
+                await asyncio.to_thread(self._remember, model, input_type, found, pending, embeddings)
+        return [found[key] for key in keys]
+
+    def _maybe_evict_store(self, written):
+        if not self.max_store_rows:
+            return
+        with self._lock:
+            self._writes_since_evict += written
+            if self._writes_since_evict < self.evict_every:
+                return
+            self._writes_since_evict = 0
+        self._count("store_evictions", self.store.evict(self.max_store_rows))
+
+    def clear_memory(self):
+        with self._lock:
+            self._memory.clear()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["memory_entries"] = len(self._memory)
+        lookups = stats["memory_hits"] + stats["store_hits"] + stats["misses"]
+        stats["hit_rate"] = (stats["memory_hits"] + stats["store_hits"]) / lookups if lookups else 0.0
+        stats["max_memory_entries"] = self.max_memory_entries
+        stats["max_store_rows"] = self.max_store_rows
+        return stats
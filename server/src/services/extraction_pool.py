@@ -0,0 +1,244 @@
+import logging
+import multiprocessing
+import queue
+import threading
+import time
+from typing import Optional
+from core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class ExtractionError(Exception):
+    """Raised when a document could not be extracted in a worker process."""
+
+
+class ExtractionTimeoutError(ExtractionError):
+    """Raised when an extraction job exceeds its timeout; the worker is killed."""
+
+
+def _set_memory_limit(memory_limit_mb):
+    if not memory_limit_mb:
+        return
+    try:
+        import resource
+        limit = int(memory_limit_mb) * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    except (ImportError, ValueError, OSError) as e:
+        logger.warning(f"Could not set extraction memory limit: {e}")
+
+
+def _worker_main(conn, memory_limit_mb):
+    """Worker process loop: receives (task, args) jobs and sends back results."""
+    _set_memory_limit(memory_limit_mb)
+    from services.text_extractor import extract_text, convert_pdf_pages
+
+    tasks = {"extract_text": extract_text, "pdf_pages": convert_pdf_pages}
+    while True:
+        try:
+            job = conn.recv()
+        except (EOFError, KeyboardInterrupt):
+            break
+        if job is None:
+            break
+        task, args = job
+        try:
+            conn.send(("ok", tasks[task](*args)))
+        except MemoryError:
+            conn.send(("error", f"Extraction exceeded the {memory_limit_mb} MB memory limit"))
+        except Exception as e:
+            conn.send(("error", f"{type(e).__name__}: {e}"))
+
+
+class _Worker:
+    def __init__(self, context, memory_limit_mb):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=_worker_main, args=(child_conn, memory_limit_mb), daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.jobs = 0
+
+    def stop(self, kill=False):
+        if kill:
+            self.process.kill()
+        else:
+            try:
+                self.conn.send(None)
+            except (OSError, ValueError):
+                pass
+        self.process.join(5)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+        self.conn.close()
+
+
+class ExtractionPool:
+    """
+    Runs extract_text() in a fixed set of worker processes.
+
+    PDF conversion and OCR are CPU-bound and hold the GIL, so they run in
+    separate processes. Callers block only their own thread while a job
+    runs; when every worker is busy they wait in line (queue depth).
+
+    - timeout: seconds per job; a job that runs longer has its worker killed
+    - memory_limit_mb: address-space limit for each worker (0 = unlimited)
+    - max_jobs_per_worker: workers are replaced after this many jobs to
+      contain leaks in native libraries
+    """
+
+    def __init__(self, workers: int = 2, timeout: Optional[float] = 300, memory_limit_mb: int = 0, max_jobs_per_worker: int = 50, start_method: str = "spawn"):
+        self.workers = workers
+        self.timeout = timeout
+        self.memory_limit_mb = memory_limit_mb
+        self.max_jobs_per_worker = max_jobs_per_worker
+        self._context = multiprocessing.get_context(start_method)
+        self._idle = queue.Queue()
+        self._lock = threading.Lock()
+        self._started = False
+        self._closed = False
+        self._waiting = 0
+        self._busy = 0
+        self._stats = {"jobs": 0, "errors": 0, "timeouts": 0, "recycled": 0, "killed": 0, "total_wait_time": 0.0}
+        self._formats = {}
+
+    def start(self):
+        with self._lock:
+            if self._started:
+                return
+            for _ in range(self.workers):
+                self._idle.put(_Worker(self._context, self.memory_limit_mb))
+            self._started = True
+            self._closed = False
+        logger.info(f"Started {self.workers} extraction workers")
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            self._started = False
+        while True:
+            try:
+                worker = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            worker.stop()
+
+    def extract(self, file_type: str, file_bytes_or_url, timeout: Optional[float] = None):
+        """Extracts text in a worker process. Same arguments and result as extract_text()."""
+        file_type = file_type.lower()
+        return self._run("extract_text", (file_type, file_bytes_or_url), file_type, timeout)
+
+    def convert_pdf_pages(self, pdf_path: str, start: int, end: int, timeout: Optional[float] = None):
+        """Converts pages [start, end) of a PDF file in a worker process; see text_extractor.convert_pdf_pages()."""
+        return self._run("pdf_pages", (pdf_path, start, end), "pdf_pages", timeout)
+
+    def _run(self, task, args, file_type, timeout):
+        if not self._started:
+            self.start()
+        timeout = self.timeout if timeout is None else timeout
+
+        start = time.monotonic()
+        with self._lock:
+            self._waiting += 1
+        try:
+            worker = self._idle.get()
+        finally:
+            with self._lock:
+                self._waiting -= 1
+                self._busy += 1
+                self._stats["total_wait_time"] += time.monotonic() - start
+
+        worker.jobs += 1
+        job_start = time.monotonic()
+        outcome = "error"
+        try:
+            try:
+                worker.conn.send((task, args))
+            except (OSError, ValueError):
+                worker = self._replace(worker, kill=True)
+                raise ExtractionError(f"Extraction worker was not running; retry the {file_type} job")
+            if not worker.conn.poll(timeout):
+                outcome = "timeout"
+                worker = self._replace(worker, kill=True)
+                raise ExtractionTimeoutError(f"Extraction of {file_type} timed out after {timeout} seconds")
+            try:
+                status, payload = worker.conn.recv()
+            except (EOFError, OSError):
+                # The worker died, e.g. killed by the OOM killer or a native crash
+                worker = self._replace(worker, kill=True)
+                raise ExtractionError(f"Extraction worker exited while processing {file_type}")
+            if status != "ok":
+                raise ExtractionError(payload)
+            outcome = "ok"
+            return payload
+        finally:
+            self._record(file_type, outcome, time.monotonic() - job_start)
+            if self.max_jobs_per_worker and worker.jobs >= self.max_jobs_per_worker:
+                with self._lock:
+                    self._stats["recycled"] += 1
+                worker = self._replace(worker)
+            with self._lock:
+                self._busy -= 1
+            if self._closed:
+                worker.stop()
+            else:
+                self._idle.put(worker)
+
+    def _replace(self, worker, kill=False):
+        if kill:
+            with self._lock:
+                self._stats["killed"] += 1
+        worker.stop(kill=kill)
+        return _Worker(self._context, self.memory_limit_mb)
+
+    def _record(self, file_type, outcome, elapsed):
+        with self._lock:
+            self._stats["jobs"] += 1
+            if outcome == "timeout":
+                self._stats["timeouts"] += 1
+            elif outcome != "ok":
+                self._stats["errors"] += 1
+            fmt = self._formats.setdefault(file_type, {"jobs": 0, "errors": 0, "timeouts": 0, "total_time": 0.0, "max_time": 0.0})
+            fmt["jobs"] += 1
+            if outcome == "timeout":
+                fmt["timeouts"] += 1
+            elif outcome != "ok":
+                fmt["errors"] += 1
+            fmt["total_time"] += elapsed
+            fmt["max_time"] = max(fmt["max_time"], elapsed)
+
+    def stats(self):
+        """Queue depth, worker usage and per-format timings (seconds)."""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["queue_depth"] = self._waiting
+            stats["busy"] = self._busy
+            formats = {name: dict(values) for name, values in self._formats.items()}
+        for values in formats.values():
+            values["avg_time"] = values["total_time"] / values["jobs"] if values["jobs"] else 0.0
+        stats["formats"] = formats
+        stats["workers"] = self.workers
+        stats["timeout"] = self.timeout
+        stats["memory_limit_mb"] = self.memory_limit_mb
+        stats["max_jobs_per_worker"] = self.max_jobs_per_worker
+        return stats
+
+
+_pool: Optional[ExtractionPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_extraction_pool() -> Optional[ExtractionPool]:
+    """Returns the process-wide extraction pool, or None when EXTRACTION_WORKERS is 0."""
+    global _pool
+    if settings.EXTRACTION_WORKERS <= 0:
+        return None
+    with _pool_lock:
+        if _pool is None:
+            _pool = ExtractionPool(
+                workers=settings.EXTRACTION_WORKERS,
+                timeout=settings.EXTRACTION_TIMEOUT_SECONDS,
+                memory_limit_mb=settings.EXTRACTION_MEMORY_LIMIT_MB,
+                max_jobs_per_worker=settings.EXTRACTION_MAX_JOBS_PER_WORKER,
+            )
+    return _pool
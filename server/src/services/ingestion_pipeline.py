@@ -0,0 +1,331 @@
+import logging
+import queue
+import threading
+import time
+from typing import Callable, Iterable, List, Optional
+from core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Marks the end of a queue; one is sent per consumer
+_DONE = object()
+
+
+class PipelineStopped(Exception):
+    """Raised inside a stage when another stage has failed."""
+
+
+class StageMetrics:
+    """Item counts and timings of one pipeline stage, shared by its workers."""
+
+    def __init__(self, name: str, workers: int):
+        self.name = name
+        self.workers = workers
+        self.items = 0
+        self.batches = 0
+        self.busy_time = 0.0
+        self.wait_time = 0.0
+        self.first_start = None
+        self.last_end = None
+        self._lock = threading.Lock()
+
+    def record(self, items: int, started: float, ended: float, waited: float = 0.0):
+        with self._lock:
+            self.items += items
+            self.batches += 1
+            self.busy_time += ended - started
+            self.wait_time += waited
+            self.first_start = started if self.first_start is None else min(self.first_start, started)
+            self.last_end = ended if self.last_end is None else max(self.last_end, ended)
+
+    def add_wait(self, waited: float):
+        with self._lock:
+            self.wait_time += waited
+
+    def as_dict(self):
+        with self._lock:
+            active = (self.last_end - self.first_start) if self.first_start is not None else 0.0
+            return {
+                "workers": self.workers,
+                "items": self.items,
+                "batches": self.batches,
+                "busy_seconds": round(self.busy_time, 4),
+                "wait_seconds": round(self.wait_time, 4),
+                "active_seconds": round(active, 4),
+                "items_per_second": round(self.items / active, 2) if active > 0 else None,
+            }
+
+
+class IngestionPipeline:
+    """
+    Staged ingestion of one document's chunks:
+
+        chunk --[embed queue]--> embed (embed_workers) --[store queue]--> store (store_workers)
+
+    plus an optional tag stage (e.g. the document tagging LLM call) running
+    alongside. Each queue holds at most queue_size batches, so a slow stage
+    holds back the stages before it instead of the whole document piling up
+    in memory, and the embedding of one batch overlaps the write of the one
+    before.
+
+    - embed_fn(batch) sets "embeddingData" on a list of chunk dicts
+    - store_fn(batch) writes embedded chunks and returns {"results": rows}
+    - undo_fn(chunk_ids), if given, removes the rows inserted so far when
+      any stage fails, since batches are committed one by one; rows that
+      store_fn reports as updated in place ("inserted": False) are left
+
+    run() returns the stored rows ordered by chunkIndex, the tag result and
+    per-stage metrics, or raises the first error raised by any stage.
+    """
+
+    def __init__(self, embed_fn: Callable[[List[dict]], List[dict]], store_fn: Callable[[List[dict]], dict],
+                 undo_fn: Optional[Callable[[List[str]], int]] = None, batch_size: int = 64,
+                 embed_workers: int = 2, store_workers: int = 1, queue_size: int = 4):
+        self.embed_fn = embed_fn
+        self.store_fn = store_fn
+        self.undo_fn = undo_fn
+        self.batch_size = max(1, batch_size)
+        self.embed_workers = max(1, embed_workers)
+        self.store_workers = max(1, store_workers)
+        self.queue_size = max(1, queue_size)
+
+    def run(self, chunks: Iterable[dict], tag_fn: Optional[Callable[[], object]] = None, progress: Optional[Callable[..., None]] = None):
+        """
+        chunks is consumed lazily (e.g. a generator over the chunker), so
+        chunking itself is the first stage. progress, if given, is called
+        with chunksTotal/chunksEmbedded/chunksInserted counts and may raise
+        to stop the pipeline.
+        """
+        run = _PipelineRun(self, progress)
+        return run.execute(chunks, tag_fn)
+
+
+class _PipelineRun:
+    def __init__(self, pipeline: IngestionPipeline, progress):
+        self.pipeline = pipeline
+        self.progress = progress
+        self.embed_queue = queue.Queue(maxsize=pipeline.queue_size)
+        self.store_queue = queue.Queue(maxsize=pipeline.queue_size)
+        self.stop = threading.Event()
+        self.lock = threading.Lock()
+        self.error = None
+        self.embedders_left = pipeline.embed_workers
+        self.counts = {"chunksEmbedded": 0, "chunksInserted": 0}
+        self.stored = []
+        self.tags = None
+        self.metrics = {
+            "chunk": StageMetrics("chunk", 1),
+            "embed": StageMetrics("embed", pipeline.embed_workers),
+            "store": StageMetrics("store", pipeline.store_workers),
+        }
+
+    def fail(self, error):
+        with self.lock:
+            if self.error is None:
+                self.error = error
+        self.stop.set()
+
+    def report(self, **counts):
+        if self.progress:
+            # Serialized so counters reach the job row in order
+            with self.lock:
+                self.progress(**counts)
+
+    def put(self, target, item):
+        while not self.stop.is_set():
+            try:
+                target.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+        raise PipelineStopped()
+
+    def get(self, source):
+        while not self.stop.is_set():
+            try:
+                return source.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        raise PipelineStopped()
+
+    def stage(self, name, target, *args):
+        def runner():
+            try:
+                target(*args)
+            except PipelineStopped:
+                pass
+            except BaseException as e:
+                logger.error(f"Ingestion stage {name} failed: {e}")
+                self.fail(e)
+        return threading.Thread(target=runner, name=f"ingestion-{name}", daemon=True)
+
+    def chunk_stage(self, chunks):
+        try:
+            self._chunk_stage(chunks)
+        finally:
+            # Release the producer (e.g. a text extraction feeding the chunker) when stopping early
+            close = getattr(chunks, "close", None)
+            if close is not None:
+                close()
+
+    def _chunk_stage(self, chunks):
+        metrics = self.metrics["chunk"]
+        total = 0
+        batch = []
+        started = time.perf_counter()
+        for chunk in chunks:
+            if self.stop.is_set():
+                raise PipelineStopped()
+            batch.append(chunk)
+            if len(batch) >= self.pipeline.batch_size:
+                ended = time.perf_counter()
+                metrics.record(len(batch), started, ended)
+                total += len(batch)
+                self.put_timed(self.embed_queue, batch, metrics)
+                batch = []
+                started = time.perf_counter()
+        if batch:
+            metrics.record(len(batch), started, time.perf_counter())
+            total += len(batch)
+            self.put_timed(self.embed_queue, batch, metrics)
+        self.report(chunksTotal=total)
+        for _ in range(self.pipeline.embed_workers):
+            self.put(self.embed_queue, _DONE)
+
+    def put_timed(self, target, item, metrics):
+        waited = time.perf_counter()
+        self.put(target, item)
+        metrics.add_wait(time.perf_counter() - waited)
+
+    def embed_stage(self):
+        metrics = self.metrics["embed"]
+        while True:
+            waited = time.perf_counter()
+            batch = self.get(self.embed_queue)
+            started = time.perf_counter()
+            if batch is _DONE:
+                metrics.add_wait(started - waited)
+                break
+            embedded = self.pipeline.embed_fn(batch)
+            ended = time.perf_counter()
+            metrics.record(len(batch), started, ended, started - waited)
+            with self.lock:
+                self.counts["chunksEmbedded"] += len(batch)
+                done = self.counts["chunksEmbedded"]
+            self.report(chunksEmbedded=done)
+            self.put_timed(self.store_queue, embedded, metrics)
+
+        # The last embedder to finish closes the store queue
+        with self.lock:
+            self.embedders_left -= 1
+            last = self.embedders_left == 0
+        if last:
+            for _ in range(self.pipeline.store_workers):
+                self.put(self.store_queue, _DONE)
+
+    def store_stage(self):
+        metrics = self.metrics["store"]
+        while True:
+            waited = time.perf_counter()
+            batch = self.get(self.store_queue)
+            started = time.perf_counter()
+            if batch is _DONE:
+                metrics.add_wait(started - waited)
+                return
+            rows = (self.pipeline.store_fn(batch) or {}).get("results") or []
+            ended = time.perf_counter()
+            metrics.record(len(rows), started, ended, started - waited)
+            with self.lock:
+                self.stored.extend(rows)
+                self.counts["chunksInserted"] += len(rows)
+                done = self.counts["chunksInserted"]
+            self.report(chunksInserted=done)
+
+    def tag_stage(self, tag_fn):
+        started = time.perf_counter()
+        self.tags = tag_fn()
+        metrics = StageMetrics("tag", 1)
+        metrics.record(1, started, time.perf_counter())
+        self.metrics["tag"] = metrics
+
+    def execute(self, chunks, tag_fn):
+        started = time.perf_counter()
+        threads = [self.stage("chunk", self.chunk_stage, chunks)]
+        threads += [self.stage(f"embed-{i}", self.embed_stage) for i in range(self.pipeline.embed_workers)]
+        threads += [self.stage(f"store-{i}", self.store_stage) for i in range(self.pipeline.store_workers)]
+        if tag_fn is not None:
+            threads.append(self.stage("tag", self.tag_stage, tag_fn))
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        if self.error is not None:
+            self.undo()
+            raise self.error
+
+        self.stored.sort(key=lambda row: row["chunkIndex"])
+        metrics = {
+            "chunks": len(self.stored),
+            "elapsed_seconds": round(elapsed, 4),
+            "chunks_per_second": round(len(self.stored) / elapsed, 2) if elapsed > 0 else None,
+            "stages": {name: stage.as_dict() for name, stage in self.metrics.items()},
+        }
+        _record_totals(metrics)
+        logger.info(f"Ingested {metrics['chunks']} chunks in {metrics['elapsed_seconds']}s ({metrics['chunks_per_second']} chunks/s)")
+        return {"results": self.stored, "tags": self.tags, "metrics": metrics}
+
+    def undo(self):
+        if self.pipeline.undo_fn is None:
+            return
+        inserted = [row["chunkId"] for row in self.stored if row.get("inserted", True)]
+        if not inserted:
+            return
+        try:
+            deleted = self.pipeline.undo_fn(inserted)
+            logger.info(f"Removed {deleted} chunks written before the ingestion failed")
+        except Exception as e:
+            logger.error(f"Failed to remove partially ingested chunks: {e}")
+
+
+_totals = {"documents": 0, "chunks": 0, "elapsed_seconds": 0.0, "stages": {}}
+_totals_lock = threading.Lock()
+
+
+def _record_totals(metrics):
+    with _totals_lock:
+        _totals["documents"] += 1
+        _totals["chunks"] += metrics["chunks"]
+        _totals["elapsed_seconds"] += metrics["elapsed_seconds"]
+        for name, stage in metrics["stages"].items():
+            totals = _totals["stages"].setdefault(name, {"items": 0, "busy_seconds": 0.0, "wait_seconds": 0.0})
+            totals["items"] += stage["items"]
+            totals["busy_seconds"] += stage["busy_seconds"]
+            totals["wait_seconds"] += stage["wait_seconds"]
+
+
+def get_pipeline_stats():
+    """Totals over every document ingested by this process, with overall chunks/sec."""
+    with _totals_lock:
+        stats = {
+            "documents": _totals["documents"],
+            "chunks": _totals["chunks"],
+            "elapsed_seconds": round(_totals["elapsed_seconds"], 4),
+            "stages": {name: dict(values) for name, values in _totals["stages"].items()},
+        }
+    stats["chunks_per_second"] = round(stats["chunks"] / stats["elapsed_seconds"], 2) if stats["elapsed_seconds"] else None
+    return stats
+
+
+def create_ingestion_pipeline(embed_fn, store_fn, undo_fn=None) -> IngestionPipeline:
+    """Builds a pipeline with the stage sizes configured in settings."""
+    return IngestionPipeline(
+        embed_fn,
+        store_fn,
+        undo_fn=undo_fn,
+        batch_size=settings.INGESTION_BATCH_SIZE,
+        embed_workers=settings.INGESTION_EMBED_WORKERS,
+        store_workers=settings.INGESTION_STORE_WORKERS,
+        queue_size=settings.INGESTION_QUEUE_SIZE,
+    )
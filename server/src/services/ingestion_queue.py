@@ -0,0 +1,155 @@
+import logging
+import os
+import socket
+import threading
+from typing import Optional
+from fastapi import HTTPException
+from core.config import settings
+from models.ingestion_jobs import IngestionJobModel
+from services.archives import unpack_sources
+from services.process_document import process_document, process_documents, IngestionCancelled
+
+logger = logging.getLogger(__name__)
+
+# fileType of /process/documents jobs, whose payload is a SourceBundle
+BULK_JOB_TYPE = "bulk"
+
+
+class IngestionWorkerPool:
+    """
+    Runs queued /process/document and /process/documents jobs in background threads.
+
+    Jobs live in the IngestionJobs table, so they survive restarts and can be
+    shared by several server processes: each worker claims the oldest queued
+    job with FOR UPDATE SKIP LOCKED, reports progress on the job row and
+    checks for cancellation at every progress update.
+    """
+
+    def __init__(self, jobs: Optional[IngestionJobModel] = None, concurrency: int = 2, poll_interval: float = 2.0, stale_seconds: Optional[int] = None):
+        self.jobs = jobs or IngestionJobModel()
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self.stale_seconds = stale_seconds
+        self._threads = []
+        self._stop = threading.Event()
+        self._wakeup = threading.Event()
+        self._lock = threading.Lock()
+        self._active = {}
+        self._stats = {"succeeded": 0, "failed": 0, "cancelled": 0}
+
+    def start(self):
+        if self._threads:
+            return
+        if self.stale_seconds:
+            self.jobs.requeue_stale_jobs(self.stale_seconds)
+        self._stop.clear()
+        host = f"{socket.gethostname()}:{os.getpid()}"
+        for i in range(self.concurrency):
+            thread = threading.Thread(target=self._run, args=(f"{host}:{i}",), name=f"ingestion-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        logger.info(f"Started {self.concurrency} ingestion workers")
+
+    def stop(self, timeout: Optional[float] = None):
+        """
+        Stops polling and waits for running jobs to finish. Jobs still running
+        after timeout are picked up again once they are considered stale.
+        """
+        self._stop.set()
+        self._wakeup.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def notify(self):
+        """Wakes idle workers so a newly queued job starts without waiting for the next poll."""
+        self._wakeup.set()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["active_jobs"] = list(self._active.values())
+        stats["workers"] = len(self._threads)
+        stats["concurrency"] = self.concurrency
+        return stats
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    def _run(self, worker_id):
+        while not self._stop.is_set():
+            try:
+                job = self.jobs.claim_next_job(worker_id)
+            except Exception as e:
+                logger.error(f"Failed to claim ingestion job: {e}")
+                job = None
+            if job is None:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+                continue
+            with self._lock:
+                self._active[worker_id] = job["jobId"]
+            try:
+                self.run_job(job)
+            finally:
+                with self._lock:
+                    self._active.pop(worker_id, None)
+
+    def run_job(self, job):
+        job_id = job["jobId"]
+
+        def progress(**counts):
+            if self.jobs.update_progress(job_id, counts):
+                raise IngestionCancelled()
+
+        try:
+            if job["fileType"] == BULK_JOB_TYPE:
+                result = process_documents(job["userId"], job["corpusKey"], unpack_sources(job["payload"]), progress=progress)
+            else:
+                source = job["payload"] if job["payload"] is not None else job["sourceUrl"]
+                result = process_document(job["userId"], job["fileType"], source, job["corpusKey"], job["fileName"], progress=progress)
+        except IngestionCancelled:
+            logger.info(f"Ingestion job {job_id} cancelled")
+            self.jobs.finish_job(job_id, "cancelled")
+            self._count("cancelled")
+            return
+        except Exception as e:
+            error = e.detail if isinstance(e, HTTPException) else str(e)
+            logger.error(f"Ingestion job {job_id} failed: {error}")
+            self.jobs.finish_job(job_id, "failed", error=str(error))
+            self._count("failed")
+            return
+
+        if job["fileType"] == BULK_JOB_TYPE:
+            self.jobs.finish_job(job_id, "succeeded", result=result)
+            self._count("succeeded")
+            logger.info(f"Ingestion job {job_id} finished {len(result['results'])} files")
+            return
+
+        chunks = result.get("results") or []
+        summary = {
+            "documentId": result.get("documentId"),
+            "status": result.get("status"),
+            "chunks": len(chunks),
+            "changes": result.get("changes"),
+            "metrics": result.get("metrics"),
+        }
+        self.jobs.finish_job(job_id, "succeeded", result=summary)
+        self._count("succeeded")
+        logger.info(f"Ingestion job {job_id} finished with {len(chunks)} chunks")
+
+
+_pool: Optional[IngestionWorkerPool] = None
+
+
+def get_ingestion_pool() -> IngestionWorkerPool:
+    """Returns the process-wide worker pool configured from settings."""
+    global _pool
+    if _pool is None:
+        _pool = IngestionWorkerPool(
+            concurrency=settings.INGESTION_WORKERS,
+            poll_interval=settings.INGESTION_POLL_SECONDS,
+            stale_seconds=settings.INGESTION_STALE_SECONDS,
+        )
+    return _pool
@@ -87,6 +87,24 @@ if not api_key:
 default_model = "mistral-large-latest"
 client = Mistral(api_key=api_key)
 
+def _build_messages(prompt: str, context: str = None):
+    # Prepare messages for the chat API
+    messages = []
+
+    # Add system message if context is provided
+    if context:
+        messages.append({
+            "role": "system",
+            "content": f"You are a helpful assistant. Use the following context to answer the question: {context}"
+        })
+
+    # Add user message
+    messages.append({
+        "role": "user",
+        "content": prompt
+    })
+    return messages
+
 def llm_service(
     prompt: str,
     model: str = default_model,
@@ -94,21 +112,7 @@ def llm_service(
     return_full_response: bool = False
 ):
     try:
-        # Prepare messages for the chat API
-        messages = []
-        
-        # Add system message if context is provided
-        if context:
-            messages.append({
-                "role": "system",
-                "content": f"You are a helpful assistant. Use the following context to answer the question: {context}"
-            })
-        
-        # Add user message
-        messages.append({
-            "role": "user",
-            "content": prompt
-        })
+        messages = _build_messages(prompt, context)
         
         # Call Mistral API
         chat_response = client.chat.complete(
@@ -127,3 +131,59 @@ def llm_service(
         import traceback
         traceback.print_exc()
         return "Sorry, I couldn't process that request due to an internal error."
+
+async def llm_service_async(
+    prompt: str,
+    model: str = default_model,
+    context: str = None,
+    return_full_response: bool = False
+):
+    """Async version of llm_service() that awaits the Mistral API instead of blocking the event loop."""
+    try:
+        messages = _build_messages(prompt, context)
+
+        chat_response = await client.chat.complete_async(
+            model=default_model,  # Use the default model
+            messages=messages
+        )
+
+        if return_full_response:
+            return json.dumps(chat_response, indent=2, default=str)
+        else:
+            return chat_response.choices[0].message.content
+
+    except Exception as e:
+        print(f"An error occurred in llm_service_async: {e}")
+        import traceback
+        traceback.print_exc()
+        return "Sorry, I couldn't process that request due to an internal error."
+
+async def llm_service_stream(
+    prompt: str,
+    model: str = default_model,
+    context: str = None
+):
+    """
+    Streams the completion for prompt, yielding text pieces as Mistral
+    produces them. Unlike llm_service(), errors are raised: once tokens have
+    been sent there is no single response left to replace with a message.
+    """
+    messages = _build_messages(prompt, context)
+    try:
+        stream = await client.chat.stream_async(
+            model=default_model,  # Use the default model
+            messages=messages
+        )
+        async with stream as events:
+            async for event in events:
+                if not event.data.choices:
+                    continue
+                content = event.data.choices[0].delta.content
+                if isinstance(content, list):
+                    # Content chunks: only the text parts are part of the answer
+                    content = "".join(getattr(part, "text", "") or "" for part in content)
+                if content:
+                    yield content
+    except Exception as e:
+        print(f"An error occurred in llm_service_stream: {e}")
+        raise
@@ -1,13 +1,30 @@
-from services.text_extractor import extract_text
-from services.chunking import chunking
-from controllers.document_chunk import create_document_chunk
+from services.text_extractor import extract_text_in_pool, iter_text_in_pool
+from services.chunking import iter_chunks
+from services.ingestion_pipeline import create_ingestion_pipeline
+from controllers.document_chunk import (
+    embed_document_chunks, store_document_chunks, delete_document_chunks, get_document_chunk_hashes,
+    stage_document_chunks, apply_staged_document_chunks, discard_staged_document_chunks
+)
 from controllers.corpora import create_corpus_data
-from controllers.documents import create_document_data
+from controllers.documents import get_document_states_data
+from models.document_chunk import content_hash
 from services.llm_services import llm_service
+from core.config import settings
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 import json
+import threading
+import uuid
 from psycopg2.extras import Json
 from fastapi import HTTPException
 
+
+class IngestionCancelled(HTTPException):
+    """Raised from a progress callback to stop a document that is being ingested."""
+
+    def __init__(self, detail="Ingestion job cancelled"):
+        super().__init__(status_code=409, detail=detail)
+
+
 def get_tag_prompt(text: str):
      return f'''
     SYSTEM MESSAGE:
@@ -69,74 +86,429 @@ Note: Important: Return only valid JSON and no extra text, commentary, or format
 '''
 
 
-def process_document(userId, file_type, document_bytes_or_url, corpus_key, file_name):
-    try:
+def tag_document(text: str):
+    """Asks the LLM for structured metadata about text (see get_tag_prompt)."""
+    prompt = get_tag_prompt(text)
+    raw_response = llm_service(prompt, model="gpt-4.1-mini", return_full_response=True)
+    if not raw_response:
+        print("LLM service returned empty response")
+        raise RuntimeError("Empty response from LLM service")
 
-        extracted_text = extract_text(file_type, document_bytes_or_url)
-        prompt = get_tag_prompt(extracted_text)
-        raw_response = llm_service(prompt, model="gpt-4.1-mini", return_full_response=True)
-        if not raw_response:
-            print("LLM service returned empty response")
-            raise RuntimeError("Empty response from LLM service")
+    if isinstance(raw_response, str):
+        cleaned_response = raw_response.strip("`").strip()
+        try:
+            return json.loads(cleaned_response)
+        except json.JSONDecodeError as e:
+            print(f"Failed to parse JSON: {e}")
+            raise RuntimeError(f"Invalid JSON response from LLM service: {cleaned_response}")
+    return raw_response
+
+
+def resolve_corpus_id(userId, corpus_key):
+    """Returns the corpusId for corpus_key, creating the corpus if the user has none by that key."""
+    corpora_result = create_corpus_data({
+        "userId": userId,
+        "corpusKey": corpus_key
+    })
+    if not corpora_result or not corpora_result.get("results"):
+        raise HTTPException(status_code=500, detail="Failed to create or fetch corpus")
+
+    first_corpus = corpora_result["results"][0] if isinstance(corpora_result["results"], list) and corpora_result["results"] else None
+    if not first_corpus or not first_corpus.get("corpusId"):
+        raise HTTPException(status_code=500, detail="CorpusId missing in corpus result")
+
+    return first_corpus["corpusId"]
+
+
+def document_row(userId, corpus_id, file_type, file_name, extracted_text):
+    """The "Documents" row of an ingested file, written by DocumentUpdate.finish()."""
+    document_data = {}
+    document_data["userId"] = userId
+    document_data["corpusId"] = corpus_id
+    document_data["rawText"] = extracted_text
+    # document_data["tags"] = Json(document_tags)
+    document_data["docType"] = file_type
+    document_data["docName"] = file_name
+    document_data["documentId"] = f"{file_type}|{file_name}"
+    if file_type == "url":
+        document_data["sourceUrl"] = f"{file_name}"
+    return document_data
+
+
+class DocumentUpdate:
+    """
+    Incremental (re-)ingestion of one document.
+
+    Documents."contentHash" is the sha256 of the uploaded file (of the
+    extracted text for URLs) and DocumentChunks."chunkHash" that of each
+    chunk's text. An upload whose hash matches the stored one is a no-op.
+    Otherwise chunks() yields only the chunks whose index is new or whose
+    text changed, tagged with this run's stagingId, and the pipeline stages
+    them once embedded (see stage_document_chunks).
+
+    finish() then stores the document row (text and hash), moves the staged
+    chunks into place by (documentId, chunkIndex) and deletes the chunks
+    past the end of the new text, all in one transaction. Until then the
+    stored version is untouched, so a run that fails leaves it intact and
+    discard() only drops the staged chunks.
+    """
+
+    def __init__(self, document_id, state=None, corpus_id=None):
+        if state is not None and corpus_id is not None and state.get("corpusId") and state["corpusId"].strip() != corpus_id.strip():
+            raise HTTPException(status_code=409, detail=f"Document {document_id} already exists in another corpus")
+        self.document_id = document_id
+        self.state = state
+        self.staging_id = uuid.uuid4().hex
+        self.content_hash = None
+        self.chunk_count = 0
+        self.unchanged_chunks = 0
+        self.deleted_chunks = 0
+
+    @property
+    def status(self):
+        return "created" if self.state is None else "updated"
+
+    def is_unchanged(self, content_hash_value):
+        """Remembers the hash of the new version and tells whether it is the stored one."""
+        self.content_hash = content_hash_value
+        return self.state is not None and self.state.get("contentHash") == content_hash_value
+
+    def chunks(self, pieces):
+        """
+        Chunks the text given as an iterable of pieces (see
+        iter_text_in_pool), which is closed once chunking ends or fails.
+        """
+        try:
+            stored = {}
+            if self.state is not None:
+                stored = {row["chunkIndex"]: row["chunkHash"] for row in get_document_chunk_hashes(self.document_id)}
+
+            for chunk in iter_chunks(pieces, 1000, 100):
+                index = chunk["chunk_number"]
+                chunk_hash = content_hash(chunk["content"])
+                self.chunk_count = index
+                if stored.get(index) == chunk_hash:
+                    self.unchanged_chunks += 1
+                    continue
+                yield {
+                    "chunkIndex": index,
+                    "chunkText": chunk["content"],
+                    "chunkHash": chunk_hash,
+                    "documentId": self.document_id,
+                    "stagingId": self.staging_id,
+                    # "metaData": Json(document_tags),
+                }
+        finally:
+            close = getattr(pieces, "close", None)
+            if close is not None:
+                close()
+
+    def finish(self, document_data):
+        """Makes the staged version current; returns the written chunks."""
+        response = apply_staged_document_chunks(self.staging_id, document_data, self.chunk_count, self.content_hash)
+        self.deleted_chunks = response["deleted"]
+        return response["results"]
+
+    def discard(self):
+        discard_staged_document_chunks([self.staging_id])
+
+    def changes(self, stored_rows):
+        return {"embedded": len(stored_rows), "unchanged": self.unchanged_chunks, "deleted": self.deleted_chunks}
+
+
+class ExtractedText:
+    """
+    A document's text as it is extracted. Iterating it passes the extracted
+    pieces on (e.g. to the chunker) and keeps them; text() waits until
+    extraction is over, or the text was closed, and returns the whole text,
+    or None if it failed or was not read to the end.
+    """
+
+    def __init__(self, pieces):
+        self._source = pieces
+        self._pieces = []
+        self._complete = False
+        self._done = threading.Event()
+
+    def __iter__(self):
+        try:
+            for piece in self._source:
+                self._pieces.append(piece)
+                yield piece
+            self._complete = True
+        finally:
+            self._done.set()
+
+    def close(self):
+        """Stops the extraction, e.g. when chunking fails before reading it."""
+        close = getattr(self._source, "close", None)
+        if close is not None:
+            close()
+        self._done.set()
+
+    def text(self):
+        self._done.wait()
+        return "".join(self._pieces) if self._complete else None
+
+
+def _tag_extracted(extracted):
+    # Tagging needs the whole text, so it starts once extraction is over
+    text = extracted.text()
+    return tag_document(text) if text else None
+
+
+def _source_hash(document_bytes_or_url):
+    # URLs are only known by their extracted text
+    return content_hash(document_bytes_or_url) if isinstance(document_bytes_or_url, (bytes, bytearray)) else None
 
-        if isinstance(raw_response, str):
-            cleaned_response = raw_response.strip("`").strip()
-            try:
-                document_tags = json.loads(cleaned_response)
-            except json.JSONDecodeError as e:
-                print(f"Failed to parse JSON: {e}")
-                raise RuntimeError(f"Invalid JSON response from LLM service: {cleaned_response}")
-        else:
-            document_tags = raw_response
 
-        chunked_text = chunking({"text": extracted_text, "chunk_type": "manual", "chunk_size": 1000, "chunk_overlap": 100, "model": "llama-3.3-70b-versatile"})
+def process_document(userId, file_type, document_bytes_or_url, corpus_key, file_name, progress=None):
+    """
+    Extracts, tags, chunks, embeds and stores one document.
+
+    The document goes through an IngestionPipeline: chunking, embedding and
+    staging run as concurrent stages with bounded queues between them. The
+    chunk stage reads the text as it is extracted (large PDFs page by page,
+    see iter_text_in_pool), and the tagging LLM call runs alongside once
+    extraction is over. The new version is stored in one transaction once
+    every stage has succeeded; if any stage fails, the staged chunks are
+    dropped and the stored version is left as it was.
+
+    A document that was ingested before is updated incrementally (see
+    DocumentUpdate): an identical file is not even extracted, and a changed
+    one only has its new or changed chunks embedded. Returns the stored
+    chunks with the documentId, a status of "created", "updated" or
+    "unchanged" and the number of chunks embedded, unchanged and deleted.
+
+    progress, if given, is called with chunksTotal/chunksEmbedded/chunksInserted
+    counts as the document moves through the pipeline and may raise
+    IngestionCancelled to stop it.
+    """
+    try:
+        if progress:
+            progress()
+
         document_id = f"{file_type}|{file_name}"
-        document_data = {}
-        if userId and corpus_key:
-            corpora_result = create_corpus_data({
-                "userId": userId,
-                "corpusKey": corpus_key
-            })
-            if not corpora_result or not corpora_result.get("results"):
-                raise HTTPException(status_code=500, detail="Failed to create or fetch corpus")
-
-            first_corpus = corpora_result["results"][0] if isinstance(corpora_result["results"], list) and corpora_result["results"] else None
-            if not first_corpus or not first_corpus.get("corpusId"):
-                raise HTTPException(status_code=500, detail="CorpusId missing in corpus result")
-
-            corpus_id = first_corpus["corpusId"]
-
-
-            document_data["userId"] = userId
-            document_data["corpusId"] = corpus_id
-            document_data["rawText"] = extracted_text
-            # document_data["tags"] = Json(document_tags)
-            document_data["docType"] = file_type
-            document_data["docName"] = file_name
-            document_data["documentId"]= document_id
-            if file_type == "url":
-                document_data["sourceUrl"] = f"{file_name}"
-            document_result = create_document_data(document_data)
-            if not document_result or not document_result.get("results"):
-                raise HTTPException(status_code=500, detail="Failed to create document")
-
-        chunks_results = []
-        for chunk in chunked_text:
-            chunk_data = {}
-            chunk_data["chunkIndex"] = chunk["chunk_number"]
-            chunk_data["chunkText"] =  chunk["content"]
-            chunk_data["documentId"] = document_id
-            # chunk_data["metaData"] =  Json(document_tags)
-            result = create_document_chunk(chunk_data)
-            if not result or not result.get("results"):
-                raise HTTPException(status_code=500, detail="Failed to create document chunk")
-            
-            # Handle both cases: when results is a list or a single item
-            if isinstance(result["results"], list):
-                chunks_results.extend(result["results"])
-            else:
-                chunks_results.append(result["results"])
+        corpus_id = resolve_corpus_id(userId, corpus_key) if userId and corpus_key else None
+        update = DocumentUpdate(document_id, get_document_states_data([document_id]).get(document_id), corpus_id)
+
+        source_hash = _source_hash(document_bytes_or_url)
+        if source_hash and update.is_unchanged(source_hash):
+            return {"results": [], "documentId": document_id, "status": "unchanged", "changes": update.changes([]), "metrics": None}
+
+        # Pages of large PDFs reach the chunker as they are converted
+        pieces = iter_text_in_pool(file_type, document_bytes_or_url)
+        if not source_hash:
+            extracted_text = "".join(pieces)
+            if not extracted_text:
+                raise ValueError("No text could be extracted from the document.")
+            if update.is_unchanged(content_hash(extracted_text)):
+                return {"results": [], "documentId": document_id, "status": "unchanged", "changes": update.changes([]), "metrics": None}
+            pieces = [extracted_text]
+        extracted = ExtractedText(pieces)
+
+        # Chunks are produced lazily, so chunking is the pipeline's first stage. Documents
+        # of a corpus are staged and stored by finish(); others are written directly
+        if corpus_id:
+            pipeline = create_ingestion_pipeline(embed_document_chunks, stage_document_chunks)
+        else:
+            pipeline = create_ingestion_pipeline(embed_document_chunks, store_document_chunks, undo_fn=delete_document_chunks)
+        try:
+            result = pipeline.run(update.chunks(extracted), tag_fn=lambda: _tag_extracted(extracted), progress=progress)
+            if not result:
+                raise HTTPException(status_code=500, detail="Failed to create document chunks")
+            extracted_text = extracted.text()
+            if not extracted_text:
+                raise ValueError("No text could be extracted from the document.")
+            chunks_results = result["results"]
+            if corpus_id:
+                chunks_results = update.finish(document_row(userId, corpus_id, file_type, file_name, extracted_text))
+        except Exception:
+            if corpus_id:
+                update.discard()
+            raise
   
-        return {"results": chunks_results}
+        return {
+            "results": chunks_results,
+            "documentId": document_id,
+            "status": update.status,
+            "changes": update.changes(chunks_results),
+            "metrics": result["metrics"],
+        }
+    except IngestionCancelled:
+        raise
     except Exception as e:
        raise HTTPException(status_code=401, detail=f"{e}")
+
+
+def _extract_sources(entries, concurrency):
+    """
+    Yields (entry, text, error) for each (manifest entry, source) pair in
+    completion order, with at most concurrency extractions in flight so a
+    large request does not hold every extracted text at once.
+    """
+    remaining = iter(entries)
+    executor = ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix="bulk-extract")
+    pending = {}
+
+    def submit_next():
+        for entry, source in remaining:
+            future = executor.submit(extract_text_in_pool, entry["fileType"], source)
+            pending[future] = entry
+            return True
+        return False
+
+    try:
+        while len(pending) < max(1, concurrency) and submit_next():
+            pass
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                entry = pending.pop(future)
+                submit_next()
+                error = future.exception()
+                yield entry, (None if error else future.result()), error
+    finally:
+        for future in pending:
+            future.cancel()
+        executor.shutdown(wait=False)
+
+
+def _error_detail(error):
+    return str(error.detail if isinstance(error, HTTPException) else error)
+
+
+def process_documents(userId, corpus_key, sources, progress=None):
+    """
+    Extracts, tags, chunks, embeds and stores many documents of one corpus.
+
+    sources is a list of {"fileType", "fileName", "source"} dicts, source
+    being the file bytes or a URL. The corpus and the stored state of every
+    document are looked up once. Files are extracted
+    BULK_INGEST_EXTRACT_CONCURRENCY at a time in the extraction pool and the
+    new or changed chunks of every file feed a single IngestionPipeline, so
+    embedding batches are shared across files; documents are tagged
+    alongside, BULK_INGEST_TAG_CONCURRENCY at a time. Files identical to the
+    stored version are not extracted (see DocumentUpdate).
+
+    Returns {"results": manifest, "summary": ..., "metrics": ...} with one
+    manifest entry per source, in request order, whose status is "created",
+    "updated", "unchanged", "failed" or "skipped" (a file name already seen
+    in the request), and the number of files per status and of chunks
+    embedded, unchanged and deleted. A file that cannot be extracted, stored or tagged fails on its
+    own. Each file's new version is stored in one transaction once the
+    pipeline is done and its tags are in (see DocumentUpdate). If the
+    pipeline fails (e.g. the embedding API), the staged chunks are dropped
+    and every file not finished already fails with that error; stored
+    versions are left as they were.
+
+    progress is called as in process_document() and may raise
+    IngestionCancelled, which drops the staged chunks and stops every file.
+    """
+    if progress:
+        progress()
+    corpus_id = resolve_corpus_id(userId, corpus_key)
+
+    manifest = []
+    sources_by_id = {}
+    for source in sources:
+        document_id = f"{source['fileType']}|{source['fileName']}"
+        entry = {
+            "fileName": source["fileName"],
+            "fileType": source["fileType"],
+            "documentId": document_id,
+            "status": "pending",
+            "changes": None,
+            "error": None,
+        }
+        manifest.append(entry)
+        if document_id in sources_by_id:
+            entry["status"] = "skipped"
+            entry["error"] = "Duplicate file name in request"
+            continue
+        sources_by_id[document_id] = (entry, source["source"])
+
+    def fail(entry, error):
+        entry["status"] = "failed"
+        entry["error"] = _error_detail(error)
+
+    states = get_document_states_data(list(sources_by_id))
+    updates = {}
+    entries = []
+    for document_id, (entry, source) in sources_by_id.items():
+        try:
+            update = DocumentUpdate(document_id, states.get(document_id), corpus_id)
+        except HTTPException as e:
+            fail(entry, e)
+            continue
+        updates[document_id] = update
+        source_hash = _source_hash(source)
+        if source_hash and update.is_unchanged(source_hash):
+            entry["status"] = "unchanged"
+            entry["changes"] = update.changes([])
+            continue
+        entries.append((entry, source))
+
+    tag_executor = ThreadPoolExecutor(max_workers=max(1, settings.BULK_INGEST_TAG_CONCURRENCY), thread_name_prefix="bulk-tag")
+    tag_futures = {}
+
+    def chunks_data():
+        # Runs in the pipeline's chunk stage, so extraction overlaps embedding
+        for entry, extracted_text, error in _extract_sources(entries, settings.BULK_INGEST_EXTRACT_CONCURRENCY):
+            update = updates[entry["documentId"]]
+            if error is None and not extracted_text:
+                error = ValueError("No text could be extracted from the document.")
+            if error is not None:
+                fail(entry, error)
+                continue
+            if update.is_unchanged(update.content_hash or content_hash(extracted_text)):
+                entry["status"] = "unchanged"
+                entry["changes"] = update.changes([])
+                continue
+
+            document_rows[entry["documentId"]] = document_row(userId, corpus_id, entry["fileType"], entry["fileName"], extracted_text)
+            tag_futures[entry["documentId"]] = (entry, tag_executor.submit(tag_document, extracted_text))
+            yield from update.chunks([extracted_text])
+
+    document_rows = {}
+    pipeline = create_ingestion_pipeline(embed_document_chunks, stage_document_chunks)
+    try:
+        result = pipeline.run(chunks_data(), progress=progress)
+    except Exception as e:
+        tag_executor.shutdown(wait=False, cancel_futures=True)
+        discard_staged_document_chunks([updates[document_id].staging_id for document_id in tag_futures])
+        if isinstance(e, IngestionCancelled):
+            raise
+        for entry in manifest:
+            if entry["status"] == "pending":
+                fail(entry, e)
+        return {"results": manifest, "summary": _bulk_summary(manifest), "metrics": None}
+
+    for document_id, (entry, future) in tag_futures.items():
+        update = updates[document_id]
+        error = future.exception()
+        if error is None:
+            try:
+                rows = update.finish(document_rows[document_id])
+            except Exception as e:
+                error = e
+        if error is not None:
+            # process_document() fails a document whose tagging fails; do the same per
+            # file. Its stored version, if any, is left as it was
+            update.discard()
+            fail(entry, error)
+            continue
+        entry["status"] = update.status
+        entry["changes"] = update.changes(rows)
+    tag_executor.shutdown()
+
+    return {"results": manifest, "summary": _bulk_summary(manifest), "metrics": result["metrics"]}
+
+
+def _bulk_summary(manifest):
+    summary = {"files": len(manifest)}
+    for status in ("created", "updated", "unchanged", "failed", "skipped"):
+        summary[status] = sum(1 for entry in manifest if entry["status"] == status)
+    for change in ("embedded", "unchanged", "deleted"):
+        summary[f"chunks_{change}"] = sum(entry["changes"][change] for entry in manifest if entry["changes"])
+    return summary
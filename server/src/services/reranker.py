@@ -1,33 +1,213 @@
-import voyageai
-from typing import List
-from dotenv import load_dotenv
+import asyncio
+import math
 import os
+import re
+import threading
+from collections import Counter, namedtuple
+from typing import Dict, List, Optional
+from core.config import settings
+from dotenv import load_dotenv
 
-# from core.config import settings
-
-# voyage = voyageai.Client(api_key=settings.VOYAGE_API_KEY)
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
 load_dotenv()
 api_key = os.getenv("VOYAGE_API_KEY")
 
-voyage = voyageai.Client(api_key=api_key)
+# Same fields as voyageai's RerankingResult, so every backend's results look alike
+RerankResult = namedtuple("RerankResult", ["index", "document", "relevance_score"])
+
+RERANK_BACKENDS = ("voyage", "lexical", "onnx")
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+
+class RerankBackend:
+    """
+    Interface for rerankers.
+
+    Subclasses implement rerank(), returning (index, document, relevance_score)
+    results ordered by descending score. Scores are only comparable within
+    one backend.
+    """
+
+    def rerank(self, query: str, documents: List[str], model: Optional[str] = None, top_k: Optional[int] = None) -> List[RerankResult]:
+        raise NotImplementedError
+
+    async def rerank_async(self, query: str, documents: List[str], model: Optional[str] = None, top_k: Optional[int] = None) -> List[RerankResult]:
+        # Local backends are CPU-bound, so they run in a worker thread
+        return await asyncio.to_thread(self.rerank, query, documents, model, top_k)
+
+
+def _top_results(documents, scores, top_k):
+    order = sorted(range(len(documents)), key=lambda i: scores[i], reverse=True)
+    if top_k is not None:
+        order = order[:top_k]
+    return [RerankResult(i, documents[i], float(scores[i])) for i in order]
+
+
+class VoyageRerankBackend(RerankBackend):
+    """Reranks with the Voyage AI rerank API (one network round trip per call)."""
+
+    def __init__(self, api_key: Optional[str] = api_key, default_model: str = "rerank-2"):
+        import voyageai
+
+        self.client = voyageai.Client(api_key=api_key)
+        self.async_client = voyageai.AsyncClient(api_key=api_key)
+        self.default_model = default_model
+
+    def rerank(self, query, documents, model=None, top_k=None):
+        reranking = self.client.rerank(query, documents, model=model or self.default_model, top_k=top_k)
+        return reranking.results[:top_k]
+
+    async def rerank_async(self, query, documents, model=None, top_k=None):
+        reranking = await self.async_client.rerank(query, documents, model=model or self.default_model, top_k=top_k)
+        return reranking.results[:top_k]
+
+
+class LexicalRerankBackend(RerankBackend):
+    """
+    CPU-only BM25 reranker with no model files or network access.
+
+    Term statistics come from the candidate documents themselves, which is
+    what matters when ordering the few chunks a vector search returned.
+    relevance_score is the BM25 score scaled to 0-1 by score / (score + k1 + 1);
+    it is not calibrated against Voyage scores.
+    """
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+
+    @staticmethod
+    def tokenize(text: str) -> List[str]:
+        return TOKEN_PATTERN.findall(text.casefold())
+
+    def score(self, query: str, documents: List[str]) -> List[float]:
+        """BM25 scores of every document for query, in document order."""
+        query_terms = set(self.tokenize(query))
+        if not documents or not query_terms:
+            return [0.0] * len(documents)
+
+        term_counts = [Counter(self.tokenize(document)) for document in documents]
+        lengths = [sum(counts.values()) for counts in term_counts]
+        average_length = (sum(lengths) / len(lengths)) or 1.0
+        total = len(documents)
+
+        idf = {}
+        for term in query_terms:
+            frequency = sum(1 for counts in term_counts if term in counts)
+            idf[term] = math.log(1 + (total - frequency + 0.5) / (frequency + 0.5))
+
+        scores = []
+        for counts, length in zip(term_counts, lengths):
+            norm = self.k1 * (1 - self.b + self.b * length / average_length)
+            score = 0.0
+            for term in query_terms:
+                tf = counts.get(term)
+                if tf:
+                    score += idf[term] * tf * (self.k1 + 1) / (tf + norm)
+            scores.append(score)
+        return scores
+
+    def rerank(self, query, documents, model=None, top_k=None):
+        scores = [score / (score + self.k1 + 1) for score in self.score(query, documents)]
+        return _top_results(documents, scores, top_k)
 
-def re_rank(query: str, documents: List[str], model: str = "rerank-2", top_k: int = 3):
+
+class OnnxCrossEncoderRerankBackend(RerankBackend):
+    """
+    CPU-only cross-encoder loaded from disk (needs onnxruntime, tokenizers
+    and numpy).
+
+    model_dir holds model.onnx and tokenizer.json, e.g. an ONNX export of a
+    MS MARCO MiniLM cross-encoder. (query, document) pairs are scored in
+    batches of batch_size; relevance_score is the sigmoid of the logit.
     """
-    Reranks a list of documents based on their relevance to a given query using Voyage AI.
+
+    def __init__(self, model_dir: str, batch_size: int = 32, max_length: int = 512):
+        import onnxruntime
+        from tokenizers import Tokenizer
+
+        if np is None:
+            raise RuntimeError("numpy is required for the onnx reranker")
+        self.session = onnxruntime.InferenceSession(os.path.join(model_dir, "model.onnx"), providers=["CPUExecutionProvider"])
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=max_length)
+        self.tokenizer.enable_padding()
+        self.input_names = {model_input.name for model_input in self.session.get_inputs()}
+        self.batch_size = batch_size
+
+    def score(self, query: str, documents: List[str]) -> List[float]:
+        scores = []
+        for start in range(0, len(documents), self.batch_size):
+            batch = documents[start:start + self.batch_size]
+            encodings = self.tokenizer.encode_batch([(query, document) for document in batch])
+            inputs = {
+                "input_ids": np.array([encoding.ids for encoding in encodings], dtype=np.int64),
+                "attention_mask": np.array([encoding.attention_mask for encoding in encodings], dtype=np.int64),
+                "token_type_ids": np.array([encoding.type_ids for encoding in encodings], dtype=np.int64),
+            }
+            logits = self.session.run(None, {name: value for name, value in inputs.items() if name in self.input_names})[0]
+            logits = np.asarray(logits, dtype=np.float32).reshape(len(batch), -1)[:, -1]
+            scores.extend((1.0 / (1.0 + np.exp(-logits))).tolist())
+        return scores
+
+    def rerank(self, query, documents, model=None, top_k=None):
+        return _top_results(documents, self.score(query, documents), top_k)
+
+
+_backends: Dict[str, RerankBackend] = {}
+_backends_lock = threading.Lock()
+
+
+def get_rerank_backend(name: Optional[str] = None) -> RerankBackend:
+    """Returns the backend registered as name (default RERANK_BACKEND), creating it on first use."""
+    name = (name or settings.RERANK_BACKEND).lower()
+    if name not in RERANK_BACKENDS and name not in _backends:
+        raise ValueError(f"Unknown reranker {name!r}. Must be one of {RERANK_BACKENDS}.")
+    with _backends_lock:
+        backend = _backends.get(name)
+        if backend is None:
+            if name == "voyage":
+                backend = VoyageRerankBackend()
+            elif name == "lexical":
+                backend = LexicalRerankBackend()
+            else:
+                if not settings.RERANK_ONNX_MODEL_DIR:
+                    raise ValueError("RERANK_ONNX_MODEL_DIR must be set to use the onnx reranker")
+                backend = OnnxCrossEncoderRerankBackend(settings.RERANK_ONNX_MODEL_DIR, batch_size=settings.RERANK_BATCH_SIZE)
+            _backends[name] = backend
+    return backend
+
+
+def set_rerank_backend(name: str, backend: RerankBackend):
+    """Registers backend under name (e.g. a fake in tests), replacing any existing one."""
+    with _backends_lock:
+        _backends[name.lower()] = backend
+
+
+def re_rank(query: str, documents: List[str], model: str = "rerank-2", top_k: int = 3, backend: Optional[str] = None):
+    """
+    Reranks a list of documents based on their relevance to a given query.
 
     Parameters:
     - query: The query string.
     - documents: A list of document strings to be reranked.
-    - model: The reranking model (default is "rerank-2").
+    - model: The reranking model (default is "rerank-2"); only used by the voyage backend.
     - top_k: The number of top documents to return (default is 3).
+    - backend: "voyage", "lexical" or "onnx" (default is settings.RERANK_BACKEND).
 
     Returns:
-    - A list of reranked documents with their relevance scores.
+    - A list of (index, document, relevance_score) results, best first.
     """
-    # print("gggg",query, documents)
-    reranking = voyage.rerank(query, documents, model=model, top_k=top_k)
-    return reranking.results[:top_k]
+    return get_rerank_backend(backend).rerank(query, documents, model, top_k)
 
 
-print(re_rank("fruits", ["apple","orange", "carrot", "nail"]))
\ No newline at end of file
+async def re_rank_async(query: str, documents: List[str], model: str = "rerank-2", top_k: int = 3, backend: Optional[str] = None):
+    """
+    Async version of re_rank() for async routes.
+    """
+    return await get_rerank_backend(backend).rerank_async(query, documents, model, top_k)
@@ -1,6 +1,11 @@
+import asyncio
 import io
 import tempfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import chain, islice
 from core.config import settings
+from services.extraction_pool import get_extraction_pool
 import pathlib
 from bs4 import BeautifulSoup
 # Import Google Generative AI library for fallback PDF extraction
@@ -185,3 +190,143 @@ Ensure that you capture the key points, main arguments, and overall purpose of t
 
     else:
         raise ValueError("Unsupported file type")
+
+
+def convert_pdf_pages(pdf_path, start, end):
+    """
+    Converts pages [start, end) (0-based) of the PDF at pdf_path to markdown.
+    Returns a list of (page_number, markdown) with 1-based page numbers.
+    """
+    import pymupdf
+    import pymupdf4llm
+
+    doc = pymupdf.open(pdf_path)
+    try:
+        page_chunks = pymupdf4llm.to_markdown(doc, pages=list(range(start, end)), page_chunks=True, show_progress=False)
+    finally:
+        doc.close()
+    pages = []
+    for offset, page_chunk in enumerate(page_chunks):
+        metadata = page_chunk.get("metadata", {})
+        page_number = metadata.get("page_number", metadata.get("page", start + offset + 1))
+        pages.append((page_number, page_chunk["text"]))
+    return pages
+
+
+def count_pdf_pages(pdf_bytes):
+    import pymupdf
+
+    with pymupdf.open(stream=io.BytesIO(pdf_bytes), filetype="pdf") as doc:
+        return doc.page_count
+
+
+def format_page(page_number, markdown):
+    """Tags a page's markdown with its page number so chunks can be traced back to pages."""
+    return f"<!-- page {page_number} -->\n\n{markdown}"
+
+
+def iter_pdf_pages(pdf_bytes, pages_per_range=None, max_in_flight=None):
+    """
+    Converts a PDF to markdown a range of pages at a time and yields
+    (page_number, markdown) in page order.
+
+    With the extraction pool enabled, up to max_in_flight ranges are
+    converted in parallel across worker processes and the first pages are
+    yielded as soon as their range finishes, while later ranges are still
+    being converted. At most max_in_flight ranges are held in memory at once.
+    """
+    pages_per_range = pages_per_range or settings.PDF_PAGES_PER_RANGE
+    pool = get_extraction_pool()
+    max_in_flight = max_in_flight or settings.PDF_MAX_IN_FLIGHT or (pool.workers if pool else 1)
+
+    page_count = count_pdf_pages(pdf_bytes)
+    ranges = [(start, min(start + pages_per_range, page_count)) for start in range(0, page_count, pages_per_range)]
+
+    # Workers open the PDF from disk instead of receiving a copy of it per range
+    with tempfile.NamedTemporaryFile(suffix=".pdf") as temp_file:
+        temp_file.write(pdf_bytes)
+        temp_file.flush()
+
+        if pool is None:
+            for start, end in ranges:
+                yield from convert_pdf_pages(temp_file.name, start, end)
+            return
+
+        with ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix="pdf-pages") as executor:
+            remaining = iter(ranges)
+            in_flight = deque(
+                executor.submit(pool.convert_pdf_pages, temp_file.name, start, end)
+                for start, end in islice(remaining, max_in_flight)
+            )
+            try:
+                while in_flight:
+                    pages = in_flight.popleft().result()
+                    next_range = next(remaining, None)
+                    if next_range is not None:
+                        in_flight.append(executor.submit(pool.convert_pdf_pages, temp_file.name, *next_range))
+                    yield from pages
+            finally:
+                # Stop queued ranges if the consumer stops early or a range fails
+                for future in in_flight:
+                    future.cancel()
+
+
+def iter_pdf_markdown(pdf_bytes, pages_per_range=None, max_in_flight=None):
+    """Yields page-tagged markdown (see format_page()) for each page of a PDF, in order."""
+    for page_number, markdown in iter_pdf_pages(pdf_bytes, pages_per_range, max_in_flight):
+        yield format_page(page_number, markdown)
+
+
+def iter_text_in_pool(file_type, file_bytes_or_url, timeout=None):
+    """
+    Yields the text extracted by extract_text_in_pool() in pieces whose
+    concatenation is the whole text.
+
+    PDFs with at least PDF_PARALLEL_MIN_PAGES pages are converted page-range
+    parallel with iter_pdf_markdown() and yielded page by page as soon as
+    each page is ready, so chunking can start before the last page is
+    converted. Other documents are yielded as one piece.
+    """
+    pool = get_extraction_pool()
+    if pool is None:
+        yield extract_text(file_type, file_bytes_or_url)
+        return
+
+    if file_type.lower() == "pdf" and settings.PDF_PARALLEL_MIN_PAGES and count_pdf_pages(file_bytes_or_url) >= settings.PDF_PARALLEL_MIN_PAGES:
+        pages = iter_pdf_markdown(file_bytes_or_url)
+        # Scanned PDFs have no text layer; pages are held back until they add up
+        # to 50 words, otherwise extract_text() applies its Gemini fallback
+        held = []
+        words = 0
+        for page in pages:
+            held.append(page)
+            words += len(page.split())
+            if words >= 50:
+                break
+        if words >= 50 or genai is None:
+            for number, page in enumerate(chain(held, pages)):
+                yield f"\n\n{page}" if number else page
+            return
+        pages.close()
+
+    yield pool.extract(file_type, file_bytes_or_url, timeout=timeout)
+
+
+def extract_text_in_pool(file_type, file_bytes_or_url, timeout=None):
+    """
+    Runs extract_text() in the extraction process pool (see
+    services.extraction_pool), or in the calling thread when the pool is
+    disabled with EXTRACTION_WORKERS=0.
+
+    PDFs with at least PDF_PARALLEL_MIN_PAGES pages are converted page-range
+    parallel (see iter_text_in_pool()).
+    """
+    return "".join(iter_text_in_pool(file_type, file_bytes_or_url, timeout))
+
+
+async def extract_text_async(file_type, file_bytes_or_url, timeout=None):
+    """
+    Runs extract_text_in_pool() in an executor so async routes keep serving
+    other requests while a document is converted.
+    """
+    return await asyncio.to_thread(extract_text_in_pool, file_type, file_bytes_or_url, timeout)
@@ -0,0 +1,764 @@
+import json
+import logging
+import os
+import re
+import threading
+import time
+from typing import List, Optional
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+logger = logging.getLogger(__name__)
+
+METRICS = ("cosine", "dot", "l2")
+
+
+def _require_numpy():
+    if np is None:
+        raise RuntimeError("numpy is required for in-process vector search backends")
+
+
+def to_matrix(vectors, dimension: Optional[int] = None):
+    """
+    Converts embeddings (lists, arrays or pgvector text such as "[0.1,0.2]")
+    into a contiguous float32 matrix.
+    """
+    _require_numpy()
+    rows = [json.loads(v) if isinstance(v, str) else v for v in vectors]
+    if not rows:
+        return np.zeros((0, dimension or 0), dtype=np.float32)
+    return np.ascontiguousarray(np.asarray(rows, dtype=np.float32))
+
+
+def normalize_rows(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def distances(matrix, queries, metric: str, matrix_sq_norms=None):
+    """
+    Distance of every row of matrix to every query (shape: queries x rows),
+    with the same conventions as pgvector: cosine distance (<=>), negative
+    inner product (<#>) and Euclidean distance (<->). Lower is closer.
+    For cosine, both inputs must already be unit length.
+    """
+    products = queries @ matrix.T
+    if metric == "cosine":
+        return 1.0 - products
+    if metric == "dot":
+        return -products
+    if matrix_sq_norms is None:
+        matrix_sq_norms = np.einsum("ij,ij->i", matrix, matrix)
+    query_sq_norms = np.einsum("ij,ij->i", queries, queries)[:, None]
+    return np.sqrt(np.maximum(matrix_sq_norms[None, :] - 2.0 * products + query_sq_norms, 0.0))
+
+
+def top_k_rows(dist_row, k: int):
+    """Indices of the k smallest distances, sorted ascending (argpartition + sort of k)."""
+    k = min(k, dist_row.shape[0])
+    if k <= 0:
+        return np.zeros(0, dtype=np.int64)
+    if k < dist_row.shape[0]:
+        candidates = np.argpartition(dist_row, k - 1)[:k]
+    else:
+        candidates = np.arange(dist_row.shape[0])
+    return candidates[np.argsort(dist_row[candidates], kind="stable")]
+
+
+class IVFIndex:
+    """
+    Inverted-file ANN index over a float32 matrix.
+
+    Vectors are clustered with k-means into nlist lists; a query scans only
+    the nprobe lists whose centroids are closest. Until there are enough
+    vectors to train (or after training is invalidated), search is exact.
+    Removal marks rows dead and the matrix is compacted once a quarter of
+    it is dead.
+    """
+
+    extension = "npz"
+
+    def __init__(self, dimension: int, metric: str = "cosine", nlist: Optional[int] = None, nprobe: int = 16, min_train_size: int = 1024):
+        _require_numpy()
+        if metric not in METRICS:
+            raise ValueError(f"Invalid metric {metric!r}. Must be one of {METRICS}.")
+        self.dimension = dimension
+        self.metric = metric
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.min_train_size = min_train_size
+        self._vectors = np.zeros((0, dimension), dtype=np.float32)
+        self._ids = []
+        self._alive = np.zeros(0, dtype=bool)
+        self._row_of = {}
+        self._centroids = None
+        self._assign = None
+        self._trained_size = 0
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._row_of)
+
+    def _prepare(self, vectors):
+        matrix = to_matrix(vectors, self.dimension) if not isinstance(vectors, np.ndarray) else vectors.astype(np.float32, copy=False)
+        if matrix.ndim == 1:
+            matrix = matrix[None, :]
+        if matrix.shape[1] != self.dimension:
+            raise ValueError(f"Expected {self.dimension}-dimensional vectors, got {matrix.shape[1]}")
+        return normalize_rows(matrix) if self.metric == "cosine" else matrix
+
+    def add(self, ids: List[str], vectors):
+        """Adds or replaces vectors by id."""
+        with self._lock:
+            matrix = self._prepare(vectors)
+            self.remove([i for i in ids if i in self._row_of])
+            start = self._vectors.shape[0]
+            self._vectors = np.vstack([self._vectors, matrix])
+            self._alive = np.concatenate([self._alive, np.ones(len(ids), dtype=bool)])
+            for offset, chunk_id in enumerate(ids):
+                self._ids.append(chunk_id)
+                self._row_of[chunk_id] = start + offset
+            if self._centroids is not None:
+                new_assign = self._nearest_centroid(matrix)
+                self._assign = np.concatenate([self._assign, new_assign])
+
+    def remove(self, ids: List[str]):
+        with self._lock:
+            for chunk_id in ids:
+                row = self._row_of.pop(chunk_id, None)
+                if row is not None:
+                    self._alive[row] = False
+            if self._alive.size and (~self._alive).sum() > self._alive.size // 4:
+                self._compact()
+
+    def _compact(self):
+        keep = np.flatnonzero(self._alive)
+        self._vectors = np.ascontiguousarray(self._vectors[keep])
+        self._ids = [self._ids[row] for row in keep]
+        self._alive = np.ones(len(keep), dtype=bool)
+        self._row_of = {chunk_id: row for row, chunk_id in enumerate(self._ids)}
+        if self._assign is not None:
+            self._assign = self._assign[keep]
+
+    def _centroid_distances(self, matrix):
+        # Lists are assigned by angle for cosine and by Euclidean distance otherwise
+        if self.metric == "cosine":
+            return distances(normalize_rows(self._centroids), matrix, "cosine")
+        return distances(self._centroids, matrix, "l2")
+
+    def _nearest_centroid(self, matrix):
+        return np.argmin(self._centroid_distances(matrix), axis=1)
+
+    def train(self, iterations: int = 10, seed: int = 0):
+        """Clusters the live vectors with k-means and assigns every row to a list."""
+        with self._lock:
+            live = np.flatnonzero(self._alive)
+            n = live.size
+            if n == 0:
+                return
+            nlist = self.nlist or max(1, min(4096, int(np.sqrt(n))))
+            nlist = min(nlist, n)
+            rng = np.random.default_rng(seed)
+            data = self._vectors[live]
+            centroids = data[rng.choice(n, nlist, replace=False)].copy()
+            for _ in range(iterations):
+                labels = np.argmin(distances(centroids, data, "l2"), axis=1)
+                sums = np.zeros_like(centroids)
+                np.add.at(sums, labels, data)
+                counts = np.bincount(labels, minlength=nlist)[:, None]
+                filled = counts[:, 0] > 0
+                centroids[filled] = sums[filled] / counts[filled]
+            self._centroids = centroids
+            self._assign = self._nearest_centroid(self._vectors)
+            self._trained_size = n
+
+    def prepare(self):
+        """Called after a bulk build; trains the lists when there is enough data."""
+        if len(self) >= self.min_train_size:
+            self.train()
+
+    def _needs_training(self):
+        n = len(self._row_of)
+        if n < self.min_train_size:
+            return False
+        return self._centroids is None or n >= 2 * self._trained_size
+
+    def search(self, queries, k: int, nprobe: Optional[int] = None):
+        """
+        Returns, for each query, a list of (id, distance) sorted by distance.
+        """
+        with self._lock:
+            if self._needs_training():
+                self.train()
+            queries = self._prepare(queries)
+            results = []
+            live = self._alive
+            for query in queries:
+                if self._centroids is not None and len(self._row_of) >= self.min_train_size:
+                    probe = min(nprobe or self.nprobe, self._centroids.shape[0])
+                    lists = top_k_rows(self._centroid_distances(query[None, :])[0], probe)
+                    rows = np.flatnonzero(live & np.isin(self._assign, lists))
+                else:
+                    rows = np.flatnonzero(live)
+                if rows.size == 0:
+                    results.append([])
+                    continue
+                dist = distances(self._vectors[rows], query[None, :], self.metric)[0]
+                best = top_k_rows(dist, k)
+                results.append([(self._ids[rows[i]], float(dist[i])) for i in best])
+            return results
+
+    def save(self, path: str, signature=None):
+        with self._lock:
+            live = np.flatnonzero(self._alive)
+            payload = {
+                "vectors": self._vectors[live],
+                "ids": np.array([self._ids[row] for row in live], dtype=str),
+                "meta": np.array(json.dumps({
+                    "dimension": self.dimension,
+                    "metric": self.metric,
+                    "nlist": self.nlist,
+                    "nprobe": self.nprobe,
+                    "min_train_size": self.min_train_size,
+                    "trained_size": self._trained_size,
+                    "signature": signature,
+                })),
+            }
+            if self._centroids is not None:
+                payload["centroids"] = self._centroids
+                payload["assign"] = self._assign[live]
+            tmp_path = f"{path}.tmp.npz"
+            np.savez(tmp_path, **payload)
+            os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str):
+        """Loads an index written by save(). Returns (index, signature)."""
+        _require_numpy()
+        with np.load(path, allow_pickle=False) as data:
+            meta = json.loads(str(data["meta"]))
+            index = cls(meta["dimension"], meta["metric"], meta["nlist"], meta["nprobe"], meta["min_train_size"])
+            index._vectors = np.ascontiguousarray(data["vectors"], dtype=np.float32)
+            index._ids = [str(i) for i in data["ids"]]
+            index._alive = np.ones(len(index._ids), dtype=bool)
+            index._row_of = {chunk_id: row for row, chunk_id in enumerate(index._ids)}
+            if "centroids" in data:
+                index._centroids = data["centroids"]
+                index._assign = data["assign"]
+                index._trained_size = meta["trained_size"]
+        return index, meta.get("signature")
+
+
+QUANTIZATIONS = (None, "int8", "binary")
+DEFAULT_RESCORE_FACTORS = {"int8": 4, "binary": 10}
+
+if np is not None and hasattr(np, "bitwise_count"):
+    _popcount = np.bitwise_count
+elif np is not None:
+    _POPCOUNT_TABLE = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+    def _popcount(values):
+        return _POPCOUNT_TABLE[values]
+
+
+def quantize_int8(matrix, scale=None):
+    """Symmetric per-dimension int8 scalar quantization. Returns (codes, scale)."""
+    if scale is None:
+        scale = np.abs(matrix).max(axis=0) / 127.0 if matrix.size else np.ones(matrix.shape[1], dtype=np.float32)
+        scale = np.where(scale == 0, 1.0, scale).astype(np.float32)
+    codes = np.clip(np.rint(matrix / scale), -127, 127).astype(np.int8)
+    return codes, scale
+
+
+def quantize_binary(matrix):
+    """One bit per dimension (sign), packed 8 dimensions per byte."""
+    return np.packbits(matrix > 0, axis=1)
+
+
+class ExactIndex:
+    """
+    Exact top-k over a contiguous float32 matrix.
+
+    save() writes the live vectors to a .npy file (plus a JSON sidecar with
+    the chunk IDs) and re-opens it memory-mapped, so workers on the same
+    host share one copy through the page cache. Writes made after that go
+    to a small heap-allocated delta and dead base rows are masked out until
+    the next save(). Without an index_dir, prepare() folds them in memory.
+
+    With quantization="int8" or "binary" the first pass scans compact codes
+    (4x / 32x smaller) and only the best rescore_factor * k candidates are
+    re-scored against the full-precision rows, which are read from the
+    memory-mapped file on demand.
+    """
+
+    extension = "npy"
+    block_rows = 1024
+
+    def __init__(self, dimension: int, metric: str = "cosine", quantization: Optional[str] = None, rescore_factor: Optional[int] = None):
+        _require_numpy()
+        if metric not in METRICS:
+            raise ValueError(f"Invalid metric {metric!r}. Must be one of {METRICS}.")
+        if quantization not in QUANTIZATIONS:
+            raise ValueError(f"Invalid quantization {quantization!r}. Must be one of {QUANTIZATIONS}.")
+        self.dimension = dimension
+        self.metric = metric
+        self.quantization = quantization
+        self.rescore_factor = rescore_factor or DEFAULT_RESCORE_FACTORS.get(quantization, 1)
+        self._base = np.zeros((0, dimension), dtype=np.float32)
+        self._base_ids = []
+        self._base_row = {}
+        self._base_alive = np.zeros(0, dtype=bool)
+        self._base_sq_norms = None
+        self._codes = None
+        self._scale = None
+        self._delta = np.zeros((0, dimension), dtype=np.float32)
+        self._delta_ids = []
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._base_row) + len(self._delta_ids)
+
+    def _prepare(self, vectors):
+        matrix = to_matrix(vectors, self.dimension) if not isinstance(vectors, np.ndarray) else vectors.astype(np.float32, copy=False)
+        if matrix.ndim == 1:
+            matrix = matrix[None, :]
+        if matrix.shape[1] != self.dimension:
+            raise ValueError(f"Expected {self.dimension}-dimensional vectors, got {matrix.shape[1]}")
+        return normalize_rows(matrix) if self.metric == "cosine" else matrix
+
+    def prepare(self):
+        """Folds the delta into the base rows and builds the quantized codes in memory."""
+        with self._lock:
+            matrix, ids = self._live_rows()
+            self._base = np.ascontiguousarray(matrix)
+            self._base_ids = ids
+            self._base_row = {chunk_id: row for row, chunk_id in enumerate(ids)}
+            self._base_alive = np.ones(len(ids), dtype=bool)
+            self._base_sq_norms = None
+            self._codes, self._scale = self._quantize(self._base)
+            self._delta = np.zeros((0, self.dimension), dtype=np.float32)
+            self._delta_ids = []
+
+    def _live_rows(self):
+        live = np.flatnonzero(self._base_alive)
+        matrix = np.vstack([np.asarray(self._base[live]), self._delta]).astype(np.float32, copy=False)
+        ids = [self._base_ids[row] for row in live] + self._delta_ids
+        return matrix, ids
+
+    def _quantize(self, matrix):
+        """Returns (codes, scale) for the first pass; (None, None) without quantization."""
+        if self.quantization == "int8":
+            return quantize_int8(matrix)
+        if self.quantization == "binary":
+            return quantize_binary(matrix), None
+        return None, None
+
+    def add(self, ids: List[str], vectors):
+        """Adds or replaces vectors by id."""
+        with self._lock:
+            matrix = self._prepare(vectors)
+            self.remove(ids)
+            self._delta = np.vstack([self._delta, matrix])
+            self._delta_ids.extend(ids)
+
+    def remove(self, ids: List[str]):
+        with self._lock:
+            ids = set(ids)
+            for chunk_id in ids:
+                row = self._base_row.pop(chunk_id, None)
+                if row is not None:
+                    self._base_alive[row] = False
+            if any(chunk_id in ids for chunk_id in self._delta_ids):
+                keep = [i for i, chunk_id in enumerate(self._delta_ids) if chunk_id not in ids]
+                self._delta = self._delta[keep]
+                self._delta_ids = [self._delta_ids[i] for i in keep]
+
+    def memory_bytes(self):
+        """Bytes scanned by the first pass (codes when quantized, else full vectors)."""
+        scanned = self._codes if self._codes is not None else self._base
+        return int(scanned.nbytes + self._delta.nbytes)
+
+    def _approximate_distances(self, queries):
+        """First-pass distances over the quantized base rows (queries x rows)."""
+        n = self._codes.shape[0]
+        result = np.empty((queries.shape[0], n), dtype=np.float32)
+        if self.quantization == "binary":
+            query_bits = quantize_binary(queries)
+            for start in range(0, n, self.block_rows):
+                block = np.asarray(self._codes[start:start + self.block_rows])
+                for qi, bits in enumerate(query_bits):
+                    result[qi, start:start + block.shape[0]] = _popcount(block ^ bits).sum(axis=1)
+            return result
+
+        scaled = queries * self._scale
+        if self.metric == "l2" and self._base_sq_norms is None:
+            self._base_sq_norms = np.einsum("ij,ij->i", self._base, self._base)
+        for start in range(0, n, self.block_rows):
+            block = np.asarray(self._codes[start:start + self.block_rows], dtype=np.float32)
+            products = scaled @ block.T
+            end = start + block.shape[0]
+            if self.metric == "cosine":
+                result[:, start:end] = 1.0 - products
+            elif self.metric == "dot":
+                result[:, start:end] = -products
+            else:
+                result[:, start:end] = self._base_sq_norms[None, start:end] - 2.0 * products
+        return result
+
+    def _search_base(self, queries, k):
+        """Per-query (rows, distances) over the base matrix."""
+        if self._base.shape[0] == 0:
+            return [(np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)) for _ in queries]
+
+        if self._codes is None:
+            if self.metric == "l2" and self._base_sq_norms is None:
+                self._base_sq_norms = np.einsum("ij,ij->i", self._base, self._base)
+            dist = distances(self._base, queries, self.metric, self._base_sq_norms)
+            if not self._base_alive.all():
+                dist[:, ~self._base_alive] = np.inf
+            results = []
+            for row in dist:
+                best = top_k_rows(row, k)
+                results.append((best, row[best]))
+            return results
+
+        approx = self._approximate_distances(queries)
+        if not self._base_alive.all():
+            approx[:, ~self._base_alive] = np.inf
+        results = []
+        for query, row in zip(queries, approx):
+            candidates = top_k_rows(row, k * self.rescore_factor)
+            candidates = candidates[np.isfinite(row[candidates])]
+            if candidates.size == 0:
+                results.append((candidates, np.zeros(0, dtype=np.float32)))
+                continue
+            # Re-score candidates at full precision (rows are read from the mmap in sorted order)
+            ordered = np.sort(candidates)
+            exact = distances(np.asarray(self._base[ordered]), query[None, :], self.metric)[0]
+            best = top_k_rows(exact, k)
+            results.append((ordered[best], exact[best]))
+        return results
+
+    def search(self, queries, k: int, nprobe: Optional[int] = None):
+        """
+        Returns, for each query, a list of (id, distance) sorted by distance.
+        All queries are scored with one matrix product per segment.
+        """
+        with self._lock:
+            queries = self._prepare(queries)
+            base_results = self._search_base(queries, k)
+            delta_dist = distances(self._delta, queries, self.metric) if self._delta_ids else None
+            results = []
+            for qi, (rows, base_dist) in enumerate(base_results):
+                ids = [self._base_ids[row] for row in rows]
+                dist = np.asarray(base_dist, dtype=np.float32)
+                if delta_dist is not None:
+                    ids = ids + self._delta_ids
+                    dist = np.concatenate([dist, delta_dist[qi]])
+                best = top_k_rows(dist, k)
+                results.append([(ids[i], float(dist[i])) for i in best if np.isfinite(dist[i])])
+            return results
+
+    @staticmethod
+    def _stem(path):
+        return path[:-len(".npy")]
+
+    def save(self, path: str, signature=None):
+        """Writes the live vectors to path and re-opens them memory-mapped."""
+        with self._lock:
+            if self._codes is not None and not self._delta_ids and self._base_alive.all():
+                # Codes built by prepare() still cover every row
+                matrix, ids = np.asarray(self._base), list(self._base_ids)
+                codes, scale = self._codes, self._scale
+            else:
+                matrix, ids = self._live_rows()
+                codes, scale = self._quantize(matrix)
+            stem = self._stem(path)
+
+            meta = {
+                "dimension": self.dimension,
+                "metric": self.metric,
+                "quantization": self.quantization,
+                "rescore_factor": self.rescore_factor,
+                "signature": signature,
+                "ids": ids,
+            }
+            replacements = [(f"{path}.tmp.npy", path)]
+            np.save(f"{path}.tmp.npy", np.ascontiguousarray(matrix))
+            if codes is not None:
+                if scale is not None:
+                    meta["scale"] = scale.tolist()
+                np.save(f"{stem}.codes.tmp.npy", np.asarray(codes))
+                replacements.append((f"{stem}.codes.tmp.npy", f"{stem}.codes.npy"))
+            with open(f"{stem}.ids.json.tmp", "w", encoding="utf-8") as file:
+                json.dump(meta, file)
+            replacements.append((f"{stem}.ids.json.tmp", f"{stem}.ids.json"))
+            for source, target in replacements:
+                os.replace(source, target)
+
+            self._open(path, meta)
+            self._delta = np.zeros((0, self.dimension), dtype=np.float32)
+            self._delta_ids = []
+
+    def _open(self, path, meta):
+        self._base = np.load(path, mmap_mode="r")
+        self._base_ids = meta["ids"]
+        if self._base.shape[0] != len(self._base_ids):
+            raise ValueError("Vector file and chunk-id sidecar are out of sync")
+        self._base_row = {chunk_id: row for row, chunk_id in enumerate(self._base_ids)}
+        self._base_alive = np.ones(len(self._base_ids), dtype=bool)
+        self._base_sq_norms = None
+        self._codes = None
+        self._scale = None
+        if self.quantization:
+            self._codes = np.load(f"{self._stem(path)}.codes.npy", mmap_mode="r")
+            if self._codes.shape[0] != len(self._base_ids):
+                raise ValueError("Quantized codes and chunk-id sidecar are out of sync")
+            if self.quantization == "int8":
+                self._scale = np.asarray(meta["scale"], dtype=np.float32)
+
+    @classmethod
+    def load(cls, path: str):
+        """Memory-maps an index written by save(). Returns (index, signature)."""
+        _require_numpy()
+        with open(f"{cls._stem(path)}.ids.json", encoding="utf-8") as file:
+            meta = json.load(file)
+        index = cls(meta["dimension"], meta["metric"], meta.get("quantization"), meta.get("rescore_factor"))
+        index._open(path, meta)
+        return index, meta.get("signature")
+
+
+class InMemorySearchBackend:
+    """
+    Keeps one in-process index per corpus and answers similarity queries
+    without touching Postgres.
+
+    source is the DocumentChunkModel: it provides get_corpus_embeddings()
+    to build an index and get_corpus_signature() to detect changes made by
+    other processes. Indexes are persisted under index_dir and reloaded on
+    startup when their signature still matches the database.
+    """
+
+    name = "ivf"
+    index_class = IVFIndex
+
+    def __init__(self, source, metric: str = "cosine", index_dir: Optional[str] = None, refresh_interval: float = 30.0, nprobe: int = 16):
+        _require_numpy()
+        if metric not in METRICS:
+            raise ValueError(f"Invalid metric {metric!r}. Must be one of {METRICS}.")
+        self.source = source
+        self.metric = metric
+        self.index_dir = index_dir
+        self.refresh_interval = refresh_interval
+        self.nprobe = nprobe
+        self._indexes = {}
+        self._checked_at = {}
+        # _lock guards the dicts above; a corpus is loaded/rebuilt under its own lock
+        self._lock = threading.Lock()
+        self._corpus_locks = {}
+        if index_dir:
+            os.makedirs(index_dir, exist_ok=True)
+
+    def _new_index(self, dimension):
+        return IVFIndex(dimension, metric=self.metric, nprobe=self.nprobe)
+
+    def _path(self, corpus_key):
+        safe_key = re.sub(r"[^A-Za-z0-9_.-]", "_", corpus_key)
+        return os.path.join(self.index_dir, f"{safe_key}.{self.name}.{self.index_class.extension}")
+
+    def _load(self, corpus_key, signature):
+        if not self.index_dir or not os.path.exists(self._path(corpus_key)):
+            return None
+        try:
+            index, saved_signature = self.index_class.load(self._path(corpus_key))
+        except Exception as e:
+            logger.warning(f"Failed to load vector index for {corpus_key}: {e}")
+            return None
+        if saved_signature != signature or index.metric != self.metric:
+            logger.info(f"Vector index on disk for {corpus_key} is stale; rebuilding")
+            return None
+        return index
+
+    def _build(self, corpus_key, signature):
+        start = time.time()
+        ids, vectors = self.source.get_corpus_embeddings(corpus_key)
+        matrix = to_matrix(vectors)
+        index = self._new_index(matrix.shape[1] if matrix.size else 0)
+        if ids:
+            index.add(ids, matrix)
+            index.prepare()
+        logger.info(f"Built vector index for {corpus_key}: {len(ids)} vectors in {time.time() - start:.2f}s")
+        if self.index_dir:
+            index.save(self._path(corpus_key), signature)
+        return index
+
+    def _fresh_index(self, corpus_key):
+        entry = self._indexes.get(corpus_key)
+        if entry is not None and time.monotonic() - self._checked_at.get(corpus_key, 0) < self.refresh_interval:
+            return entry[0]
+        return None
+
+    def get_index(self, corpus_key):
+        """
+        Returns the corpus index, loading or rebuilding it when the database
+        changed. Rebuilds hold only that corpus' lock, so searches on other
+        corpora are not blocked.
+        """
+        with self._lock:
+            index = self._fresh_index(corpus_key)
+            if index is not None:
+                return index
+            corpus_lock = self._corpus_locks.setdefault(corpus_key, threading.Lock())
+
+        with corpus_lock:
+            with self._lock:
+                # Another thread may have refreshed it while we waited
+                index = self._fresh_index(corpus_key)
+                if index is not None:
+                    return index
+                entry = self._indexes.get(corpus_key)
+
+            signature = self.source.get_corpus_signature(corpus_key)
+            if entry is not None and entry[1] == signature:
+                with self._lock:
+                    self._checked_at[corpus_key] = time.monotonic()
+                return entry[0]
+
+            loaded = self._load(corpus_key, signature)
+            if loaded is None:
+                loaded = self._build(corpus_key, signature)
+            with self._lock:
+                written = self._indexes.get(corpus_key) is not entry
+                self._indexes[corpus_key] = (loaded, signature)
+                if written:
+                    # Written to while rebuilding: re-check against the database on next use
+                    self._checked_at.pop(corpus_key, None)
+                else:
+                    self._checked_at[corpus_key] = time.monotonic()
+            return loaded
+
+    def search(self, corpus_key: str, query_embeddings, top_k: int, probes: Optional[int] = None):
+        """Returns a list of [(chunkId, distance), ...] per query embedding."""
+        index = self.get_index(corpus_key)
+        if len(index) == 0:
+            return [[] for _ in query_embeddings]
+        return index.search(query_embeddings, top_k, nprobe=probes)
+
+    def cosine_distances(self, query_embedding, vectors):
+        """
+        Cosine distance (pgvector's <=>) of the query to each vector. Search
+        thresholds are cosine distances whatever metric the indexes rank by.
+        """
+        return distances(normalize_rows(to_matrix(vectors)), normalize_rows(to_matrix([query_embedding])), "cosine")[0]
+
+    def _adopt_signature(self, corpus_key, current, signature, previous):
+        """
+        Signature to store after a local write: the post-write signature, unless
+        the index was not at the pre-write one (it missed another write), in
+        which case the old signature is kept and the corpus re-checked on next use.
+        """
+        if signature is None:
+            return current
+        if previous is not None and previous != current:
+            self._checked_at.pop(corpus_key, None)
+            return current
+        return signature
+
+    def upsert(self, corpus_key: str, ids: List[str], vectors, signature=None, previous=None):
+        """
+        Applies a write made through this process to the corpus index, if it
+        is loaded. signature and previous are the corpus signatures just after
+        and before the write.
+        """
+        with self._lock:
+            entry = self._indexes.get(corpus_key)
+            if entry is None:
+                return
+            index, current = entry
+            matrix = to_matrix(vectors)
+            if index.dimension == 0:
+                index = self._new_index(matrix.shape[1])
+            index.add(ids, matrix)
+            self._indexes[corpus_key] = (index, self._adopt_signature(corpus_key, current, signature, previous))
+
+    def remove(self, ids: List[str], signatures=None, previous=None):
+        with self._lock:
+            for corpus_key, (index, current) in list(self._indexes.items()):
+                index.remove(ids)
+                if signatures and corpus_key in signatures:
+                    adopted = self._adopt_signature(corpus_key, current, signatures[corpus_key], (previous or {}).get(corpus_key))
+                    self._indexes[corpus_key] = (index, adopted)
+
+    def save_all(self):
+        """Writes every loaded index to index_dir."""
+        if not self.index_dir:
+            return
+        with self._lock:
+            for corpus_key, (index, signature) in self._indexes.items():
+                index.save(self._path(corpus_key), signature)
+
+
+class ExactSearchBackend(InMemorySearchBackend):
+    """
+    Exact (100% recall) brute-force search for small and medium corpora.
+
+    Each corpus is a memory-mapped .npy matrix plus a chunk-id sidecar in
+    index_dir; the delta of local writes is folded into the file by
+    save_all() or once it reaches max_delta rows (in memory when there is
+    no index_dir).
+    """
+
+    name = "exact"
+    index_class = ExactIndex
+
+    def __init__(self, source, metric: str = "cosine", index_dir: Optional[str] = None, refresh_interval: float = 30.0, max_delta: int = 10_000,
+                 quantization: Optional[str] = None, rescore_factor: Optional[int] = None):
+        super().__init__(source, metric=metric, index_dir=index_dir, refresh_interval=refresh_interval)
+        if quantization not in QUANTIZATIONS:
+            raise ValueError(f"Invalid quantization {quantization!r}. Must be one of {QUANTIZATIONS}.")
+        self.max_delta = max_delta
+        self.quantization = quantization
+        self.rescore_factor = rescore_factor
+
+    def _new_index(self, dimension):
+        return ExactIndex(dimension, metric=self.metric, quantization=self.quantization, rescore_factor=self.rescore_factor)
+
+    def _load(self, corpus_key, signature):
+        index = super()._load(corpus_key, signature)
+        if index is not None and index.quantization != self.quantization:
+            logger.info(f"Vector index on disk for {corpus_key} uses another quantization; rebuilding")
+            return None
+        return index
+
+    def upsert(self, corpus_key: str, ids: List[str], vectors, signature=None, previous=None):
+        super().upsert(corpus_key, ids, vectors, signature, previous)
+        with self._lock:
+            entry = self._indexes.get(corpus_key)
+            if entry is not None and len(entry[0]._delta_ids) >= self.max_delta:
+                if self.index_dir:
+                    entry[0].save(self._path(corpus_key), entry[1])
+                else:
+                    entry[0].prepare()
+
+
+SEARCH_BACKENDS = {
+    "ivf": InMemorySearchBackend,
+    "exact": ExactSearchBackend,
+}
+
+
+def create_search_backend(name: str, source, metric: str = "cosine", index_dir: Optional[str] = None, refresh_interval: float = 30.0, **options):
+    """
+    Returns the in-process search backend called name, or None for "postgres"
+    (similarity search stays in the database). Extra options are passed to
+    the backend (e.g. quantization for "exact").
+    """
+    if not name or name == "postgres":
+        return None
+    if name not in SEARCH_BACKENDS:
+        raise ValueError(f"Unknown search backend {name!r}. Must be one of {('postgres',) + tuple(SEARCH_BACKENDS)}.")
+    return SEARCH_BACKENDS[name](source, metric=metric, index_dir=index_dir, refresh_interval=refresh_interval, **options)